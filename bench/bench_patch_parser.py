@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# SPDX-License-Identifier: BSD-3-Clause
+# Copyright 2024 Loongson
+
+"""
+Compare serial and process-pool parsing of a series in
+patch_parser.get_all_files_from_patches and print the series size from
+which the pool wins on this machine. There is no pool with fewer than 2
+workers, so the default of one worker per CPU needs a multi-core host.
+
+    python3 bench/bench_patch_parser.py --files 20 --lines 400
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'tools'))
+
+import patch_parser
+import synthetic
+
+SERIES_SIZES = [1, 2, 4, 8, 16, 32, 64, 100]
+
+
+def timed(patch_files, max_workers, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        patch_parser.get_all_files_from_patches(patch_files, max_workers=max_workers)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Find the serial/process-pool crossover of patch_parser')
+    parser.add_argument('--files', type=int, default=20, help='changed files per patch')
+    parser.add_argument('--lines', type=int, default=400, help='changed lines per file')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='process pool size')
+    parser.add_argument('--repeat', type=int, default=3, help='best of N runs')
+    args = parser.parse_args()
+
+    if args.workers < 2:
+        # get_all_files_from_patches parses serially with one worker
+        print('no pool with %d worker, no crossover to find: run with --workers 2 or more on a multi-core host'
+              % (args.workers))
+        return
+    if args.workers > (os.cpu_count() or 1):
+        print('warning: %d workers share %d cpu(s), the crossover is timing noise'
+              % (args.workers, os.cpu_count() or 1))
+
+    work_dir = tempfile.mkdtemp(prefix='bench-patch-parser-')
+    try:
+        patch_files = []
+        for i in range(max(SERIES_SIZES)):
+            path = os.path.join(work_dir, '%d.patch' % (i))
+            synthetic.write_patch(path, i, args.files, args.lines)
+            patch_files.append(path)
+
+        # Force the pool whatever the series size
+        patch_parser.PARALLEL_THRESHOLD = 0
+
+        print('cpus: %d, workers: %d, patch: %d files x %d lines'
+              % (os.cpu_count() or 1, args.workers, args.files, args.lines))
+        print('%8s %12s %12s %8s' % ('patches', 'serial(s)', 'pool(s)', 'speedup'))
+        crossover = None
+        for size in SERIES_SIZES:
+            serial = timed(patch_files[:size], 1, args.repeat)
+            pool = timed(patch_files[:size], args.workers, args.repeat)
+            print('%8d %12.4f %12.4f %8.2f' % (size, serial, pool, serial / pool))
+            if crossover is None and pool < serial:
+                crossover = size
+
+        if crossover is None:
+            print('the pool never wins with %d worker(s)' % (args.workers))
+        else:
+            print('crossover: %d patches' % (crossover))
+    finally:
+        shutil.rmtree(work_dir)
+
+
+if __name__ == '__main__':
+    main()
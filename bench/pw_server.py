@@ -0,0 +1,332 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# SPDX-License-Identifier: BSD-3-Clause
+# Copyright 2024 Loongson
+
+"""
+A local stand-in for the REST API of Patchwork, serving recorded or
+synthetic events, series, patches, comments and checks with a configurable
+latency, so that the tools talking to patches.dpdk.org can be measured
+offline. The tools are pointed at it with DPDK_CI_PW_API_URL.
+
+A dataset is {'objects': {path: body}, 'events': [...]}, the paths being
+relative to the API, e.g. 'series/30000/'. The events are filtered by
+category, series, patch, since and before and listed newest first; the
+lists are paginated with the Link header of Patchwork; '<resource>/' lists
+the objects of the resource filtered by their fields, e.g. patches/?msgid=.
+A text body, e.g. the mbox of a series, is served as is.
+The versioned paths of git-pw, /api/1.2/..., are served as /api/..., and
+the mbox of a patch on the web site, /patch/<id>/mbox/, as the text of
+'patches/<id>/mbox/'. The tools download from it with DPDK_CI_PW_URL.
+
+'record' saves the data of real series as a dataset, with their URLs
+rewritten to synthetic.BASE_URL like the synthetic ones.
+
+    python3 bench/pw_server.py serve --series 200 --latency 0.05 --port 8000
+    DPDK_CI_PW_API_URL=http://127.0.0.1:8000/api ./tools/poll_pw.py ...
+    python3 bench/pw_server.py record 30001 30002 -o bench/pw_dataset.json
+    python3 bench/pw_server.py serve --dataset bench/pw_dataset.json
+"""
+
+import argparse
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+import urllib.parse
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'tools'))
+
+import ci_files
+import synthetic
+
+DEFAULT_PAGE_SIZE = 30
+MAX_PAGE_SIZE = 250
+
+# The filters of the events, with the field of the payload they look at
+EVENT_FILTERS = {'series': 'series', 'patch': 'patch', 'cover': 'cover'}
+
+
+def load_dataset(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_dataset(path, dataset):
+    ci_files.save_json(path, dataset, indent=None)
+
+
+class PatchworkHandler(BaseHTTPRequestHandler):
+    server_version = 'PatchworkStandIn/1.0'
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def do_GET(self):
+        server = self.server
+        delay = server.latency + (random.uniform(0, server.jitter) if server.jitter else 0)
+        if delay:
+            time.sleep(delay)
+        with server.lock:
+            server.requests += 1
+
+        url = urllib.parse.urlsplit(self.path)
+        query = urllib.parse.parse_qs(url.query)
+        # The mbox of a patch on the web site, as downloaded with curl
+        match = re.match(r'^/patch/(\d+)/mbox/?$', url.path)
+        if match:
+            body = server.objects.get('patches/%s/mbox/' % (match.group(1)))
+            if body is None:
+                self.send_json(404, {'detail': 'Not found.'})
+            else:
+                self.send_text(body)
+            return
+        # The API version of git-pw, /api/1.2/series/
+        path = re.sub(r'^/api/(?:\d+\.\d+/)?', '', url.path)
+        if path == url.path:
+            self.send_json(404, {'detail': 'Not found.'})
+            return
+        if path and not path.endswith('/'):
+            path += '/'
+
+        if path == 'events/':
+            self.send_list(server.get_events(query), url, query)
+            return
+        body = server.objects.get(path)
+        if body is None and re.match(r'^[a-z]+/$', path):
+            body = server.get_resources(path, query)
+        if body is None:
+            self.send_json(404, {'detail': 'Not found.'})
+        elif isinstance(body, list):
+            self.send_list(body, url, query)
+        elif isinstance(body, str):
+            self.send_text(body)
+        else:
+            self.send_json(200, body)
+
+    def send_list(self, items, url, query):
+        try:
+            page = int(query.get('page', ['1'])[0])
+            per_page = min(int(query.get('per_page', [str(DEFAULT_PAGE_SIZE)])[0]), MAX_PAGE_SIZE)
+        except ValueError:
+            self.send_json(400, {'detail': 'Invalid page.'})
+            return
+        first = (page - 1) * per_page
+        if page < 1 or (page > 1 and first >= len(items)):
+            self.send_json(404, {'detail': 'Invalid page.'})
+            return
+
+        links = []
+        for rel, number in (('next', page + 1), ('prev', page - 1)):
+            if number < 1 or (rel == 'next' and first + per_page >= len(items)):
+                continue
+            params = dict(query, page=[str(number)])
+            links.append('<%s%s?%s>; rel="%s"' % (self.server.url_root, url.path,
+                                                 urllib.parse.urlencode(params, doseq=True), rel))
+        self.send_json(200, items[first:first + per_page], {'Link': ', '.join(links)} if links else None)
+
+    def send_text(self, body):
+        data = body.encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; charset=utf-8')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def send_json(self, status, body, headers=None):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class PatchworkServer(ThreadingHTTPServer):
+    """
+    The stand-in server of a dataset, counting the requests it serves.
+    """
+    daemon_threads = True
+
+    def __init__(self, dataset, host='127.0.0.1', port=0, latency=0.0, jitter=0.0, live=False, verbose=False):
+        super().__init__((host, port), PatchworkHandler)
+        self.url_root = 'http://%s:%d' % (host, self.server_address[1])
+        self.url = self.url_root + '/api'
+        # The URLs in the bodies point to this server
+        dataset = json.loads(json.dumps(dataset).replace(synthetic.BASE_URL, self.url))
+        self.objects = dataset['objects']
+        self.events = sorted(dataset['events'], key=lambda event: (event['date'], event['id']), reverse=True)
+        self.latency = latency
+        self.jitter = jitter
+        self.live = live
+        self.verbose = verbose
+        self.requests = 0
+        self.lock = threading.Lock()
+
+    def get_events(self, query):
+        events = self.events
+        if self.live:
+            # The events of a replay happen as the time goes
+            now = synthetic.format_date(time.time(), precise=True)
+            events = [event for event in events if event['date'] <= now]
+        if 'category' in query:
+            categories = set(query['category'])
+            events = [event for event in events if event['category'] in categories]
+        for name, field in EVENT_FILTERS.items():
+            if name in query:
+                ids = set(query[name])
+                events = [event for event in events
+                          if str((event['payload'].get(field) or {}).get('id')) in ids]
+        # The dates of Patchwork are in UTC, without a timezone, and compare
+        # as strings
+        if 'since' in query:
+            since = query['since'][0]
+            events = [event for event in events if event['date'] >= since]
+        if 'before' in query:
+            before = query['before'][0]
+            events = [event for event in events if event['date'] < before]
+        return events
+
+    def get_resources(self, path, query):
+        pattern = re.compile(r'^%s\d+/$' % (re.escape(path)))
+        resources = [body for key, body in self.objects.items() if pattern.match(key)]
+        if not resources:
+            return None
+        for name, values in query.items():
+            if name in ('page', 'per_page', 'order'):
+                continue
+            resources = [body for body in resources if str(body.get(name)).strip('<>') in
+                         [value.strip('<>') for value in values]]
+        return sorted(resources, key=lambda body: body['id'])
+
+
+def start_server(dataset, latency=0.0, jitter=0.0, port=0, live=False):
+    """
+    Serve a dataset in a background thread, return the server, whose API is
+    at server.url. Stop it with server.shutdown(). When live, the events
+    dated in the future are not served yet.
+    """
+    server = PatchworkServer(dataset, port=port, latency=latency, jitter=jitter, live=live)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+def fetch_all(url):
+    """
+    Return a resource of the real API, all the pages of a list.
+    """
+    items = None
+    while url:
+        with urllib.request.urlopen(url, timeout=60) as response:
+            body = json.load(response)
+            links = response.headers.get('Link', '')
+        if not isinstance(body, list):
+            return body
+        items = (items or []) + body
+        match = re.search(r'<([^>]+)>; rel="next"', links)
+        url = match.group(1) if match else None
+    return items
+
+
+def record_series(api_url, series_ids):
+    """
+    Return the dataset of real series: their patches, checks, comments,
+    cover letters and events.
+    """
+    objects = {}
+    events = {}
+
+    def get(path):
+        objects[path] = fetch_all('%s/%s' % (api_url, path))
+        return objects[path]
+
+    for series_id in series_ids:
+        series = get('series/%s/' % (series_id))
+        for event in fetch_all('%s/events/?series=%s' % (api_url, series_id)):
+            events[event['id']] = event
+        resources = [('patches', patch['id']) for patch in series['patches']]
+        if series.get('cover_letter'):
+            resources.append(('covers', series['cover_letter']['id']))
+        for resource, resource_id in resources:
+            get('%s/%s/' % (resource, resource_id))
+            for comment in get('%s/%s/comments/' % (resource, resource_id)):
+                objects['%s/%s/comments/%s/' % (resource, resource_id, comment['id'])] = comment
+            if resource == 'patches':
+                get('patches/%s/checks/' % (resource_id))
+            for event in fetch_all('%s/events/?%s=%s' % (api_url, resource[:-1], resource_id)):
+                events[event['id']] = event
+        print('recorded series %s' % (series_id), file=sys.stderr)
+
+    dataset = {'objects': objects, 'events': list(events.values())}
+    # The URLs of the real API, with or without its version
+    host = re.escape(urllib.parse.urlsplit(api_url).netloc)
+    return json.loads(re.sub(r'https?://%s/api(?:/\d+\.\d+)?' % (host), synthetic.BASE_URL, json.dumps(dataset)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve a local stand-in of the Patchwork REST API')
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.required = True
+
+    serve_parser = subparsers.add_parser('serve', help='serve a recorded or synthetic dataset')
+    serve_parser.add_argument('--dataset', help='The recorded dataset, default: a synthetic one')
+    serve_parser.add_argument('--series', type=int, default=100, help='The synthetic series, default: 100')
+    serve_parser.add_argument('--patches', type=int, default=8, help='The maximum patches per series, default: 8')
+    serve_parser.add_argument('--comments', type=int, default=100, help='The synthetic comments, default: 100')
+    serve_parser.add_argument('--seed', type=int, default=0, help='The seed of the synthetic dataset')
+    serve_parser.add_argument('--port', type=int, default=8000, help='The port, default: 8000')
+    serve_parser.add_argument('--latency', type=float, default=0.0, help='The delay of every response, in seconds')
+    serve_parser.add_argument('--jitter', type=float, default=0.0, help='A random extra delay up to this many seconds')
+    serve_parser.add_argument('-v', '--verbose', action='store_true', help='Log the requests')
+
+    generate_parser = subparsers.add_parser('generate', help='write a synthetic dataset')
+    generate_parser.add_argument('--series', type=int, default=100, help='The series, default: 100')
+    generate_parser.add_argument('--patches', type=int, default=8, help='The maximum patches per series, default: 8')
+    generate_parser.add_argument('--comments', type=int, default=100, help='The comments, default: 100')
+    generate_parser.add_argument('--seed', type=int, default=0, help='The seed of the dataset')
+    generate_parser.add_argument('-o', '--output', required=True, help='The dataset to write')
+
+    record_parser = subparsers.add_parser('record', help='record real series as a dataset')
+    record_parser.add_argument('series_ids', nargs='+', help='The series to record')
+    record_parser.add_argument('--url', default='https://patches.dpdk.org/api', help='The API to record from')
+    record_parser.add_argument('-o', '--output', required=True, help='The dataset to write')
+
+    args = parser.parse_args()
+
+    if args.command == 'record':
+        try:
+            save_dataset(args.output, record_series(args.url.rstrip('/'), args.series_ids))
+        except (OSError, ValueError, KeyError) as e:
+            print('record: %s' % (e), file=sys.stderr)
+            sys.exit(1)
+        return
+
+    if args.command == 'generate' or not args.dataset:
+        dataset = synthetic.make_dataset(args.series, args.patches, args.comments, seed=args.seed)
+    else:
+        dataset = load_dataset(args.dataset)
+    if args.command == 'generate':
+        save_dataset(args.output, dataset)
+        return
+
+    server = PatchworkServer(dataset, port=args.port, latency=args.latency, jitter=args.jitter,
+                             verbose=args.verbose)
+    print('serving %d objects and %d events at %s' % (len(server.objects), len(server.events), server.url))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
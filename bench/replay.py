@@ -0,0 +1,609 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# SPDX-License-Identifier: BSD-3-Clause
+# Copyright 2024 Loongson
+
+"""
+Replay the history of the CI against the Patchwork stand-in, faster than
+real time and at multiples of the real arrival rate, to find where the
+pipeline stops keeping up.
+
+The series come from data/report_done_pw_series_ids, poll_pw_series_ids
+and base_commits.txt, the recheck requests from recheck_db.txt. Only the
+rechecks are dated, so the arrival date of every series is interpolated
+from the series IDs and the dates of their first recheck. The series of
+the last --days are replayed: their series-completed events and recheck
+comments appear on the stand-in of pw_server.py as the replay goes, at
+--rate times the real rate.
+
+The pipeline runs as in ci_supervisor.py, in one process: a poll_pw.Poller
+queues the series with ci_queue.py, the rechecks are found with
+get_reruns.py, and the workers pop the jobs shortest first. A job runs the
+real test-series.sh, or retest-series.sh -t <n> for a recheck, from a copy
+of tools/ and config/ in a temporary directory: the series is downloaded
+from the stand-in, applied on a local DPDK tree with a MAINTAINERS file
+matching the series, and its reports are rendered and sent. Only the build
+and the tests are stubbed, by bench/stubs/ first in the PATH: meson and
+ninja sleep for the durations of the spans of data/ci_trace.jsonl or
+defaults, and sendmail saves the reports. The series of the range of
+base_commits.txt without a base commit change files missing from the tree
+and fail to apply. The state of the tools, the trees and the reports live
+in the temporary directory, data/ is only read.
+
+The time is compressed: one second of the replay is --compress seconds of
+the CI, the durations, intervals and results being in CI time. The stages
+run for real take their real time, which counts --compress times in the CI
+time, so --compress must stay low enough for them to be short next to the
+stubbed ones. For every rate the report gives the throughput, the backlog
+of the queue, the latency from the arrival of a series or recheck to its
+report, the jobs which failed and the reports sent; the rechecks of a
+series already queued are merged into its job, as in ci_queue.py, so fewer
+jobs may be done than arrived.
+
+The real scripts need what they need on the CI host: jq, wget, curl, git,
+python3.8 and git-pw.
+
+Example usage:
+    python3 bench/replay.py
+    python3 bench/replay.py --days 3 --rates 1 2 5 10 --workers 2
+    python3 bench/replay.py --compress 20 --output /tmp/replay.json --keep
+"""
+
+import argparse
+import contextlib
+import datetime
+import json
+import os
+import random
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+TOOLS_DIR = os.path.join(BENCH_DIR, '..', 'tools')
+CONFIG_DIR = os.path.join(BENCH_DIR, '..', 'config')
+DATA_DIR = os.path.join(BENCH_DIR, '..', 'data')
+STUBS_DIR = os.path.join(BENCH_DIR, 'stubs')
+
+sys.path.insert(0, TOOLS_DIR)
+
+import requests
+
+import ci_queue
+import ci_supervisor
+import ci_trace
+import get_reruns
+import poll_pw
+import pw_server
+import series_queue
+import synthetic
+
+# The stubbed stages of a job, with their duration in seconds without a
+# trace and the variable giving it to the stub
+STAGES = [
+    ('scoped_meson', 30, 'BENCH_SCOPED_MESON_SECONDS'),
+    ('scoped_ninja', 120, 'BENCH_SCOPED_NINJA_SECONDS'),
+    ('meson', 60, 'BENCH_MESON_SECONDS'),
+    ('ninja', 540, 'BENCH_NINJA_SECONDS'),
+    ('test', 480, 'BENCH_TEST_SECONDS'),
+]
+
+# The number of components of the MAINTAINERS file of the DPDK tree
+COMPONENTS = 50
+
+# The configuration of the copy of the CI, loaded last by the scripts
+CI_CONFIG = """export DPDK_CI_PW_API_URL={api_url}
+export DPDK_CI_PW_URL={url}
+export DPDK_CI_PW_HTTP_GET=true
+export DPDK_CI_MAILER={stubs_dir}/sendmail
+export DPDK_CI_MAIL_QUEUE=false
+export DPDK_CI_CCACHE=false
+export DPDK_CI_MIRROR=false
+export DPDK_CI_PROFILE=false
+export DPDK_CI_TRACE_FILE={trace_file}
+export DPDK_CI_METRICS_FILE={data_dir}/ci_metrics.prom
+export DPDK_CI_DPDK_HOME=$BENCH_DPDK_HOME
+"""
+
+# Spans of a stage needed in the trace to use their durations
+MIN_SAMPLES = 5
+
+# The contexts of the recheck requests handled, as recheck.py does
+RECHECK_CONTEXTS = ['loongarch-compilation', 'loongarch-unit-testing']
+
+# Seconds of the CI between two samples of the backlog
+BACKLOG_INTERVAL = 60
+
+# A recheck comes at least this long after its series
+RECHECK_DELAY = 3600
+
+
+def read_lines(path):
+    if not os.path.isfile(path):
+        return []
+    with open(path) as f:
+        return [line.split() for line in f if line.strip()]
+
+
+def load_history(data_dir):
+    """
+    Return the IDs of the series, the recheck requests as (series ID, date)
+    and the series with a base commit.
+    """
+    base_commits = {int(fields[0]) for fields in read_lines(os.path.join(data_dir, 'base_commits.txt'))}
+    series_ids = set(base_commits)
+    for name in ('report_done_pw_series_ids', 'poll_pw_series_ids'):
+        series_ids.update(int(fields[0]) for fields in read_lines(os.path.join(data_dir, name)))
+    rechecks = []
+    for fields in read_lines(os.path.join(data_dir, 'recheck_db.txt')):
+        date = datetime.datetime.strptime(fields[1], poll_pw.DATE_FORMAT)
+        rechecks.append((int(fields[0]), date.replace(tzinfo=datetime.timezone.utc).timestamp()))
+    return sorted(series_ids), rechecks, base_commits
+
+
+def interpolate_dates(series_ids, rechecks):
+    """
+    Return the date of every series, interpolated between the series whose
+    first recheck is dated, extrapolated at the mean rate outside.
+    """
+    first = {}
+    for series_id, date in rechecks:
+        first[series_id] = min(date, first.get(series_id, date))
+    anchors = []
+    for series_id, date in sorted(first.items()):
+        # The series IDs grow with time
+        if not anchors or date > anchors[-1][1]:
+            anchors.append((series_id, date))
+    if len(anchors) < 2:
+        raise ValueError('at least two series with a recheck are needed to date the series')
+
+    slope = (anchors[-1][1] - anchors[0][1]) / (anchors[-1][0] - anchors[0][0])
+    dates = {}
+    i = 0
+    for series_id in series_ids:
+        while i < len(anchors) - 2 and series_id > anchors[i + 1][0]:
+            i += 1
+        (id0, date0), (id1, date1) = anchors[i], anchors[i + 1]
+        if id0 <= series_id <= id1:
+            dates[series_id] = date0 + (series_id - id0) * (date1 - date0) / (id1 - id0)
+        elif series_id < id0:
+            dates[series_id] = date0 + (series_id - id0) * slope
+        else:
+            dates[series_id] = date1 + (series_id - id1) * slope
+    return dates
+
+
+def load_durations(trace_file):
+    """
+    Return the durations of the passed spans of every stage of the trace.
+    """
+    durations = {stage: [] for stage, _, _ in STAGES}
+    if not os.path.isfile(trace_file):
+        return durations
+    with open(trace_file) as f:
+        for line in f:
+            try:
+                span = json.loads(line)
+            except ValueError:
+                continue
+            if span.get('stage') in durations and span.get('outcome') == 'pass':
+                durations[span['stage']].append(span['duration'])
+    return durations
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+class Replay:
+    """
+    One replay of the series of the window at a rate.
+    """
+
+    # The aging of ci_queue.py, in seconds of the CI
+    aging_factor = ci_queue.AGING_FACTOR
+
+    def __init__(self, args, history, rate):
+        series_ids, rechecks, base_commits = history
+        self.args = args
+        self.rate = rate
+        self.compress = args.compress
+        self.rand = random.Random(args.seed)
+        self.durations = load_durations(args.trace)
+        self.work_dir = tempfile.mkdtemp(prefix='replay-')
+
+        dates = interpolate_dates(series_ids, rechecks)
+        end = max(dates.values())
+        self.start = end - args.days * 86400
+        window = [series_id for series_id in series_ids if dates[series_id] >= self.start]
+        # Without a base commit in the range of base_commits.txt, the
+        # series did not apply
+        base_range = (min(base_commits), max(base_commits)) if base_commits else (0, -1)
+        self.apply_failed = {series_id for series_id in window
+                             if base_range[0] <= series_id <= base_range[1] and series_id not in base_commits}
+
+        # Time to start the server, the threads and the trees before the
+        # first arrival
+        self.wall_start = time.time() + 5
+        self.maintainers = os.path.join(self.work_dir, 'MAINTAINERS')
+        directories = synthetic.write_maintainers(self.maintainers, COMPONENTS, seed=args.seed)
+        dataset = synthetic.Dataset(directories, seed=args.seed, precise=True)
+        self.arrivals = {}
+        first_patches = {}
+        for series_id in window:
+            self.arrivals[series_id] = self.get_wall_time(dates[series_id])
+            patches = dataset.add_series(series_id, self.arrivals[series_id], self.rand.randint(1, args.patches),
+                                         new_files=series_id not in self.apply_failed)
+            first_patches[series_id] = patches[0]
+
+        self.recheck_arrivals = {}
+        for series_id, date in sorted(rechecks, key=lambda recheck: recheck[1]):
+            date = max(date, dates.get(series_id, date) + RECHECK_DELAY)
+            if date < self.start or date > end:
+                continue
+            if series_id not in first_patches:
+                # Completed before the window, not tested again
+                patches = dataset.add_series(series_id, self.wall_start - 3600, 1, new_files=True)
+                first_patches[series_id] = patches[0]
+            wall_time = self.get_wall_time(date)
+            dataset.add_comment(first_patches[series_id], wall_time,
+                                'Recheck-request: %s\n' % (', '.join(RECHECK_CONTEXTS)))
+            self.recheck_arrivals.setdefault(series_id, []).append(wall_time)
+        self.last_arrival = max(list(self.arrivals.values()) +
+                                [wall_time for times in self.recheck_arrivals.values() for wall_time in times])
+
+        self.server = pw_server.start_server(dataset.to_dict(), live=True)
+        self.stopping = threading.Event()
+        self.queued = threading.Event()
+        self.lock = threading.Lock()
+        self.busy = 0
+        self.jobs = []
+        self.backlog = []
+        self.retests = {}
+        self.ci_dir = os.path.join(self.work_dir, 'ci')
+        self.mail_dir = os.path.join(self.work_dir, 'mails')
+        self.log_dir = os.path.join(self.work_dir, 'logs')
+        self.setup_ci()
+        self.trees = self.setup_trees()
+        self.setup_tools()
+
+    def get_wall_time(self, date):
+        return self.wall_start + (date - self.start) / self.rate / self.compress
+
+    def get_ci_time(self, wall_time):
+        return (wall_time - self.wall_start) * self.compress
+
+    def sleep(self, seconds):
+        """
+        Sleep for seconds of the CI, return True when the replay stops.
+        """
+        return self.stopping.wait(seconds / self.compress)
+
+    def setup_ci(self):
+        """
+        Copy the tools and their configuration in the temporary directory,
+        so that their data, series and reports are written there, and point
+        them at the stand-in and the stubs.
+        """
+        ignore = shutil.ignore_patterns('__pycache__')
+        shutil.copytree(TOOLS_DIR, os.path.join(self.ci_dir, 'tools'), ignore=ignore)
+        shutil.copytree(CONFIG_DIR, os.path.join(self.ci_dir, 'config'), ignore=ignore)
+        for name in ('data', 'series', 'reports'):
+            os.makedirs(os.path.join(self.ci_dir, name))
+        os.makedirs(self.log_dir)
+        with open(os.path.join(self.ci_dir, '.pw_token.dat'), 'w') as f:
+            f.write('replay\n')
+        with open(os.path.join(self.ci_dir, '.ciconfig'), 'w') as f:
+            f.write(CI_CONFIG.format(api_url=self.server.url, url=self.server.url_root, stubs_dir=STUBS_DIR,
+                                     data_dir=os.path.join(self.ci_dir, 'data'),
+                                     trace_file=os.path.join(self.ci_dir, 'data', 'ci_trace.jsonl')))
+
+    def setup_trees(self):
+        """
+        Return a DPDK tree per worker, cloned from a local origin with the
+        branches of config/repo_branch_v2.cfg and the MAINTAINERS file of the
+        series.
+        """
+        with open(os.path.join(CONFIG_DIR, 'repo_branch_v2.cfg')) as f:
+            branches = sorted(set(json.load(f).values()))
+        seed_dir = os.path.join(self.work_dir, 'seed')
+        origin_dir = os.path.join(self.work_dir, 'origin.git')
+        identity = ['-c', 'user.name=Replay', '-c', 'user.email=replay@example.org']
+
+        def git(*args, cwd=seed_dir):
+            subprocess.run(['git'] + identity + list(args), cwd=cwd, check=True,
+                           stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+        os.makedirs(seed_dir)
+        git('init', '-q')
+        shutil.copy(self.maintainers, os.path.join(seed_dir, 'MAINTAINERS'))
+        with open(os.path.join(seed_dir, 'README'), 'w') as f:
+            f.write('The tree of the replay of bench/replay.py\n')
+        # The unit tests found by test_impact.py
+        os.makedirs(os.path.join(seed_dir, 'app', 'test'))
+        with open(os.path.join(seed_dir, 'app', 'test', 'test_bench.c'), 'w') as f:
+            f.write('REGISTER_FAST_TEST(bench_autotest, true, true, test_bench);\n')
+        git('add', 'MAINTAINERS', 'README', 'app')
+        git('commit', '-q', '-m', 'Replay base')
+        # The branch checked out while the others are replaced
+        git('checkout', '-q', '-b', 'unused')
+        for branch in branches:
+            git('branch', '-f', branch)
+        git('clone', '-q', '--bare', seed_dir, origin_dir, cwd=self.work_dir)
+
+        trees = []
+        for worker in range(self.args.workers):
+            tree = os.path.join(self.work_dir, 'dpdk-%d' % (worker))
+            git('clone', '-q', origin_dir, tree, cwd=self.work_dir)
+            git('config', 'user.name', 'Replay', cwd=tree)
+            git('config', 'user.email', 'replay@example.org', cwd=tree)
+            for branch in branches:
+                git('branch', '-f', branch, 'origin/' + branch, cwd=tree)
+            trees.append(tree)
+        return trees
+
+    def setup_tools(self):
+        """
+        Point the tools run in this process at the stand-in and at the
+        temporary directory.
+        """
+        url = self.server.url
+        for module in (ci_queue, poll_pw, series_queue, get_reruns):
+            module.PW_API_URL = url
+        ci_queue.QUEUE_FILE = os.path.join(self.work_dir, 'ci_queue.json')
+        ci_queue.HISTORY_FILE = os.path.join(self.work_dir, 'ci_job_history.json')
+        ci_queue.LOCK_FILE = os.path.join(self.work_dir, 'ci_queue.lock')
+        ci_queue.RUNNING_FILE = os.path.join(self.work_dir, 'ci_queue.running.json')
+        # The jobs age in the time of the CI
+        ci_queue.AGING_FACTOR = self.aging_factor * self.compress
+        ci_queue.TEST_SERIES = os.path.join(self.ci_dir, 'tools', 'test-series.sh')
+        poll_pw.DATA_DIR = self.work_dir
+        series_queue.SUPERSEDED_FILE = os.path.join(self.work_dir, 'superseded_series.txt')
+        # The spans of the jobs in the time of the CI, apart from the spans
+        # of the scripts in ci/data
+        ci_trace.TRACE_FILE = os.path.join(self.work_dir, 'ci_trace.jsonl')
+
+    def get_duration(self, stage, default):
+        samples = self.durations[stage]
+        if len(samples) >= MIN_SAMPLES:
+            return self.rand.choice(samples)
+        return default * self.rand.lognormvariate(0, 0.25)
+
+    def poll_loop(self):
+        since_file = os.path.join(self.work_dir, 'last.txt')
+        with open(since_file, 'w') as f:
+            f.write(time.strftime(poll_pw.DATE_FORMAT, time.gmtime(self.wall_start)))
+        poller = poll_pw.Poller('series', 'DPDK', since_file, poll_pw.queue_series(False))
+        interval = poll_pw.MIN_INTERVAL
+        while not self.stopping.is_set():
+            try:
+                found = poller.poll()
+            except (ValueError, KeyError, requests.RequestException) as e:
+                print('poll failed: %s' % (e), file=sys.stderr)
+                found = 0
+            if found:
+                self.queued.set()
+                interval = poll_pw.MIN_INTERVAL
+            else:
+                interval = min(interval * 2, poll_pw.MAX_INTERVAL)
+            self.sleep(interval)
+
+    def recheck_loop(self):
+        since = synthetic.format_date(self.wall_start, precise=True)
+        while not self.sleep(ci_supervisor.RECHECK_INTERVAL):
+            processor = get_reruns.RerunProcessor(RECHECK_CONTEXTS, since, True)
+            processor.collection_of_retests = {}
+            try:
+                processor.process_reruns()
+            except (ValueError, KeyError, requests.RequestException) as e:
+                print('recheck failed: %s' % (e), file=sys.stderr)
+                continue
+            if processor.last_comment_timestamp:
+                since = processor.last_comment_timestamp
+            for series_id in processor.collection_of_retests:
+                # Numbered as recheck.py does from recheck_db.txt
+                times = self.retests.get(series_id, 0) + 1
+                command = [os.path.join(self.ci_dir, 'tools', 'retest-series.sh'), '-t', str(times), str(series_id)]
+                if ci_queue.push_job('recheck', str(series_id), command):
+                    self.retests[series_id] = times
+                    self.queued.set()
+
+    def backlog_loop(self):
+        while not self.sleep(BACKLOG_INTERVAL):
+            try:
+                with open(ci_queue.QUEUE_FILE) as f:
+                    depth = len(json.load(f))
+            except (OSError, ValueError):
+                depth = 0
+            self.backlog.append((self.get_ci_time(time.time()), depth))
+
+    def run_job(self, job, worker):
+        """
+        Run the command of a job on the tree of a worker, the stubs sleeping
+        for the stubbed stages; return its exit status.
+        """
+        env = dict(os.environ, PATH=STUBS_DIR + os.pathsep + os.environ.get('PATH', ''),
+                   BENCH_DPDK_HOME=self.trees[worker], BENCH_MAIL_DIR=self.mail_dir)
+        for stage, default, variable in STAGES:
+            env[variable] = '%.3f' % (self.get_duration(stage, default) / self.compress)
+        with open(os.path.join(self.log_dir, '%s.log' % (job['id'])), 'a') as log:
+            p = subprocess.Popen(job['command'], cwd=self.ci_dir, env=env, stdin=subprocess.DEVNULL,
+                                 stdout=log, stderr=subprocess.STDOUT, start_new_session=True)
+            while True:
+                try:
+                    return p.wait(timeout=0.1)
+                except subprocess.TimeoutExpired:
+                    if self.stopping.is_set():
+                        os.killpg(p.pid, signal.SIGKILL)
+
+    def worker_loop(self, worker):
+        while not self.stopping.is_set():
+            self.queued.clear()
+            job = ci_queue.pop_job()
+            if job is None:
+                self.queued.wait(ci_supervisor.QUEUE_CHECK_INTERVAL / self.compress)
+                continue
+            with self.lock:
+                self.busy += 1
+            started = time.time()
+            try:
+                status = self.run_job(job, worker)
+            except OSError as e:
+                print('%s failed: %s' % (job['id'], e), file=sys.stderr)
+                status = 1
+            finished = time.time()
+            ci_queue.finish_job(job, (finished - started) * self.compress, status)
+            with self.lock:
+                self.busy -= 1
+                if not self.stopping.is_set():
+                    self.jobs.append(dict(job, started=started, finished=finished, status=status))
+
+    def is_drained(self):
+        if time.time() < self.last_arrival + 2 * poll_pw.MAX_INTERVAL / self.compress:
+            return False
+        with self.lock:
+            if self.busy:
+                return False
+        return self.get_queue_depth() == 0
+
+    def get_queue_depth(self):
+        try:
+            with open(ci_queue.QUEUE_FILE) as f:
+                return len(json.load(f))
+        except (OSError, ValueError):
+            return 0
+
+    def run(self):
+        threads = [threading.Thread(target=target, daemon=True) for target in
+                   [self.poll_loop, self.recheck_loop, self.backlog_loop]]
+        threads += [threading.Thread(target=self.worker_loop, args=(worker,), daemon=True)
+                    for worker in range(self.args.workers)]
+        for thread in threads:
+            thread.start()
+        deadline = self.last_arrival + self.args.drain_hours * 3600 / self.compress
+        while time.time() < deadline and not self.is_drained():
+            time.sleep(0.1)
+        self.stopping.set()
+        self.queued.set()
+        for thread in threads:
+            thread.join()
+        left = self.get_queue_depth()
+        self.server.shutdown()
+        self.server.server_close()
+        results = self.get_results(left)
+        if self.args.keep:
+            print('replay at %gx kept in %s' % (self.rate, self.work_dir), file=sys.stderr)
+        else:
+            shutil.rmtree(self.work_dir)
+        return results
+
+    def get_results(self, left):
+        latencies = {'series': [], 'recheck': []}
+        waits = []
+        services = []
+        recheck_arrivals = {series_id: list(times) for series_id, times in self.recheck_arrivals.items()}
+        for job in self.jobs:
+            series_id = int(job['series_id'])
+            if job['kind'] == 'series':
+                arrival = self.arrivals.get(series_id, job['enqueued'])
+            else:
+                times = recheck_arrivals.get(series_id) or [job['enqueued']]
+                arrival = times.pop(0)
+            latencies[job['kind']].append((job['finished'] - arrival) * self.compress)
+            waits.append((job['started'] - job['enqueued']) * self.compress)
+            services.append((job['finished'] - job['started']) * self.compress)
+
+        duration = max(self.get_ci_time(max([job['finished'] for job in self.jobs] + [self.last_arrival])), 1)
+        arrivals = len(self.arrivals) + sum(len(times) for times in self.recheck_arrivals.values())
+        depths = [depth for _, depth in self.backlog] or [0]
+        end = self.get_ci_time(self.last_arrival)
+        return {
+            'rate': self.rate,
+            'arrivals': arrivals,
+            'done': len(self.jobs),
+            'left': left,
+            'failed': len([job for job in self.jobs if job['status']]),
+            'reports': len(os.listdir(self.mail_dir)) if os.path.isdir(self.mail_dir) else 0,
+            'offered_per_hour': round(arrivals * 3600 / max(end, 1), 2),
+            'done_per_hour': round(len(self.jobs) * 3600 / duration, 2),
+            'utilization': round(sum(services) / (duration * self.args.workers), 3),
+            'backlog_max': max(depths),
+            'backlog_mean': round(sum(depths) / len(depths), 2),
+            'backlog_at_end': ([depth for when, depth in self.backlog if when <= end] or [0])[-1],
+            'latency': {kind: {'p50': round(percentile(values, 0.5)), 'p90': round(percentile(values, 0.9)),
+                               'max': round(max(values or [0]))} for kind, values in latencies.items()},
+            'wait_p50': round(percentile(waits, 0.5)),
+            'service_p50': round(percentile(services, 0.5)),
+        }
+
+
+def print_results(results):
+    print('%5s %8s %6s %5s %6s %7s %10s %9s %6s %15s %23s %23s' % (
+        'rate', 'arrivals', 'done', 'left', 'failed', 'reports', 'offered/h', 'done/h', 'util', 'backlog max/avg',
+        'series p50/p90/max (h)', 'recheck p50/p90/max (h)'))
+    for result in results:
+        latency = result['latency']
+        print('%4gx %8d %6d %5d %6d %7d %10.2f %9.2f %5.0f%% %8d/%6.1f %7.1f/%7.1f/%7.1f %7.1f/%7.1f/%7.1f' % (
+            result['rate'], result['arrivals'], result['done'], result['left'], result['failed'],
+            result['reports'], result['offered_per_hour'],
+            result['done_per_hour'], 100 * result['utilization'], result['backlog_max'], result['backlog_mean'],
+            latency['series']['p50'] / 3600, latency['series']['p90'] / 3600, latency['series']['max'] / 3600,
+            latency['recheck']['p50'] / 3600, latency['recheck']['p90'] / 3600, latency['recheck']['max'] / 3600))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay the history of the CI at multiples of its arrival rate')
+    parser.add_argument('--data-dir', default=DATA_DIR, help='The directory of the history, default: data')
+    parser.add_argument('--trace', default=os.path.join(DATA_DIR, 'ci_trace.jsonl'),
+                        help='The trace of the stage durations, default: data/ci_trace.jsonl')
+    parser.add_argument('--days', type=float, default=2, help='The days of history replayed, default: 2')
+    parser.add_argument('--rates', type=float, nargs='+', default=[1, 5, 10],
+                        help='The multiples of the arrival rate, default: 1 5 10')
+    parser.add_argument('--compress', type=float, default=100,
+                        help='The seconds of the CI per second of replay, default: 100')
+    parser.add_argument('--workers', type=int, default=1, help='The jobs run at once, default: 1')
+    parser.add_argument('--patches', type=int, default=8, help='The maximum patches per series, default: 8')
+    parser.add_argument('--drain-hours', type=float, default=48,
+                        help='The hours of the CI left to drain the queue after the last arrival, default: 48')
+    parser.add_argument('--seed', type=int, default=0, help='The seed of the durations and the series sizes')
+    parser.add_argument('-o', '--output', help='Also write the results to this JSON file')
+    parser.add_argument('--keep', action='store_true',
+                        help='keep the temporary directory of every replay, with the logs and reports of its jobs')
+    args = parser.parse_args()
+
+    try:
+        history = load_history(args.data_dir)
+    except (OSError, ValueError, IndexError) as e:
+        print('cannot load the history: %s' % (e), file=sys.stderr)
+        sys.exit(1)
+
+    results = []
+    for rate in args.rates:
+        try:
+            replay = Replay(args, history, rate)
+        except ValueError as e:
+            print('replay: %s' % (e), file=sys.stderr)
+            sys.exit(1)
+        print('replaying %d series and %d rechecks at %gx, %.0fs' % (
+            len(replay.arrivals), sum(len(times) for times in replay.recheck_arrivals.values()), rate,
+            replay.last_arrival - replay.wall_start), file=sys.stderr)
+        # The tools print every poll and job
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            results.append(replay.run())
+
+    print_results(results)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=4, sort_keys=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,385 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# SPDX-License-Identifier: BSD-3-Clause
+# Copyright 2024 Loongson
+
+"""
+Run the micro-benchmarks of the hot paths of the tools on synthetic inputs
+of graded sizes, and track their regressions commit by commit.
+
+The benchmarks:
+
+- maintainers_parse: Maintainers() of pw_maintainers_cli on a MAINTAINERS
+  file of that many components,
+- maintainers_get_tree: Maintainers.get_tree() of the files of a diff,
+- find_filenames: Diff.find_filenames() of a diff,
+- rerun_comments: RerunProcessor.process_comment_info() of get_reruns on
+  comment events, against the Patchwork stand-in,
+- series_scan: the series scan of check_test_results, against the stand-in,
+- patch_tagging: PatchTagger.get_tags_for_patches() of patch_parser,
+- parse_testlog: parse_testlog.py --summary --faillogs on a test log.
+
+The network bound ones talk to the stand-in of pw_server.py, answering
+every request after --latency seconds. A benchmark whose tool cannot be
+imported here, e.g. without requests or git-pw, is skipped.
+
+'run' prints the best and median times of every benchmark and size and
+saves them in data/bench/<commit>.json, the commit being suffixed with
+-dirty for a modified tree. 'compare' prints the change between the
+results of two commits, by default the last two saved, and fails when a
+benchmark got slower than the threshold.
+
+Example usage:
+    python3 bench/run_benchmarks.py list
+    python3 bench/run_benchmarks.py run
+    python3 bench/run_benchmarks.py run maintainers_get_tree find_filenames --sizes small medium
+    python3 bench/run_benchmarks.py compare 0b7859b HEAD --threshold 10
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+TOOLS_DIR = os.path.join(BENCH_DIR, '..', 'tools')
+RESULTS_DIR = os.path.join(BENCH_DIR, '..', 'data', 'bench')
+PATCH_PARSER_CONFIG = os.path.join(BENCH_DIR, '..', 'config', 'patch_parser.cfg')
+
+sys.path.insert(0, TOOLS_DIR)
+
+import ci_files
+import pw_server
+import synthetic
+
+# The inputs of every size
+SIZES = {
+    'small': {'components': 40, 'files': 2, 'lines': 20, 'comments': 10, 'series': 10, 'patches': 2,
+              'tests': 50, 'output_lines': 20},
+    'medium': {'components': 250, 'files': 20, 'lines': 100, 'comments': 50, 'series': 50, 'patches': 8,
+               'tests': 300, 'output_lines': 100},
+    'large': {'components': 600, 'files': 100, 'lines': 200, 'comments': 200, 'series': 200, 'patches': 32,
+              'tests': 1500, 'output_lines': 500},
+}
+
+CONTEXTS = ['loongarch-unit-testing', 'iol-unit-testing']
+
+
+class SkipBenchmark(Exception):
+    pass
+
+
+class Context:
+    """
+    The inputs and the stand-in server shared by the benchmarks of a size.
+    """
+
+    def __init__(self, size, work_dir, latency, python2):
+        self.size = size
+        self.params = SIZES[size]
+        self.work_dir = work_dir
+        self.latency = latency
+        self.python2 = python2
+        self.maintainers_file = os.path.join(work_dir, 'MAINTAINERS')
+        self.directories = synthetic.write_maintainers(self.maintainers_file, self.params['components'])
+        self.diff = synthetic.make_diff(synthetic.get_files(self.directories, self.params['files']),
+                                        self.params['lines'])
+        self._server = None
+
+    @property
+    def server(self):
+        if self._server is None:
+            dataset = synthetic.make_dataset(self.params['series'], self.params['patches'], self.params['comments'],
+                                             self.directories)
+            self._server = pw_server.start_server(dataset, latency=self.latency)
+        return self._server
+
+    def close(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+
+
+def import_tool(name):
+    try:
+        return __import__(name)
+    except ImportError as e:
+        raise SkipBenchmark('cannot import %s: %s' % (name, e))
+
+
+def import_maintainers_cli(context):
+    # Read at import time, the file of each size is set on the module
+    os.environ.setdefault('MAINTAINERS_FILE_PATH', context.maintainers_file)
+    module = import_tool('pw_maintainers_cli')
+    module.MAINTAINERS_FILE_PATH = context.maintainers_file
+    return module
+
+
+# A benchmark returns the function of one timed run, called after the
+# untimed setup of the run
+
+def bench_maintainers_parse(context):
+    module = import_maintainers_cli(context)
+    return lambda: (lambda: module.Maintainers())
+
+
+def bench_maintainers_get_tree(context):
+    module = import_maintainers_cli(context)
+    files = module.Diff.find_filenames(context.diff)
+    maintainers = module.Maintainers()
+
+    def setup():
+        # The patterns matched are cached by the instance, every run is cold
+        maintainers.matched = {}
+        return lambda: maintainers.get_tree(files)
+    return setup
+
+
+def bench_find_filenames(context):
+    module = import_maintainers_cli(context)
+    return lambda: (lambda: module.Diff.find_filenames(context.diff))
+
+
+def bench_rerun_comments(context):
+    module = import_tool('get_reruns')
+    server = context.server
+    module.PW_API_URL = server.url
+    events = [event for event in server.events if event['category'] == 'patch-comment-created']
+
+    def setup():
+        processor = module.RerunProcessor(CONTEXTS, '1970-01-01T00:00:00', False)
+        processor.collection_of_retests = {}
+        return lambda: processor.process_comment_info(events)
+    return setup
+
+
+def bench_series_scan(context):
+    module = import_tool('check_test_results')
+    module.PW_API_URL = context.server.url
+
+    def run():
+        with contextlib.redirect_stdout(io.StringIO()):
+            module.get_series_set(module.get_series_ids(3))
+    return lambda: run
+
+
+def bench_patch_tagging(context):
+    module = import_tool('patch_parser')
+    patch_files = []
+    for i in range(context.params['patches']):
+        path = os.path.join(context.work_dir, '%d.patch' % (i))
+        synthetic.write_patch(path, i, context.params['files'], context.params['lines'])
+        patch_files.append(path)
+    return lambda: (lambda: module.PatchTagger(PATCH_PARSER_CONFIG).get_tags_for_patches(patch_files))
+
+
+def bench_parse_testlog(context):
+    json_path, txt_path = synthetic.write_testlog(context.work_dir, context.params['tests'],
+                                                  context.params['output_lines'])
+    # The script runs under Python 2
+    command = [context.python2, os.path.join(TOOLS_DIR, 'parse_testlog.py'), json_path, txt_path,
+               '--summary', '--faillogs']
+    try:
+        proc = subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, universal_newlines=True)
+    except OSError as e:
+        raise SkipBenchmark('cannot run %s: %s' % (context.python2, e))
+    if proc.returncode != 0:
+        lines = proc.stderr.strip().splitlines()
+        raise SkipBenchmark('parse_testlog.py fails with %s: %s' % (context.python2, lines[-1] if lines else ''))
+    return lambda: (lambda: subprocess.run(command, stdout=subprocess.DEVNULL, check=True))
+
+
+BENCHMARKS = {
+    'maintainers_parse': bench_maintainers_parse,
+    'maintainers_get_tree': bench_maintainers_get_tree,
+    'find_filenames': bench_find_filenames,
+    'rerun_comments': bench_rerun_comments,
+    'series_scan': bench_series_scan,
+    'patch_tagging': bench_patch_tagging,
+    'parse_testlog': bench_parse_testlog,
+}
+
+
+def measure(setup, repeat, server):
+    times = []
+    requests = 0
+    for _ in range(repeat):
+        run = setup()
+        served = server.requests if server else 0
+        start = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - start)
+        requests = (server.requests if server else 0) - served
+    return {
+        'best': round(min(times), 6),
+        'median': round(statistics.median(times), 6),
+        'repeat': repeat,
+        'requests': requests,
+    }
+
+
+def run_benchmarks(names, sizes, repeat, latency, python2):
+    results = {}
+    print('%-22s %-7s %12s %12s %9s' % ('benchmark', 'size', 'best(s)', 'median(s)', 'requests'))
+    for size in sizes:
+        work_dir = tempfile.mkdtemp(prefix='bench-%s-' % (size))
+        context = Context(size, work_dir, latency, python2)
+        try:
+            for name in names:
+                try:
+                    setup = BENCHMARKS[name](context)
+                    result = measure(setup, repeat, context._server)
+                except SkipBenchmark as e:
+                    print('%-22s %-7s skipped: %s' % (name, size, e))
+                    continue
+                results['%s/%s' % (name, size)] = result
+                print('%-22s %-7s %12.4f %12.4f %9d' % (name, size, result['best'], result['median'],
+                                                         result['requests']))
+        finally:
+            context.close()
+            shutil.rmtree(work_dir)
+    return results
+
+
+def git(*args):
+    return subprocess.run(['git', '-C', BENCH_DIR] + list(args), stdout=subprocess.PIPE,
+                          universal_newlines=True, check=True).stdout.strip()
+
+
+def get_commit(ref='HEAD'):
+    commit = git('rev-parse', '--short', ref)
+    if ref == 'HEAD' and git('status', '--porcelain', '--untracked-files=no'):
+        commit += '-dirty'
+    return commit
+
+
+def save_results(results, latency):
+    commit = get_commit()
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    path = os.path.join(RESULTS_DIR, commit + '.json')
+    # The benchmarks not run this time are kept
+    previous = load_results(path)['results'] if os.path.isfile(path) else {}
+    previous.update(results)
+    record = {
+        'commit': commit,
+        'subject': git('log', '-1', '--format=%s'),
+        'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'cpus': os.cpu_count(),
+        'latency': latency,
+        'results': previous,
+    }
+    ci_files.save_json(path, record)
+    return path
+
+
+def load_results(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def find_results(ref):
+    """
+    Return the results of a commit, given as a ref or a results file.
+    """
+    if os.path.isfile(ref):
+        return load_results(ref)
+    try:
+        commit = get_commit(ref)
+    except subprocess.CalledProcessError:
+        commit = ref
+    path = os.path.join(RESULTS_DIR, commit + '.json')
+    if not os.path.isfile(path):
+        raise ValueError('no results for %s in %s' % (ref, RESULTS_DIR))
+    return load_results(path)
+
+
+def compare_results(base, head, threshold):
+    """
+    Print the change of the median times and return the regressions.
+    """
+    regressions = []
+    print('%s (%s) -> %s (%s)' % (base['commit'], base['date'], head['commit'], head['date']))
+    print('%-30s %12s %12s %9s' % ('benchmark', 'base(s)', 'head(s)', 'change'))
+    for key in sorted(set(base['results']) & set(head['results'])):
+        before = base['results'][key]['median']
+        after = head['results'][key]['median']
+        change = 100.0 * (after - before) / before if before else 0.0
+        mark = ''
+        if change > threshold:
+            mark = ' REGRESSION'
+            regressions.append(key)
+        print('%-30s %12.4f %12.4f %+8.1f%%%s' % (key, before, after, change, mark))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the micro-benchmarks and track their regressions')
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.required = True
+
+    subparsers.add_parser('list', help='list the benchmarks')
+
+    run_parser = subparsers.add_parser('run', help='run the benchmarks and save their results')
+    run_parser.add_argument('names', nargs='*', help='The benchmarks to run, default: all')
+    run_parser.add_argument('--sizes', nargs='+', choices=list(SIZES), default=list(SIZES),
+                            help='The sizes of the inputs, default: all')
+    run_parser.add_argument('--repeat', type=int, default=5, help='The timed runs per benchmark, default: 5')
+    run_parser.add_argument('--latency', type=float, default=0.005,
+                            help='The latency of the Patchwork stand-in, in seconds, default: 0.005')
+    run_parser.add_argument('--python2', default='python', help='The interpreter of parse_testlog.py')
+    run_parser.add_argument('--no-save', action='store_true', help='Do not save the results')
+
+    compare_parser = subparsers.add_parser('compare', help='compare the results of two commits')
+    compare_parser.add_argument('base', nargs='?', help='The base commit or results file')
+    compare_parser.add_argument('head', nargs='?', help='The head commit or results file')
+    compare_parser.add_argument('--threshold', type=float, default=10.0,
+                                help='The slowdown of a regression, in percent, default: 10')
+
+    args = parser.parse_args()
+
+    if args.command == 'list':
+        for name in BENCHMARKS:
+            print(name)
+        return
+
+    if args.command == 'run':
+        unknown = [name for name in args.names if name not in BENCHMARKS]
+        if unknown:
+            parser.error('unknown benchmark: %s' % (', '.join(unknown)))
+        results = run_benchmarks(args.names or list(BENCHMARKS), args.sizes, args.repeat, args.latency,
+                                 args.python2)
+        if results and not args.no_save:
+            print('results saved in %s' % (save_results(results, args.latency)))
+        return
+
+    try:
+        if args.base and args.head:
+            base, head = find_results(args.base), find_results(args.head)
+        elif args.base:
+            base, head = find_results(args.base), find_results('HEAD')
+        else:
+            names = sorted(os.listdir(RESULTS_DIR) if os.path.isdir(RESULTS_DIR) else [],
+                           key=lambda name: os.path.getmtime(os.path.join(RESULTS_DIR, name)))
+            if len(names) < 2:
+                raise ValueError('less than two results in %s' % (RESULTS_DIR))
+            base, head = [load_results(os.path.join(RESULTS_DIR, name)) for name in names[-2:]]
+    except (OSError, ValueError) as e:
+        print('compare: %s' % (e), file=sys.stderr)
+        sys.exit(1)
+    if compare_results(base, head, args.threshold):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,386 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# SPDX-License-Identifier: BSD-3-Clause
+# Copyright 2024 Loongson
+
+"""
+Synthetic inputs of the benchmarks, generated from a seed so that two runs
+of the suite, on two commits, measure the same work: MAINTAINERS files and
+diffs of graded sizes, patch files, meson test logs and the Patchwork data
+served by pw_server.py.
+
+The URLs of the Patchwork data start with BASE_URL, replaced by the URL of
+the stand-in server when it loads the data. Dataset builds the data of given
+series, e.g. replayed from the history of the CI.
+
+    python3 bench/synthetic.py maintainers --components 250 -o /tmp/MAINTAINERS
+    python3 bench/synthetic.py diff --files 20 --lines 100 -o /tmp/bench.diff
+"""
+
+import argparse
+import email.utils
+import json
+import os
+import random
+import time
+
+BASE_URL = 'http://pw.invalid/api'
+
+# The trees of the MAINTAINERS file, the first one is the main tree
+TREES = [
+    ('Main Branch', 'git://dpdk.org/dpdk'),
+    ('Next-net Tree', 'git://dpdk.org/next/dpdk-next-net'),
+    ('Next-net-intel Tree', 'git://dpdk.org/next/dpdk-next-net-intel'),
+    ('Next-net-mlx Tree', 'git://dpdk.org/next/dpdk-next-net-mlx'),
+    ('Next-virtio Tree', 'git://dpdk.org/next/dpdk-next-virtio'),
+    ('Next-crypto Tree', 'git://dpdk.org/next/dpdk-next-crypto'),
+    ('Next-eventdev Tree', 'git://dpdk.org/next/dpdk-next-eventdev'),
+]
+
+# (section title, directory, section tree, subsection trees) of the
+# components
+SECTIONS = [
+    ('Core Libraries', 'lib', 'git://dpdk.org/dpdk', []),
+    ('Networking Drivers', 'drivers/net', 'git://dpdk.org/next/dpdk-next-net',
+     ['git://dpdk.org/next/dpdk-next-net-intel', 'git://dpdk.org/next/dpdk-next-net-mlx',
+      'git://dpdk.org/next/dpdk-next-virtio']),
+    ('Crypto Drivers', 'drivers/crypto', 'git://dpdk.org/next/dpdk-next-crypto', []),
+    ('Eventdev Drivers', 'drivers/event', 'git://dpdk.org/next/dpdk-next-eventdev', []),
+    ('Common Drivers', 'drivers/common', None, []),
+]
+
+CONTEXTS = ['loongarch-compilation', 'loongarch-unit-testing', 'iol-testing', 'iol-unit-testing',
+            'checkpatch', 'github-robot: build']
+
+DATE_FORMAT = '%Y-%m-%dT%H:%M:%S'
+
+
+def write_maintainers(path, components, seed=0):
+    """
+    Write a MAINTAINERS file in the format of DPDK with about that many
+    components and return their directories.
+    """
+    rand = random.Random(seed)
+    directories = []
+    with open(path, 'w') as f:
+        f.write('DPDK Maintainers\n================\n\n')
+        f.write('General Project Administration\n------------------------------\n\n')
+        for title, url in TREES:
+            f.write('%s\nM: Maintainer %s <%s@example.org>\nT: %s\n\n'
+                    % (title, title.split()[0], title.split()[0].lower(), url))
+        f.write('Documentation (with overlaps)\nF: README\nF: doc/\n\n')
+
+        per_section = max(1, components // len(SECTIONS))
+        for title, directory, section_tree, trees in SECTIONS:
+            f.write('%s\n%s\n' % (title, '-' * len(title)))
+            if section_tree:
+                f.write('T: %s\n' % (section_tree))
+            f.write('\n')
+            for i in range(per_section):
+                name = 'bench%d' % (i)
+                f.write('%s %s\n' % (title.split()[0], name))
+                f.write('M: Developer %d <dev%d@example.org>\n' % (i, i))
+                if trees and rand.random() < 0.3:
+                    f.write('T: %s\n' % (rand.choice(trees)))
+                f.write('F: %s/%s/\n' % (directory, name))
+                f.write('F: doc/guides/%s/%s.rst\n\n' % (directory.split('/')[-1], name))
+                directories.append('%s/%s' % (directory, name))
+    return directories
+
+
+def get_files(directories, files, seed=0):
+    """
+    Return files of the components, with the release notes that have no
+    tree.
+    """
+    rand = random.Random(seed)
+    names = ['doc/guides/rel_notes/release_24_03.rst']
+    while len(names) < files:
+        directory = rand.choice(directories)
+        names.append('%s/%s_%d.c' % (directory, directory.split('/')[-1], rand.randrange(16)))
+    return names[:files]
+
+
+def make_diff(files, lines, new=False):
+    """
+    Return a git diff changing the files, lines lines per file, or adding
+    them when new.
+    """
+    chunks = []
+    for i, name in enumerate(files):
+        chunks.append('diff --git a/%s b/%s\n' % (name, name))
+        if new:
+            chunks.append('new file mode 100644\nindex 0000000..89abcde\n')
+            chunks.append('--- /dev/null\n+++ b/%s\n' % (name))
+            chunks.append('@@ -0,0 +1,%d @@\n' % (lines))
+            for j in range(lines):
+                chunks.append('+\tvalue = new_function_%d(dev, queue, %d);\n' % (i, j))
+            continue
+        chunks.append('index 0123456..89abcde 100644\n')
+        chunks.append('--- a/%s\n+++ b/%s\n' % (name, name))
+        chunks.append('@@ -1,%d +1,%d @@\n' % (lines, lines))
+        for j in range(lines // 2):
+            chunks.append('-\tvalue = old_function_%d(dev, queue, %d);\n' % (i, j))
+        for j in range(lines - lines // 2):
+            chunks.append('+\tvalue = new_function_%d(dev, queue, %d);\n' % (i, j))
+    return ''.join(chunks)
+
+
+def write_patch(path, index, files, lines):
+    """
+    Write a patch file of git format-patch changing files files of
+    lines lines.
+    """
+    names = ['drivers/net/bench/bench_%d_%d.c' % (index, i) for i in range(files)]
+    with open(path, 'w') as f:
+        f.write('From: Bench <bench@example.org>\n')
+        f.write('Subject: [PATCH %d] net/bench: synthetic change\n\n' % (index))
+        f.write('---\n')
+        f.write(make_diff(names, lines))
+        f.write('-- \n2.39.2\n')
+
+
+def write_testlog(directory, tests, output_lines, failures=0.02, seed=0):
+    """
+    Write the testlog.json and testlog.txt of a meson test run and return
+    their paths.
+    """
+    rand = random.Random(seed)
+    json_path = os.path.join(directory, 'testlog.json')
+    txt_path = os.path.join(directory, 'testlog.txt')
+    counts = {'OK': 0, 'FAIL': 0, 'SKIP': 0}
+    with open(json_path, 'w') as f:
+        for i in range(tests):
+            draw = rand.random()
+            if draw < failures:
+                result, returncode = 'FAIL', -6
+            elif draw < 3 * failures:
+                result, returncode = 'SKIP', 77
+            else:
+                result, returncode = 'OK', 0
+            counts[result] += 1
+            stdout = ''.join('EAL: test %d step %d: value 0x%x\n' % (i, j, rand.getrandbits(32))
+                             for j in range(output_lines))
+            f.write(json.dumps({
+                'name': 'DPDK:fast-tests / bench_autotest_%d' % (i),
+                'result': result,
+                'returncode': returncode,
+                'duration': round(rand.uniform(0.01, 30), 2),
+                'stdout': stdout,
+                'stderr': 'EAL: failure in step 3\n' if result == 'FAIL' else '',
+            }) + '\n')
+    with open(txt_path, 'w') as f:
+        f.write('Log of Meson test suite run\n\n')
+        f.write('Ok:                 %d\nExpected Fail:      0\nFail:               %d\n'
+                'Unexpected Pass:    0\nSkipped:            %d\nTimeout:            0\n'
+                % (counts['OK'], counts['FAIL'], counts['SKIP']))
+    return json_path, txt_path
+
+
+def format_date(date, precise=False):
+    """
+    Return a timestamp as a Patchwork date, in UTC, with microseconds if
+    precise.
+    """
+    text = time.strftime(DATE_FORMAT, time.gmtime(date))
+    if precise:
+        text += '.%06d' % (int(date % 1 * 1000000))
+    return text
+
+
+class Dataset:
+    """
+    Patchwork data built series by series: {'objects': {path: body},
+    'events': [...]}, the mbox of a series or a patch being served as
+    text.
+    """
+
+    def __init__(self, directories=None, seed=0, precise=False):
+        self.rand = random.Random(seed)
+        if directories is None:
+            directories = ['drivers/net/bench%d' % (i) for i in range(16)]
+        self.directories = directories
+        self.precise = precise
+        self.project = {'id': 1, 'url': '%s/projects/1/' % (BASE_URL), 'name': 'DPDK', 'link_name': 'dpdk'}
+        self.objects = {}
+        self.events = []
+        self.next_patch_id = 100000
+        self.next_comment_id = 500000
+
+    def add_event(self, category, date, payload):
+        self.events.append({
+            'id': len(self.events) + 1,
+            'category': category,
+            'project': self.project,
+            'date': format_date(date, self.precise),
+            'actor': None,
+            'payload': payload,
+        })
+
+    def add_series(self, series_id, date, patches, name=None, new_files=False):
+        """
+        Add a series of that many patches completed at date and return the
+        IDs of its patches. With new_files, the patches add files of their
+        own, so that they apply on any tree; otherwise they change files
+        which exist in no tree.
+        """
+        rand = self.rand
+        series_url = '%s/series/%d/' % (BASE_URL, series_id)
+        series_ref = {'id': series_id, 'url': series_url, 'name': name or 'bench series %d' % (series_id),
+                      'version': 1}
+        series_patches = []
+        mbox = []
+        for j in range(patches):
+            self.next_patch_id += 1
+            patch_id = self.next_patch_id
+            patch_url = '%s/patches/%d/' % (BASE_URL, patch_id)
+            files = get_files(self.directories, rand.randint(1, 8), seed=patch_id)
+            if new_files:
+                files = ['%s/bench_%d_%d.c' % (os.path.dirname(name), patch_id, k) for k, name in enumerate(files)]
+            diff = make_diff(files, rand.randint(2, 40), new=new_files)
+            series_patches.append({'id': patch_id, 'url': patch_url, 'name': '[%d/%d] bench change' % (j + 1, patches),
+                                   'msgid': '<%d@example.org>' % (patch_id)})
+            self.objects['patches/%d/' % (patch_id)] = {
+                'id': patch_id,
+                'url': patch_url,
+                'project': self.project,
+                'msgid': '<%d@example.org>' % (patch_id),
+                'date': format_date(date + j, self.precise),
+                'name': '[%d] net/bench: synthetic change %d' % (j + 1, patch_id),
+                'state': 'new',
+                'submitter': {'id': 1, 'name': 'Bench', 'email': 'bench@example.org'},
+                'delegate': None,
+                'series': [series_ref],
+                'checks': patch_url + 'checks/',
+                'comments': patch_url + 'comments/',
+                'content': 'Synthetic change %d.' % (patch_id),
+                'diff': diff,
+            }
+            self.objects['patches/%d/checks/' % (patch_id)] = [{
+                'id': patch_id * 10 + k,
+                'url': '%schecks/%d/' % (patch_url, patch_id * 10 + k),
+                'date': format_date(date + 3600 + k * 60, self.precise),
+                'context': context,
+                'state': rand.choice(['success', 'success', 'success', 'warning', 'fail']),
+                'target_url': None,
+                'description': '%s result' % (context),
+            } for k, context in enumerate(CONTEXTS)]
+            self.objects['patches/%d/comments/' % (patch_id)] = []
+            self.objects['patches/%d/mbox/' % (patch_id)] = (
+                'From %d Mon Sep 17 00:00:00 2001\n'
+                'From: Bench <bench@example.org>\n'
+                'Date: %s\n'
+                'Subject: [PATCH %d/%d] net/bench: synthetic change\n'
+                'Message-Id: <%d@example.org>\n'
+                'List-Id: DPDK patches and discussions <dev.dpdk.org>\n'
+                'X-Patchwork-Id: %d\n'
+                '\n'
+                'Synthetic change %d.\n'
+                '---\n%s-- \n2.39.2\n\n' % (patch_id, email.utils.formatdate(date + j), j + 1, patches, patch_id,
+                                             patch_id, patch_id, diff))
+            mbox.append(self.objects['patches/%d/mbox/' % (patch_id)])
+        self.objects['series/%d/' % (series_id)] = dict(series_ref, **{
+            'project': self.project,
+            'date': format_date(date, self.precise),
+            'submitter': {'id': 1, 'name': 'Bench', 'email': 'bench@example.org'},
+            'total': len(series_patches),
+            'received_total': len(series_patches),
+            'received_all': True,
+            'mbox': series_url + 'mbox/',
+            'cover_letter': None,
+            'patches': series_patches,
+        })
+        self.objects['series/%d/mbox/' % (series_id)] = ''.join(mbox)
+        self.add_event('series-completed', date, {'series': series_ref})
+        for patch in series_patches:
+            self.add_event('patch-completed', date, {'patch': patch, 'series': series_ref})
+        return [patch['id'] for patch in series_patches]
+
+    def add_comment(self, patch_id, date, content):
+        self.next_comment_id += 1
+        comment_id = self.next_comment_id
+        comment_url = '%s/patches/%d/comments/%d/' % (BASE_URL, patch_id, comment_id)
+        comment = {
+            'id': comment_id,
+            'url': comment_url,
+            'msgid': '<comment-%d@example.org>' % (comment_id),
+            'date': format_date(date, self.precise),
+            'subject': 'Re: synthetic change',
+            'submitter': {'id': 2, 'name': 'Reviewer', 'email': 'reviewer@example.org'},
+            'content': content,
+        }
+        self.objects[comment_url[len(BASE_URL) + 1:]] = comment
+        self.objects['patches/%d/comments/' % (patch_id)].append(comment)
+        self.add_event('patch-comment-created', date, {
+            'patch': {'id': patch_id, 'url': '%s/patches/%d/' % (BASE_URL, patch_id)},
+            'comment': {'id': comment_id, 'url': comment_url},
+        })
+
+    def to_dict(self):
+        return {'objects': self.objects, 'events': self.events}
+
+
+def make_dataset(series, patches, comments, directories=None, now=None, seed=0):
+    """
+    Return the Patchwork data of that many series of up to that many
+    patches, completed over the day before the last one, with about that
+    many comments, some asking for a recheck.
+    """
+    dataset = Dataset(directories, seed)
+    rand = dataset.rand
+    if now is None:
+        now = time.time()
+    # Old enough for the tools skipping the series of the last hours
+    start = now - 2 * 86400
+    patch_ids = []
+    for i in range(series):
+        date = start + i * 86400.0 / max(series, 1)
+        for patch_id in dataset.add_series(30000 + i, date, rand.randint(1, patches)):
+            patch_ids.append((patch_id, date))
+
+    for i in range(comments if patch_ids else 0):
+        patch_id, date = rand.choice(patch_ids)
+        content = 'Looks good to me.\n'
+        if rand.random() < 0.3:
+            content += 'Recheck-request: %s\n' % (', '.join(rand.sample(CONTEXTS[:4], 2)))
+        dataset.add_comment(patch_id, date + 7200 + i, content)
+    return dataset.to_dict()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Write the synthetic inputs of the benchmarks')
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.required = True
+
+    maintainers_parser = subparsers.add_parser('maintainers', help='write a MAINTAINERS file')
+    maintainers_parser.add_argument('--components', type=int, default=250, help='The number of components')
+    maintainers_parser.add_argument('-o', '--output', required=True, help='The file to write')
+
+    diff_parser = subparsers.add_parser('diff', help='write a diff of the components of a MAINTAINERS file')
+    diff_parser.add_argument('--components', type=int, default=250, help='The number of components')
+    diff_parser.add_argument('--files', type=int, default=20, help='The changed files')
+    diff_parser.add_argument('--lines', type=int, default=100, help='The changed lines per file')
+    diff_parser.add_argument('-o', '--output', required=True, help='The file to write')
+
+    testlog_parser = subparsers.add_parser('testlog', help='write testlog.json and testlog.txt')
+    testlog_parser.add_argument('--tests', type=int, default=300, help='The number of tests')
+    testlog_parser.add_argument('--output-lines', type=int, default=100, help='The output lines per test')
+    testlog_parser.add_argument('-o', '--output', required=True, help='The directory to write the logs in')
+
+    parser.add_argument('--seed', type=int, default=0, help='The seed of the inputs')
+    args = parser.parse_args()
+
+    if args.command == 'maintainers':
+        write_maintainers(args.output, args.components, args.seed)
+    elif args.command == 'diff':
+        directories = write_maintainers(os.devnull, args.components, args.seed)
+        with open(args.output, 'w') as f:
+            f.write(make_diff(get_files(directories, args.files, args.seed), args.lines))
+    else:
+        os.makedirs(args.output, exist_ok=True)
+        write_testlog(args.output, args.tests, args.output_lines, seed=args.seed)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,52 @@
+# SPDX-License-Identifier: BSD-3-Clause
+# Copyright 2024 Loongson
+
+"""
+Fixtures of the unit tests of the Python tools, run with:
+
+    python3 -m pytest tests
+"""
+
+import os
+import sys
+
+import pytest
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [os.path.join(TESTS_DIR, '../tools'), os.path.join(TESTS_DIR, '../bench')]
+
+import ci_queue
+import ci_trace
+import pw_server
+
+
+@pytest.fixture
+def queue_dir(tmp_path, monkeypatch):
+    """
+    Keep the queue of ci_queue.py and the trace in a temporary directory.
+    """
+    monkeypatch.setattr(ci_queue, 'QUEUE_FILE', str(tmp_path / 'ci_queue.json'))
+    monkeypatch.setattr(ci_queue, 'HISTORY_FILE', str(tmp_path / 'ci_job_history.json'))
+    monkeypatch.setattr(ci_queue, 'LOCK_FILE', str(tmp_path / 'ci_queue.lock'))
+    monkeypatch.setattr(ci_queue, 'RUNNING_FILE', str(tmp_path / 'ci_queue.running.json'))
+    monkeypatch.setattr(ci_trace, 'TRACE_FILE', str(tmp_path / 'ci_trace.jsonl'))
+    return tmp_path
+
+
+@pytest.fixture
+def pw_api():
+    """
+    Return a function serving a dataset with the Patchwork stand-in and
+    returning the server, stopped at the end of the test.
+    """
+    servers = []
+
+    def start(dataset, **kwargs):
+        server = pw_server.start_server(dataset, **kwargs)
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,27 @@
+# SPDX-License-Identifier: BSD-3-Clause
+# Copyright 2024 Loongson
+
+import os
+
+import ci_files
+
+
+def test_file_lock_not_blocking(tmp_path):
+    lock_file = str(tmp_path / 'data' / 'test.lock')
+    with ci_files.file_lock(lock_file) as acquired:
+        assert acquired
+        # flock is per open file, a second one conflicts even in a process
+        with ci_files.file_lock(lock_file, blocking=False) as again:
+            assert not again
+    with ci_files.file_lock(lock_file, blocking=False) as acquired:
+        assert acquired
+
+
+def test_save_json_replaces(tmp_path):
+    path = str(tmp_path / 'state.json')
+    assert ci_files.load_json(path, {}) == {}
+    ci_files.save_json(path, {'b': 1, 'a': [2]})
+    ci_files.save_json(path, {'a': 3}, indent=None)
+    with open(path) as f:
+        assert f.read() == '{"a": 3}'
+    assert os.listdir(str(tmp_path)) == ['state.json']
@@ -0,0 +1,80 @@
+# SPDX-License-Identifier: BSD-3-Clause
+# Copyright 2024 Loongson
+
+import time
+
+import pytest
+
+import ci_files
+import ci_queue
+import synthetic
+
+
+def make_job(kind='series', patches=None, files=None, enqueued=0.0):
+    return {'kind': kind, 'patches': patches, 'files': files, 'enqueued': enqueued}
+
+
+def make_history(*samples):
+    return {'series': [{'files': files, 'patches': 1, 'duration': duration} for files, duration in samples]}
+
+
+def test_estimate_cost_without_history():
+    assert ci_queue.estimate_cost(make_job(), {}) == ci_queue.DEFAULT_COST
+    assert ci_queue.estimate_cost(make_job(patches=4, files=10), {}) == (
+        ci_queue.DEFAULT_COST + 4 * ci_queue.COST_PER_PATCH + 10 * ci_queue.COST_PER_FILE)
+
+
+def test_estimate_cost_of_nearest_jobs():
+    history = make_history(*[(files, 100 * files) for files in range(1, 11)])
+    # The NEAREST_JOBS samples closest to 2 files: 1, 2, 3, 4 and 5
+    assert ci_queue.estimate_cost(make_job(files=2), history) == 300
+    # The median without a file count, and the other kinds keep the default
+    assert ci_queue.estimate_cost(make_job(), history) == 600
+    assert ci_queue.estimate_cost(make_job(kind='recheck', files=2), history) == (
+        ci_queue.DEFAULT_COST + 2 * ci_queue.COST_PER_FILE)
+
+
+def test_score_ages():
+    small = make_job(files=0, enqueued=0)
+    large = make_job(files=100, enqueued=0)
+    assert ci_queue.get_score(small, {}, 0) < ci_queue.get_score(large, {}, 0)
+    # Waiting long enough wins over a lower cost
+    now = 100 * ci_queue.COST_PER_FILE / ci_queue.AGING_FACTOR + 10
+    small['enqueued'] = now
+    assert ci_queue.get_score(large, {}, now) < ci_queue.get_score(small, {}, now)
+
+
+def test_pop_shortest_first(queue_dir):
+    ci_queue.push_job('series', '30001', patches=20, files=100)
+    ci_queue.push_job('series', '30002', patches=1, files=1)
+    ci_queue.push_job('recheck', '30001', ['retest-series.sh', '30001'], patches=20, files=100)
+    assert [ci_queue.pop_job()['id'] for _ in range(3)] == ['series-30002', 'series-30001', 'recheck-30001']
+    assert ci_queue.pop_job() is None
+
+
+@pytest.fixture
+def series_api(queue_dir, pw_api, monkeypatch):
+    dataset = synthetic.Dataset()
+    dataset.add_series(30001, time.time() - 60, 3)
+    server = pw_api(dataset.to_dict())
+    monkeypatch.setattr(ci_queue, 'PW_API_URL', server.url)
+    return server
+
+
+def test_push_gets_size_once(series_api):
+    assert ci_queue.push_job('series', '30001')
+    job = ci_files.load_json(ci_queue.QUEUE_FILE, [])[0]
+    assert job['patches'] == 3 and job['files'] > 0
+    requests = series_api.requests
+    assert requests == 2
+    # A duplicate downloads nothing
+    assert not ci_queue.push_job('series', '30001')
+    assert series_api.requests == requests
+
+
+def test_push_reuses_series(series_api):
+    series = ci_queue.requests.get('%s/series/30001/' % (series_api.url)).json()
+    requests = series_api.requests
+    assert ci_queue.push_job('series', '30001', series=series)
+    # Only the mbox
+    assert series_api.requests == requests + 1
@@ -0,0 +1,127 @@
+# SPDX-License-Identifier: BSD-3-Clause
+# Copyright 2024 Loongson
+
+import email.utils
+import time
+
+import pytest
+
+import ci_files
+import ci_queue
+import mail_ingest
+import synthetic
+
+
+def make_mail(msgid, subject, date=None, in_reply_to=None, body='Change.\n'):
+    headers = [
+        'From: Dev <dev@example.org>',
+        'Subject: %s' % (subject),
+        'Message-Id: <%s>' % (msgid),
+        'Date: %s' % (email.utils.formatdate(date if date is not None else time.time())),
+    ]
+    if in_reply_to:
+        headers += ['In-Reply-To: <%s>' % (in_reply_to), 'References: <%s>' % (in_reply_to)]
+    return 'From dev@example.org Mon Jan  1 00:00:00 2024\n%s\n\n%s\n' % ('\n'.join(headers), body)
+
+
+def get_queue():
+    return [job['id'] for job in ci_files.load_json(ci_queue.QUEUE_FILE, [])]
+
+
+@pytest.fixture
+def ingest(tmp_path, queue_dir, pw_api, monkeypatch):
+    """
+    Return an mbox and a function running an ingester of it, against a
+    stand-in serving series 30001 of patches 100001 and 100002.
+    """
+    dataset = synthetic.Dataset()
+    dataset.add_series(30001, time.time() - 60, 2)
+    server = pw_api(dataset.to_dict())
+    monkeypatch.setattr(mail_ingest, 'PW_API_URL', server.url)
+    monkeypatch.setattr(ci_queue, 'PW_API_URL', server.url)
+    monkeypatch.setattr(mail_ingest, 'DATA_DIR', str(tmp_path))
+    monkeypatch.setattr(mail_ingest, 'RECHECK_DB_FILE', str(tmp_path / 'recheck_db.txt'))
+    mbox = tmp_path / 'mbox'
+    mbox.write_text(make_mail('old@example.org', '[PATCH] old change'))
+
+    def process(index_file=str(tmp_path / 'mail_index.json')):
+        ingester = mail_ingest.MailIngester([str(mbox)], index_file)
+        ingester.process()
+        return ingester
+
+    return mbox, process
+
+
+def append(mbox, *mails):
+    with open(str(mbox), 'a') as f:
+        f.write(''.join(mails))
+
+
+def test_first_read_skips_existing_mails(ingest):
+    mbox, process = ingest
+    ingester = process()
+    assert ingester.index['messages'] == {}
+    assert ingester.api_calls == 0
+
+
+def test_series_queued_once(ingest):
+    mbox, process = ingest
+    process()
+    append(mbox, make_mail('100001@example.org', '[PATCH v1 1/2] net/bench: change'),
+           make_mail('100002@example.org', '[PATCH v1 2/2] net/bench: change', in_reply_to='100001@example.org'))
+    process()
+    assert get_queue() == ['series-30001']
+
+    ci_queue.pop_job()
+    ingester = process()
+    assert ingester.api_calls == 0
+    assert get_queue() == []
+
+
+def test_old_mails_ignored(ingest):
+    mbox, process = ingest
+    process()
+    old = time.time() - (mail_ingest.INDEX_DAYS + 1) * 86400
+    append(mbox, make_mail('100001@example.org', '[PATCH v1 1/2] net/bench: change', old),
+           make_mail('100002@example.org', '[PATCH v1 2/2] net/bench: change', old,
+                     in_reply_to='100001@example.org'),
+           make_mail('reply@example.org', 'Re: [PATCH v1 2/2] net/bench: change', old,
+                     in_reply_to='100002@example.org', body='Recheck-request: loongarch-unit-testing\n'))
+    ingester = process()
+    assert ingester.index['messages'] == {}
+    assert get_queue() == []
+
+
+def test_recheck_queued_once(ingest, tmp_path):
+    mbox, process = ingest
+    process()
+    append(mbox, make_mail('reply@example.org', 'Re: [PATCH v1 2/2] net/bench: change',
+                           in_reply_to='100002@example.org', body='Recheck-request: loongarch-unit-testing\n'))
+    ingester = process()
+    assert get_queue() == ['recheck-30001']
+    assert ingester.index['messages']['reply@example.org']['recheck']['done']
+
+    # Read again without the index, the recheck database knows the request
+    ci_queue.pop_job()
+    (tmp_path / 'mail_index.json').unlink()
+    ingester = mail_ingest.MailIngester([str(mbox)], str(tmp_path / 'mail_index.json'))
+    ingester.index['sources'][str(mbox)]['offset'] = 0
+    ingester.process()
+    assert get_queue() == []
+    with open(str(tmp_path / 'recheck_db.txt')) as f:
+        assert len(f.readlines()) == 1
+
+
+def test_unmapped_recheck_retried(ingest, monkeypatch):
+    mbox, process = ingest
+    process()
+    append(mbox, make_mail('reply@example.org', 'Re: [PATCH] unknown', in_reply_to='unknown@example.org',
+                           body='Recheck-request: loongarch-unit-testing\n'))
+    ingester = process()
+    request = ingester.index['messages']['reply@example.org']['recheck']
+    assert not request.get('done')
+    assert not ingester.has_pending()
+
+    monkeypatch.setattr(mail_ingest, 'MAPPING_RETRY', 0)
+    request['retry'] = 0
+    assert ingester.has_pending()
@@ -0,0 +1,129 @@
+# SPDX-License-Identifier: BSD-3-Clause
+# Copyright 2024 Loongson
+
+import smtplib
+
+import pytest
+
+import mail_queue
+
+
+def make_report(pwid, status='SUCCESS', label='loongarch unit testing', desc='Unit Testing PASS'):
+    return ('From: qemudev@loongson.cn\n'
+            'To: test-report@dpdk.org\n'
+            'Subject: |%s| pw%s [PATCH] net/foo: fix bar\n'
+            '\n'
+            'Test-Label: %s\n'
+            'Test-Status: %s\n'
+            'http://dpdk.org/patch/%s\n'
+            '\n'
+            '_%s_\n' % (status, pwid, label, status, pwid, desc)).encode()
+
+
+class Killed(BaseException):
+    pass
+
+
+class FakeSMTP:
+    """
+    Record the mails sent, the sender is killed after kill_after mails.
+    """
+    def __init__(self, kill_after=None):
+        self.mails = []
+        self.kill_after = kill_after
+
+    def sendmail(self, sender, recipients, message):
+        if self.kill_after is not None and len(self.mails) >= self.kill_after:
+            raise Killed()
+        if b'pw100009' in message:
+            raise smtplib.SMTPServerDisconnected('connection lost')
+        self.mails.append(message)
+
+    def quit(self):
+        pass
+
+
+@pytest.fixture
+def sender(tmp_path, monkeypatch):
+    queue = mail_queue.MailQueue(str(tmp_path / 'mail_queue'))
+    sender = mail_queue.MailSender(queue, {'DPDK_CI_MAIL_RATE': '600', 'DPDK_CI_MAIL_BURST': '10'})
+    sender.smtp = FakeSMTP()
+    monkeypatch.setattr(sender, 'connect', lambda: sender.smtp)
+    return sender
+
+
+def test_report_key():
+    assert mail_queue.get_report_key(make_report(100001)) == ['100001', 'loongarch unit testing', 'SUCCESS',
+                                                              'Unit Testing PASS']
+    assert mail_queue.get_report_key(b'Subject: hello\n\nno report\n') is None
+
+
+def test_enqueue_replaces_pending_report(sender):
+    sender.queue.enqueue(make_report(100001))
+    sender.queue.enqueue(make_report(100001))
+    sender.queue.enqueue(make_report(100001, 'FAILURE'))
+    assert len(sender.queue.entries()) == 2
+
+
+def test_sent_report_not_sent_again(sender):
+    sender.queue.enqueue(make_report(100001))
+    assert sender.send_queued() == 1
+    sender.queue.enqueue(make_report(100001))
+    assert sender.send_queued() == 0
+    assert len(sender.smtp.mails) == 1
+    assert sender.queue.entries() == []
+    # The token of the duplicate is given back
+    assert sender.queue.load_state()['bucket']['tokens'] >= 8
+
+
+def test_full_suite_report_after_subset(sender):
+    sender.queue.enqueue(make_report(100001, desc='Unit Testing PASS (affected tests only)'))
+    assert sender.send_queued() == 1
+    sender.queue.enqueue(make_report(100001))
+    assert sender.send_queued() == 1
+    assert [b'(affected tests only)' in mail for mail in sender.smtp.mails] == [True, False]
+
+
+def test_sent_saved_after_each_mail(sender):
+    for pwid in (100001, 100002, 100003):
+        sender.queue.enqueue(make_report(pwid))
+    sender.smtp = FakeSMTP(kill_after=2)
+    with pytest.raises(Killed):
+        sender.send_queued()
+    sent = sender.queue.load_state()['sent']
+    assert sorted(sent) == ['100001 loongarch unit testing SUCCESS Unit Testing PASS',
+                            '100002 loongarch unit testing SUCCESS Unit Testing PASS']
+    assert len(sender.queue.entries()) == 1
+
+
+def test_broken_connection_retried(sender):
+    for pwid in (100001, 100009, 100003):
+        sender.queue.enqueue(make_report(pwid))
+    assert sender.send_queued() == 1
+    assert [entry['attempts'] for entry in sender.queue.entries()] == [1, 1]
+
+
+def test_replaced_entry_not_sent(sender):
+    sender.queue.enqueue(make_report(100001))
+    sender.queue.enqueue(make_report(100002))
+    due = sender.queue.entries()
+    sender.queue.enqueue(make_report(100001))
+    count, unused, broken = sender.send_batch(due, {})
+    assert (count, unused, broken) == (1, 1, False)
+    assert sender.smtp.mails == [make_report(100002)]
+    assert len(sender.queue.entries()) == 1
+
+
+def test_drain_waits_for_rate(sender):
+    sender.burst = 1
+    for pwid in (100001, 100002, 100003):
+        sender.queue.enqueue(make_report(pwid))
+    assert sender.drain() == 3
+    assert sender.queue.entries() == []
+
+
+def test_watch_drains_when_stopped(sender):
+    sender.queue.enqueue(make_report(100001))
+    sender.stop()
+    sender.watch()
+    assert len(sender.smtp.mails) == 1
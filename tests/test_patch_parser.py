@@ -0,0 +1,68 @@
+# SPDX-License-Identifier: BSD-3-Clause
+# Copyright 2024 Loongson
+
+import os
+
+import pytest
+
+import patch_parser
+
+CONFIG_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '../config/patch_parser.cfg')
+
+
+@pytest.fixture(scope='module')
+def tagger():
+    return patch_parser.PatchTagger(CONFIG_FILE)
+
+
+@pytest.mark.parametrize('path, tags', [
+    ('buildtools/pmdinfogen.py', ['core']),
+    ('drivers/net/ixgbe/ixgbe_rxtx.c', ['core', 'driver']),
+    ('lib/eal/common/eal_common_options.c', ['core']),
+    ('kernel/linux/kni/kni_misc.c', ['core']),
+    ('meson_options.txt', ['core']),
+    ('app/test-pmd/testpmd.c', ['application']),
+    ('examples/l3fwd/main.c', ['application']),
+    ('doc/guides/rel_notes/release_24_03.rst', ['documentation']),
+    ('license/bsd-3-clause.txt', ['documentation']),
+    ('VERSION', ['documentation']),
+    ('MAINTAINERS', []),
+    ('devtools/checkpatches.sh', []),
+])
+def test_tags_of_tree_paths(tagger, path, tags):
+    assert tagger.get_tags_for_files([path]) == tags
+
+
+def test_whole_components():
+    trie = patch_parser.PathTagTrie({'drivers': ['driver'], 'lib/eal': ['eal']})
+    assert trie.get_tags('drivers/net/foo.c') == {'driver'}
+    assert trie.get_tags('driversX/foo.c') == set()
+    assert trie.get_tags('lib/ealx/foo.c') == set()
+    assert trie.get_tags('lib/eal/foo.c') == {'eal'}
+
+
+def test_longest_match():
+    trie = patch_parser.PathTagTrie({'app': ['none'], 'app/test': ['mapped'], 'app/test/test.c': ['full']})
+    assert trie.get_longest_match_tags('app/test-pmd/testpmd.c') == ['none']
+    assert trie.get_longest_match_tags('app/test/test_ring.c') == ['mapped']
+    assert trie.get_longest_match_tags('app/test/test.c') == ['full']
+    assert trie.get_longest_match_tags('lib/ring/rte_ring.c') is None
+
+
+def test_trie_built_once_per_config():
+    dir_attrs = {'lib': ['core'], 'doc': ['documentation']}
+    assert patch_parser.get_trie(dir_attrs) is patch_parser.get_trie(dict(dir_attrs))
+    assert patch_parser.get_tags_for_patches({'lib/a.c', 'doc/b.rst'}, dir_attrs) == {'core', 'documentation'}
+
+
+def test_changed_files_of_patch(tmp_path):
+    patch = tmp_path / '1.patch'
+    patch.write_text('Subject: [PATCH] change\n\n---\n'
+                     'diff --git a/buildtools/x.py b/buildtools/x.py\nindex 1..2 100644\n'
+                     '--- a/buildtools/x.py\n+++ b/buildtools/x.py\n@@ -1 +1 @@\n-a\n+b\n'
+                     'diff --git a/lib/new.c b/lib/new.c\nnew file mode 100644\nindex 0..1\n'
+                     '--- /dev/null\n+++ b/lib/new.c\n@@ -0,0 +1 @@\n+a\n'
+                     'diff --git a/doc/old.rst b/doc/old.rst\ndeleted file mode 100644\nindex 1..0\n'
+                     '--- a/doc/old.rst\n+++ /dev/null\n@@ -1 +0,0 @@\n-a\n')
+    assert sorted(patch_parser.get_changed_files_in_patch(str(patch))) == \
+        ['buildtools/x.py', 'doc/old.rst', 'lib/new.c']
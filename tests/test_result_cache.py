@@ -0,0 +1,60 @@
+# SPDX-License-Identifier: BSD-3-Clause
+# Copyright 2024 Loongson
+
+import result_cache
+
+HEADER = b'''From: Dev <dev@example.org>
+Subject: [PATCH] net/bench: change
+
+Commit log.
+
+Signed-off-by: Dev <dev@example.org>
+---
+ drivers/net/bench/bench.c | 3 +--
+ 1 file changed, 1 insertion(+), 2 deletions(-)
+
+'''
+
+DIFF = b'''diff --git a/drivers/net/bench/bench.c b/drivers/net/bench/bench.c
+index 0123456..89abcde 100644
+--- a/drivers/net/bench/bench.c
++++ b/drivers/net/bench/bench.c
+@@ -1,4 +1,3 @@
+ int a;
+-- 
+-int b;
++int c;
+ int d;
+'''
+
+
+def make_patch(header=HEADER, diff=DIFF, index=b'0123456..89abcde', signature=b'2.39.2'):
+    return header + diff.replace(b'0123456..89abcde', index) + b'-- \n' + signature + b'\n'
+
+
+def test_header_index_and_signature_ignored():
+    key = result_cache.normalize_diff(make_patch())
+    assert key == result_cache.normalize_diff(make_patch(header=HEADER.replace(b'Commit log', b'New log'),
+                                                         index=b'1111111..2222222', signature=b'2.43.0'))
+    assert b'Commit log' not in key
+    assert b'index ' not in key
+    assert b'2.39.2' not in key
+
+
+def test_removed_line_like_signature_kept():
+    key = result_cache.normalize_diff(make_patch())
+    assert key.endswith(b'+int c;\n int d;\n')
+    assert key != result_cache.normalize_diff(make_patch(diff=DIFF.replace(b'+int c;', b'+int e;')))
+
+
+def test_hunk_counts():
+    diff = (b'diff --git a/f b/f\n--- a/f\n+++ b/f\n@@ -1 +1 @@\n-x\n+y\n'
+            b'diff --git a/g b/g\nnew file mode 100644\n--- /dev/null\n+++ b/g\n@@ -0,0 +1,2 @@\n+-- \n+z\n')
+    key = result_cache.normalize_diff(make_patch(diff=diff))
+    assert key.endswith(b'+--\n+z\n')
+
+
+def test_stripped_context_line():
+    diff = DIFF.replace(b'\n int d;\n', b'\n\n')
+    key = result_cache.normalize_diff(make_patch(diff=diff) + b'trailer\n')
+    assert b'trailer' not in key
@@ -0,0 +1,70 @@
+# SPDX-License-Identifier: BSD-3-Clause
+# Copyright 2024 Loongson
+
+import ci_files
+import ci_queue
+import series_queue
+
+
+def make_series(name, version=1, email='Dev@example.org'):
+    return {'name': name, 'version': version, 'submitter': {'email': email}}
+
+
+def push(series_id, series, **kwargs):
+    group = series_queue.get_series_group(series)
+    return ci_queue.push_job('series', series_id, patches=1, files=1, group=group,
+                             version=series.get('version'), **kwargs)
+
+
+def get_queue():
+    return {job['series_id']: job for job in ci_files.load_json(ci_queue.QUEUE_FILE, [])}
+
+
+def test_subject_stem():
+    assert series_queue.get_subject_stem('[v3,1/2] net/foo: fix bar.') == 'net/foo: fix bar'
+    assert series_queue.get_subject_stem('[PATCH v2] [RESEND]  Net/Foo:  fix') == 'net/foo: fix'
+
+
+def test_find_superseded_in_batch():
+    superseded = series_queue.find_superseded({
+        '30001': make_series('[v1] net/foo: fix bar'),
+        '30002': make_series('[v2] net/foo: fix bar', 2, 'dev@example.org'),
+        '30003': make_series('[v1] net/foo: fix bar', email='other@example.org'),
+        '30004': make_series('[RESEND,v2] net/foo: fix bar', 2),
+        '30005': None,
+    })
+    assert superseded == {'30001': '30004', '30002': '30004'}
+
+
+def test_find_superseded_by_version_not_id():
+    superseded = series_queue.find_superseded({
+        '30001': make_series('[v3] net/foo: fix bar', 3),
+        '30002': make_series('[v2] net/foo: fix bar', 2),
+    })
+    assert superseded == {'30002': '30001'}
+
+
+def test_supersede_queued_drops_older(queue_dir):
+    push('30001', make_series('[v1] net/foo: fix bar'))
+    push('30002', make_series('[v1] net/baz: other'))
+    push('30003', make_series('[v1] net/foo: fix bar', email='other@example.org'))
+    superseded = series_queue.supersede_queued('30010', make_series('[v2] net/foo: fix bar', 2))
+    assert superseded == {'30001': '30010'}
+    assert sorted(get_queue()) == ['30002', '30003']
+
+
+def test_supersede_queued_defers_older(queue_dir):
+    push('30001', make_series('[v1] net/foo: fix bar'))
+    push('30002', make_series('[v1] net/baz: other'))
+    superseded = series_queue.supersede_queued('30010', make_series('[v2] net/foo: fix bar', 2), defer=True)
+    assert superseded == {'30001': '30010'}
+    assert get_queue()['30001']['superseded_by'] == '30010'
+    push('30010', make_series('[v2] net/foo: fix bar', 2))
+    assert [ci_queue.pop_job()['series_id'] for _ in range(3)] == ['30002', '30010', '30001']
+
+
+def test_supersede_queued_keeps_newer(queue_dir):
+    push('30005', make_series('[v3] net/foo: fix bar', 3))
+    superseded = series_queue.supersede_queued('30010', make_series('[v2] net/foo: fix bar', 2))
+    assert superseded == {'30010': '30005'}
+    assert sorted(get_queue()) == ['30005']
@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# SPDX-License-Identifier: BSD-3-Clause
+# Copyright 2024 Loongson
+
+"""
+Print the part of a failed meson or ninja build log which explains the
+failure, for the compilation reports.
+
+The log is memory mapped and searched with byte regexes, so the time taken
+does not depend on the number of lines before the failure. For ninja, the
+first FAILED: blocks are printed with the compiler diagnostics grouped by
+translation unit; a diagnostic already printed for another unit, e.g. an
+error in a common header, is only counted. For meson, the ERROR lines are
+printed with the last '--- stderr ---' sections before them, the first ones
+coming from the normal failures of the configuration checks. The excerpt is
+bounded in blocks, lines and line length.
+
+Example usage:
+    ./build_log_excerpt.py ninja build/ninja-log.txt
+    ./build_log_excerpt.py meson build/meson-logs/meson-log.txt --max-blocks 3
+"""
+
+import argparse
+import mmap
+import re
+import sys
+from typing import List, Optional, Tuple
+
+import ci_profile
+
+MAX_BLOCKS = 5
+MAX_LINES = 300
+MAX_BLOCK_LINES = 100
+MAX_LINE_LENGTH = 500
+
+_failed_regex = re.compile(rb'^FAILED: (.*?)\r?$', re.MULTILINE)
+# The first line after a failed ninja edge: the next edge, another
+# failure or the end of the build
+_ninja_end_regex = re.compile(rb'^(?:\[\d+/\d+\] |FAILED: |ninja: )', re.MULTILINE)
+_ninja_stopped_regex = re.compile(rb'^ninja: build stopped: .*$', re.MULTILINE)
+_stderr_regex = re.compile(rb'^--- stderr ---\r?$', re.MULTILINE)
+_meson_section_end_regex = re.compile(rb'^(?:--- stdout ---|Running command: |Command line: |-{5,})', re.MULTILINE)
+_meson_error_regex = re.compile(rb'^.*\bERROR: .*$', re.MULTILINE)
+
+_diagnostic_regex = re.compile(r'^(\S+?):\d+(?::\d+)?: (?:fatal error|error|warning|note): ')
+_context_regex = re.compile(r'^(?:In file included from |\s+from |(\S+?): (?:In|At) )')
+_include_regex = re.compile(r'^(?:In file included from |\s+from )')
+_source_regex = re.compile(r'\s-c\s+(\S+)')
+
+
+class Excerpt:
+    """
+    The lines printed so far, up to the line limit.
+    """
+
+    def __init__(self, max_lines: int):
+        self.max_lines = max_lines
+        self.lines: List[str] = []
+        self.dropped = 0
+
+    def add(self, line: str) -> None:
+        if len(self.lines) >= self.max_lines:
+            self.dropped += 1
+            return
+        if len(line) > MAX_LINE_LENGTH:
+            line = line[:MAX_LINE_LENGTH] + ' [...]'
+        self.lines.append(line)
+
+    def __str__(self) -> str:
+        lines = self.lines
+        if self.dropped:
+            lines = lines + ['[... %d more lines]' % (self.dropped)]
+        return '\n'.join(lines)
+
+
+def decode_lines(data: bytes) -> List[str]:
+    return data.decode('utf-8', errors='replace').splitlines()
+
+
+def split_diagnostics(lines: List[str]) -> Tuple[List[str], List[List[str]]]:
+    """
+    Split the output of a compiler into the lines before the first
+    diagnostic and the diagnostics, each with its context and its source
+    excerpt.
+    """
+    head: List[str] = []
+    chunks: List[List[str]] = []
+    context: List[str] = []
+    for line in lines:
+        if _context_regex.match(line):
+            context.append(line)
+        elif _diagnostic_regex.match(line):
+            chunks.append(context + [line])
+            context = []
+        elif context:
+            context.append(line)
+        elif chunks:
+            chunks[-1].append(line)
+        else:
+            head.append(line)
+    if context:
+        chunks.append(context)
+    return head, chunks
+
+
+def get_translation_unit(command: str, chunks: List[List[str]]) -> Optional[str]:
+    match = _source_regex.search(command)
+    if match:
+        return match.group(1)
+    for chunk in chunks:
+        for line in chunk:
+            match = _diagnostic_regex.match(line)
+            if match:
+                return match.group(1)
+    return None
+
+
+def excerpt_ninja(data, max_blocks: int, max_lines: int) -> str:
+    excerpt = Excerpt(max_lines)
+    seen = set()
+    blocks = 0
+    for match in _failed_regex.finditer(data):
+        blocks += 1
+        if blocks > max_blocks:
+            continue
+        end = _ninja_end_regex.search(data, match.end() + 1)
+        lines = decode_lines(data[match.end() + 1:end.start() if end else len(data)])[:MAX_BLOCK_LINES]
+        command = lines[0] if lines else ''
+        head, chunks = split_diagnostics(lines[1:])
+        unit = get_translation_unit(command, chunks)
+
+        excerpt.add('FAILED: %s' % (match.group(1).decode('utf-8', errors='replace')))
+        if unit:
+            excerpt.add('Translation unit: %s' % (unit))
+        excerpt.add(command)
+        for line in head:
+            excerpt.add(line)
+        repeated = 0
+        for chunk in chunks:
+            # Without the include chain, which depends on the unit
+            key = '\n'.join(line for line in chunk if not _include_regex.match(line))
+            if key in seen:
+                repeated += 1
+                continue
+            seen.add(key)
+            for line in chunk:
+                excerpt.add(line)
+        if repeated:
+            excerpt.add('[%d diagnostic(s) already shown above]' % (repeated))
+        excerpt.add('')
+
+    if blocks > max_blocks:
+        excerpt.add('[... %d more FAILED blocks]' % (blocks - max_blocks))
+    stopped = _ninja_stopped_regex.search(data)
+    if stopped:
+        excerpt.add(stopped.group(0).decode('utf-8', errors='replace'))
+    return str(excerpt)
+
+
+def excerpt_meson(data, max_blocks: int, max_lines: int) -> str:
+    excerpt = Excerpt(max_lines)
+    errors = [match for match in _meson_error_regex.finditer(data)]
+    limit = errors[0].start() if errors else len(data)
+
+    sections = []
+    for match in _stderr_regex.finditer(data, 0, limit):
+        end = _meson_section_end_regex.search(data, match.end() + 1, limit)
+        lines = decode_lines(data[match.end() + 1:end.start() if end else limit])
+        lines = [line for line in lines if line.strip()][:MAX_BLOCK_LINES]
+        if lines:
+            sections.append(lines)
+
+    seen = set()
+    shown = []
+    for lines in reversed(sections):
+        key = '\n'.join(lines)
+        if key in seen:
+            continue
+        seen.add(key)
+        shown.append(lines)
+        if len(shown) >= max_blocks:
+            break
+    if len(sections) > len(shown):
+        excerpt.add('[... %d earlier stderr sections]' % (len(sections) - len(shown)))
+    for lines in reversed(shown):
+        excerpt.add('--- stderr ---')
+        for line in lines:
+            excerpt.add(line)
+        excerpt.add('')
+
+    for match in errors[:max_blocks]:
+        excerpt.add(match.group(0).decode('utf-8', errors='replace').rstrip('\r'))
+    return str(excerpt)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Print the relevant part of a failed build log')
+    parser.add_argument('tool', choices=['meson', 'ninja'], help='The tool which wrote the log')
+    parser.add_argument('log', help='The build log')
+    parser.add_argument('--max-blocks', type=int, default=MAX_BLOCKS,
+                        help='The number of FAILED blocks or stderr sections, default: %d' % (MAX_BLOCKS))
+    parser.add_argument('--max-lines', type=int, default=MAX_LINES,
+                        help='The number of lines printed, default: %d' % (MAX_LINES))
+
+    args = parser.parse_args()
+
+    try:
+        with open(args.log, 'rb') as f:
+            try:
+                data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                # An empty log cannot be mapped
+                data = b''
+            if args.tool == 'ninja':
+                print(excerpt_ninja(data, args.max_blocks, args.max_lines))
+            else:
+                print(excerpt_meson(data, args.max_blocks, args.max_lines))
+    except OSError as e:
+        print(e, file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    ci_profile.start()
+    main()
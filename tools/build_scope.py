@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# SPDX-License-Identifier: BSD-3-Clause
+# Copyright 2024 Loongson
+
+"""
+Compute the meson options of a compile-only build restricted to the
+components a series changes, the components depending on them and their
+dependencies.
+
+Nothing is printed when the series touches something outside of lib/ and
+drivers/ which matters to the build, or when the restricted build would
+not be much smaller than the full one: only the full build is useful then.
+
+Example usage:
+    ./build_scope.py --dpdk-dir ~/dpdk --base <commit> --series-dir series/123
+    ./build_scope.py --dpdk-dir ~/dpdk --base <commit> --series-dir series/123 --introspect build
+"""
+
+import argparse
+from typing import Dict, Iterable, List, Optional, Set
+
+import ci_profile
+import dpdk_components
+import patch_parser
+import test_impact
+
+# Do not bother with the restricted build above this share of components
+MAX_SCOPE_RATIO = 0.5
+
+
+def get_build_scope(changed_files: Iterable[str], rules: patch_parser.PathTagTrie,
+                    info: Dict) -> Optional[Set[str]]:
+    """
+    Return the components to build for the changed files, or None when
+    only the full build makes sense.
+    """
+    changed_files = list(changed_files)
+    if any(f.startswith(test_impact.TEST_DIR + '/') for f in changed_files):
+        return None
+
+    changed = test_impact.get_changed_components(changed_files, rules, info['components'])
+    if not changed:
+        return None
+
+    scope = dpdk_components.get_dependencies(info, dpdk_components.get_dependents(info, changed))
+    if len(scope) > len(info['components']) * MAX_SCOPE_RATIO:
+        return None
+    return scope
+
+
+def get_meson_options(scope: Set[str], info: Dict) -> List[str]:
+    drivers = sorted(c[len('drivers/'):] for c in scope if c.startswith('drivers/'))
+    disabled_libs = sorted(c[len('lib/'):] for c in info['components']
+                           if c.startswith('lib/') and c not in scope)
+
+    options = ['-Dtests=false']
+    # An empty enable_drivers would enable all of them
+    if drivers:
+        options.append('-Denable_drivers=' + ','.join(drivers))
+    else:
+        options.append('-Ddisable_drivers=*/*')
+    # Mandatory libraries cannot be disabled, meson only warns about them
+    if disabled_libs:
+        options.append('-Ddisable_libs=' + ','.join(disabled_libs))
+    return options
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Print the meson options building only the components affected by a series')
+    parser.add_argument('patch_files', metavar='patch file', nargs='*', help='The patch files')
+    parser.add_argument('--series-dir', help='A series directory containing pwid_order.txt')
+    parser.add_argument('--dpdk-dir', default='.', help='The path to the patched DPDK checkout')
+    parser.add_argument('--base', help='The base commit of the series, to cache the component graph')
+    parser.add_argument('--introspect', metavar='BUILD_DIR',
+                        help='refresh the cached component graph from a configured build directory')
+    parser.add_argument('--config', default=test_impact.CONFIG_FILE, help='The path to test_impact.cfg')
+
+    args = parser.parse_intermixed_args()
+
+    if not args.patch_files and not args.series_dir:
+        parser.error('at least one patch file or --series-dir is required')
+
+    patch_files = list(args.patch_files)
+    if args.series_dir:
+        patch_files += patch_parser.get_patch_files_in_series(args.series_dir)
+    changed_files = patch_parser.get_all_files_from_patches(patch_files)
+
+    # The patched tree only stands for its base when the series does not
+    # change the build files
+    base = args.base
+    if test_impact.changes_index_inputs(changed_files):
+        base = None
+
+    if args.introspect:
+        if base:
+            dpdk_components.load_components(args.dpdk_dir, base, args.introspect)
+        return
+
+    info = dpdk_components.load_components(args.dpdk_dir, base)
+    scope = get_build_scope(changed_files, test_impact.load_rules(args.config), info)
+    if scope is not None:
+        print('\n'.join(get_meson_options(scope, info)))
+
+
+if __name__ == '__main__':
+    ci_profile.start()
+    main()
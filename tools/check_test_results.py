@@ -11,6 +11,10 @@ import json
 import os
 import requests
 
+import ci_profile
+
+PW_API_URL = os.environ.get('DPDK_CI_PW_API_URL', 'http://patches.dpdk.org/api')
+
 def try_request(url, retry=3):
     i = 0
     while i < retry:
@@ -26,7 +30,7 @@ def try_request(url, retry=3):
     return None
 
 def get_patch_checks(pid):
-    url = "http://patches.dpdk.org/api/patches/" + str(pid) + "/checks/"
+    url = PW_API_URL + "/patches/" + str(pid) + "/checks/"
     print(url)
     data = try_request(url)
     if data == None:
@@ -115,7 +119,7 @@ def get_series_ids(pre_days):
     since = today - timedelta(pre_days)
     page = 1
     series_ids = []
-    URL = "http://patches.dpdk.org/api/events/?category=series-completed"
+    URL = PW_API_URL + "/events/?category=series-completed"
 
     while True:
         url = URL + "&page=" + str(page) + "&since=" + since.strftime("%Y-%m-%dT%H:%M:%S")
@@ -141,7 +145,7 @@ def get_series_ids(pre_days):
     return series_ids
 
 def get_series_by_id(sid):
-    url = "http://patches.dpdk.org/api/series/" + str(sid)
+    url = PW_API_URL + "/series/" + str(sid)
     print(url)
     data = try_request(url)
     if data == None:
@@ -251,4 +255,5 @@ def main():
     check_test_results(args.pre_days, args.log_file)
 
 if __name__ == "__main__":
+    ci_profile.start()
     main()
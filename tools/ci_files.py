@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# SPDX-License-Identifier: BSD-3-Clause
+# Copyright 2024 Loongson
+
+"""
+The state files of the CI tools: locks shared between processes, and
+writes through a temporary file replaced at once, so that a reader or a
+crash never sees a partial file.
+
+Example usage:
+    with ci_files.file_lock(LOCK_FILE):
+        queue = ci_files.load_json(QUEUE_FILE, [])
+        queue.append(job)
+        ci_files.save_json(QUEUE_FILE, queue)
+"""
+
+import contextlib
+import fcntl
+import json
+import os
+from typing import Any, Iterator, Optional
+
+
+@contextlib.contextmanager
+def file_lock(path: str, blocking: bool = True) -> Iterator[bool]:
+    """
+    Hold an exclusive flock on path, created with its directory if needed.
+    Without blocking, yield False at once when another process holds it.
+    The lock is not re-entrant, even in one process.
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'a') as f:
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def load_json(path: str, default: Any = None) -> Any:
+    if not os.path.isfile(path):
+        return default
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_text(path: str, text: str, tmp_file: Optional[str] = None) -> None:
+    """
+    Replace path with text at once. The temporary file must be on the same
+    file system, path + '.tmp' by default.
+    """
+    tmp_file = tmp_file or path + '.tmp'
+    with open(tmp_file, 'w') as f:
+        f.write(text)
+    os.replace(tmp_file, path)
+
+
+def save_json(path: str, data: Any, indent: Optional[int] = 4, tmp_file: Optional[str] = None) -> None:
+    """
+    Replace path with data in JSON, indented for the files read by people
+    or compact with indent=None for the caches.
+    """
+    save_text(path, json.dumps(data, indent=indent, sort_keys=True), tmp_file)
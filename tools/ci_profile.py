@@ -0,0 +1,269 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# SPDX-License-Identifier: BSD-3-Clause
+# Copyright 2024 Loongson
+
+"""
+Opt-in profiling of the Python tools, and a summary of the profiles.
+
+Every tool calls start() first thing in its __main__ block. Profiling is
+enabled by DPDK_CI_PROFILE=true or the --profile option, which start()
+removes from the arguments; --profile-memory or DPDK_CI_PROFILE_MEMORY=true
+also traces the allocations. When enabled, a run writes in its own
+directory data/profiles/<tool>-<date>-<pid>/:
+
+- profile.pstats: the cProfile statistics,
+- http.jsonl: the duration of every requests and XML-RPC call,
+- memory.txt: the peak traced memory and the top allocation sites,
+- summary.json: the wall clock time, the CPU time and the time waited on
+  the network.
+
+Disabled, start() only looks at the environment and the arguments: the
+profiling modules are imported when it is enabled.
+
+'summarize' merges the statistics of the runs of a tool and prints the
+hottest functions, the time waited on the network per run and the
+slowest endpoints.
+
+Example usage:
+    DPDK_CI_PROFILE=true ./get_reruns.py --since 2024-01-01T00:00:00
+    ./pw_maintainers_cli.py --profile --type series list-trees 30001
+    ./ci_profile.py summarize --tool pw_maintainers_cli --top 20
+"""
+
+import os
+import sys
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.realpath(__file__)), '../data')
+PROFILE_DIR = os.environ.get('DPDK_CI_PROFILE_DIR', os.path.join(DATA_DIR, 'profiles'))
+
+PROFILE_OPTION = '--profile'
+MEMORY_OPTION = '--profile-memory'
+
+# Allocation sites listed in memory.txt
+MEMORY_TOP = 20
+
+_run = None
+
+
+class ProfileRun:
+    """
+    The profiler, the HTTP calls and the clocks of one profiled run.
+    """
+
+    def __init__(self, tool: str, memory: bool):
+        import cProfile
+        import time
+
+        self.tool = tool
+        self.memory = memory
+        self.directory = os.path.join(PROFILE_DIR, '%s-%s-%d' % (tool, time.strftime('%Y%m%d-%H%M%S'), os.getpid()))
+        self.argv = list(sys.argv)
+        self.calls = []
+        self.wall_start = time.monotonic()
+        self.cpu_start = time.process_time()
+        self.profiler = cProfile.Profile()
+
+    def add_call(self, kind: str, target: str, start: float, end: float, status) -> None:
+        self.calls.append({'kind': kind, 'target': target, 'duration': round(end - start, 4), 'status': status})
+
+    def start(self) -> None:
+        if self.memory:
+            import tracemalloc
+            tracemalloc.start()
+        patch_http(self)
+        self.profiler.enable()
+
+    def stop(self) -> None:
+        import json
+        import time
+
+        self.profiler.disable()
+        os.makedirs(self.directory, exist_ok=True)
+        self.profiler.dump_stats(os.path.join(self.directory, 'profile.pstats'))
+
+        with open(os.path.join(self.directory, 'http.jsonl'), 'w') as f:
+            for call in self.calls:
+                f.write(json.dumps(call) + '\n')
+
+        summary = {
+            'tool': self.tool,
+            'argv': self.argv,
+            'wall': round(time.monotonic() - self.wall_start, 3),
+            'cpu': round(time.process_time() - self.cpu_start, 3),
+            'network_wait': round(sum(call['duration'] for call in self.calls), 3),
+            'http_calls': len(self.calls),
+        }
+        if self.memory:
+            summary['peak_memory'] = write_memory(os.path.join(self.directory, 'memory.txt'))
+        with open(os.path.join(self.directory, 'summary.json'), 'w') as f:
+            json.dump(summary, f, indent=4, sort_keys=True)
+        print('profile written to %s' % (self.directory), file=sys.stderr)
+
+
+def write_memory(path: str) -> int:
+    import tracemalloc
+
+    _, peak = tracemalloc.get_traced_memory()
+    snapshot = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    with open(path, 'w') as f:
+        f.write('peak traced memory: %d bytes\n\n' % (peak))
+        for stat in snapshot.statistics('lineno')[:MEMORY_TOP]:
+            f.write('%s\n' % (stat))
+    return peak
+
+
+def patch_http(run: ProfileRun) -> None:
+    """
+    Time the calls of requests and of the XML-RPC transports.
+    """
+    import time
+    import xmlrpc.client
+
+    single_request = xmlrpc.client.Transport.single_request
+
+    def timed_single_request(transport, host, handler, request_body, verbose=False):
+        start = time.monotonic()
+        status = 'error'
+        try:
+            response = single_request(transport, host, handler, request_body, verbose)
+            status = 200
+            return response
+        except xmlrpc.client.ProtocolError as e:
+            status = e.errcode
+            raise
+        finally:
+            run.add_call('xmlrpc', '%s%s' % (host, handler), start, time.monotonic(), status)
+
+    xmlrpc.client.Transport.single_request = timed_single_request
+
+    try:
+        import requests
+    except ImportError:
+        return
+    request = requests.Session.request
+
+    def timed_request(session, method, url, *args, **kwargs):
+        start = time.monotonic()
+        status = 'error'
+        try:
+            response = request(session, method, url, *args, **kwargs)
+            status = response.status_code
+            return response
+        finally:
+            run.add_call(method, url, start, time.monotonic(), status)
+
+    requests.Session.request = timed_request
+
+
+def is_enabled(name: str, option: str) -> bool:
+    if option in sys.argv[1:]:
+        sys.argv.remove(option)
+        return True
+    return os.environ.get(name) == 'true'
+
+
+def start(tool: str = None) -> None:
+    """
+    Profile the rest of the run if profiling is enabled.
+    """
+    global _run
+    memory = is_enabled('DPDK_CI_PROFILE_MEMORY', MEMORY_OPTION)
+    enabled = is_enabled('DPDK_CI_PROFILE', PROFILE_OPTION)
+    if not (enabled or memory) or _run is not None:
+        return
+
+    import atexit
+    if tool is None:
+        tool = os.path.splitext(os.path.basename(sys.argv[0]))[0]
+    _run = ProfileRun(tool, memory)
+    # Also written when the tool exits with sys.exit()
+    atexit.register(_run.stop)
+    _run.start()
+
+
+def get_runs(tool: str = None):
+    runs = []
+    if not os.path.isdir(PROFILE_DIR):
+        return runs
+    for name in sorted(os.listdir(PROFILE_DIR)):
+        directory = os.path.join(PROFILE_DIR, name)
+        if not os.path.isfile(os.path.join(directory, 'summary.json')):
+            continue
+        if tool is not None and not name.startswith(tool + '-'):
+            continue
+        runs.append(directory)
+    return runs
+
+
+def summarize(directories, top: int, sort: str) -> None:
+    import io
+    import json
+    import pstats
+    import re
+
+    stats = None
+    endpoints = {}
+    print('%-50s %8s %8s %8s %6s' % ('run', 'wall', 'cpu', 'network', 'calls'))
+    for directory in directories:
+        with open(os.path.join(directory, 'summary.json')) as f:
+            summary = json.load(f)
+        print('%-50s %7.2fs %7.2fs %7.2fs %6d' % (os.path.basename(directory), summary['wall'], summary['cpu'],
+                                                   summary['network_wait'], summary['http_calls']))
+        profile = os.path.join(directory, 'profile.pstats')
+        if stats is None:
+            stats = pstats.Stats(profile, stream=io.StringIO())
+        else:
+            stats.add(profile)
+        with open(os.path.join(directory, 'http.jsonl')) as f:
+            for line in f:
+                call = json.loads(line)
+                # The IDs in the URL make one endpoint
+                target = re.sub(r'\d+', 'N', call['target'].split('?')[0])
+                endpoint = endpoints.setdefault((call['kind'], target), [0, 0.0])
+                endpoint[0] += 1
+                endpoint[1] += call['duration']
+
+    if stats is None:
+        print('no profile found')
+        return
+
+    if endpoints:
+        print('\n%-60s %6s %9s %9s' % ('endpoint', 'calls', 'total', 'mean'))
+        for (kind, target), (count, total) in sorted(endpoints.items(), key=lambda item: -item[1][1])[:top]:
+            print('%-60s %6d %8.2fs %8.3fs' % ('%s %s' % (kind, target), count, total, total / count))
+
+    output = io.StringIO()
+    stats.stream = output
+    stats.sort_stats(sort).print_stats(top)
+    print('\n' + output.getvalue().strip())
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Summarize the profiles of the Python tools')
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.required = True
+
+    summarize_parser = subparsers.add_parser('summarize', help='print the hottest functions across runs')
+    summarize_parser.add_argument('runs', nargs='*', help='The run directories, default: all the runs')
+    summarize_parser.add_argument('--tool', help='Only the runs of this tool')
+    summarize_parser.add_argument('--top', type=int, default=20, help='The functions listed, default: 20')
+    summarize_parser.add_argument('--sort', default='cumulative', choices=['cumulative', 'tottime', 'calls'],
+                                  help='The order of the functions, default: cumulative')
+
+    args = parser.parse_args()
+
+    directories = args.runs or get_runs(args.tool)
+    try:
+        summarize(directories, args.top, args.sort)
+    except (OSError, ValueError) as e:
+        print('summarize: %s' % (e), file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
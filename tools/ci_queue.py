@@ -0,0 +1,311 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# SPDX-License-Identifier: BSD-3-Clause
+# Copyright 2024 Loongson
+
+"""
+A persistent queue of the CI jobs, new series and rechecks, sharing the
+DPDK checkout.
+
+Jobs are run shortest first: the expected cost of a job is the duration of
+the past jobs of the same kind which changed a similar number of files, or
+an estimate from its patch and file counts without history. The time a job
+has waited is subtracted from its cost so that a large series is not
+starved by a stream of small ones. A series superseded by a newer version
+but kept in the queue, see series_queue.py, runs after all the others.
+
+The queue lives in data/ci_queue.json and the durations of the finished
+jobs in data/ci_job_history.json, both updated under data/ci_queue.lock.
+Only one 'run' may execute jobs at a time. The job being run is saved in
+data/ci_queue.running.json until it finishes, so that a job interrupted by
+a crash or a restart is queued again by the next run.
+
+Example usage:
+    ./ci_queue.py push series 30001
+    ./ci_queue.py push recheck 30001 -- /usr/bin/bash tools/retest-series.sh -t 2 30001
+    ./ci_queue.py list
+    ./ci_queue.py run
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import subprocess
+import sys
+import time
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import requests
+
+import ci_files
+import ci_profile
+import ci_trace
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.realpath(__file__)), '../data')
+QUEUE_FILE = os.path.join(DATA_DIR, 'ci_queue.json')
+HISTORY_FILE = os.path.join(DATA_DIR, 'ci_job_history.json')
+LOCK_FILE = os.path.join(DATA_DIR, 'ci_queue.lock')
+RUN_LOCK_FILE = os.path.join(DATA_DIR, 'ci_queue.run.lock')
+RUNNING_FILE = os.path.join(DATA_DIR, 'ci_queue.running.json')
+TEST_SERIES = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'test-series.sh')
+
+PW_API_URL = os.environ.get('DPDK_CI_PW_API_URL', 'http://patches.dpdk.org/api')
+
+JOB_KINDS = ('series', 'recheck')
+
+# Estimate of a job without history, in seconds: the build and the unit
+# tests take most of it whatever the series.
+DEFAULT_COST = 1200
+COST_PER_PATCH = 30
+COST_PER_FILE = 10
+
+# Seconds of expected cost forgiven for each second waited in the queue
+AGING_FACTOR = 0.5
+
+# Number of similar past jobs to average, and of jobs kept per kind
+NEAREST_JOBS = 5
+HISTORY_SIZE = 200
+
+
+def get_series_size(series_id: str, series: Optional[Dict] = None) -> Dict[str, Optional[int]]:
+    """
+    Return the number of patches and of changed files of a series, None
+    for what Patchwork could not tell. The series JSON is fetched unless
+    given.
+    """
+    size: Dict[str, Optional[int]] = {'patches': None, 'files': None}
+    try:
+        session = requests.Session()
+        if series is None:
+            response = session.get('%s/series/%s/' % (PW_API_URL, series_id), timeout=60)
+            response.raise_for_status()
+            series = response.json()
+        size['patches'] = len(series.get('patches', []))
+
+        response = session.get(series['mbox'], timeout=120)
+        response.raise_for_status()
+        size['files'] = len(set(line for line in response.text.splitlines() if line.startswith('diff --git ')))
+    except (requests.RequestException, ValueError, KeyError) as e:
+        print('cannot get the size of series %s: %s' % (series_id, e), file=sys.stderr)
+    return size
+
+
+def estimate_cost(job: Dict, history: Dict[str, List[Dict]]) -> float:
+    """
+    Return the expected duration of a job in seconds.
+    """
+    files = job.get('files')
+    patches = job.get('patches')
+    samples = history.get(job['kind'], [])
+    if files is not None and samples:
+        nearest = sorted(samples, key=lambda sample: abs(sample['files'] - files))[:NEAREST_JOBS]
+        return sum(sample['duration'] for sample in nearest) / len(nearest)
+    if samples:
+        return sorted(sample['duration'] for sample in samples)[len(samples) // 2]
+    return DEFAULT_COST + COST_PER_PATCH * (patches or 0) + COST_PER_FILE * (files or 0)
+
+
+def get_score(job: Dict, history: Dict[str, List[Dict]], now: float) -> float:
+    return estimate_cost(job, history) - AGING_FACTOR * (now - job['enqueued'])
+
+
+def get_order(job: Dict, history: Dict[str, List[Dict]], now: float) -> Tuple[bool, float, float]:
+    # The superseded series after all the others
+    return bool(job.get('superseded_by')), get_score(job, history, now), job['enqueued']
+
+
+@contextlib.contextmanager
+def locked_queue() -> Iterator[List[Dict]]:
+    """
+    Return the queued jobs, saved when the with block ends.
+    """
+    with ci_files.file_lock(LOCK_FILE):
+        queue = ci_files.load_json(QUEUE_FILE, [])
+        yield queue
+        ci_files.save_json(QUEUE_FILE, queue)
+
+
+def push_job(kind: str, series_id: str, command: Optional[List[str]] = None,
+             patches: Optional[int] = None, files: Optional[int] = None,
+             group: Optional[List[str]] = None, version: Optional[int] = None,
+             superseded_by: Optional[str] = None, series: Optional[Dict] = None) -> bool:
+    """
+    Add a job to the queue, return False if the same job is already queued.
+    Without patches and files, the size of the series is taken from
+    Patchwork, or from its already fetched JSON. The group and version of a
+    series are kept to find its versions, see series_queue.py.
+    """
+    job_id = '%s-%s' % (kind, series_id)
+    if command is None:
+        command = [TEST_SERIES, series_id]
+    if patches is None and files is None:
+        # Nothing to download for a job already queued
+        with ci_files.file_lock(LOCK_FILE):
+            if any(job['id'] == job_id for job in ci_files.load_json(QUEUE_FILE, [])):
+                return False
+        size = get_series_size(series_id, series)
+        patches, files = size['patches'], size['files']
+
+    with ci_files.file_lock(LOCK_FILE):
+        queue = ci_files.load_json(QUEUE_FILE, [])
+        if any(job['id'] == job_id for job in queue):
+            return False
+        queue.append({
+            'id': job_id,
+            'kind': kind,
+            'series_id': series_id,
+            'command': command,
+            'patches': patches,
+            'files': files,
+            'enqueued': time.time(),
+        })
+        if group is not None:
+            queue[-1].update(group=list(group), version=version)
+        if superseded_by is not None:
+            queue[-1]['superseded_by'] = superseded_by
+        ci_files.save_json(QUEUE_FILE, queue)
+    return True
+
+
+def pop_job(track: bool = False) -> Optional[Dict]:
+    """
+    Remove and return the job with the lowest score. With track, the job is
+    saved as the running one until finish_job() is called.
+    """
+    with ci_files.file_lock(LOCK_FILE):
+        queue = ci_files.load_json(QUEUE_FILE, [])
+        if not queue:
+            return None
+        history = ci_files.load_json(HISTORY_FILE, {})
+        now = time.time()
+        job = min(queue, key=lambda job: get_order(job, history, now))
+        queue.remove(job)
+        if track:
+            ci_files.save_json(RUNNING_FILE, job)
+        ci_files.save_json(QUEUE_FILE, queue)
+    ci_trace.emit('queue_wait', job['enqueued'], series_id=job['series_id'], kind=job['kind'])
+    return job
+
+
+def finish_job(job: Dict, duration: float, status: Optional[int] = None) -> None:
+    record_duration(job, duration)
+    ci_trace.emit('job', time.time() - duration, outcome='pass' if status == 0 else 'fail',
+                  series_id=job['series_id'], kind=job['kind'])
+    with ci_files.file_lock(LOCK_FILE):
+        if os.path.isfile(RUNNING_FILE):
+            os.remove(RUNNING_FILE)
+
+
+def requeue_interrupted() -> Optional[Dict]:
+    """
+    Queue again the job which was running when the previous run stopped,
+    with its original age. Must be called with the run lock held.
+    """
+    with ci_files.file_lock(LOCK_FILE):
+        job = ci_files.load_json(RUNNING_FILE, None)
+        if job is None:
+            return None
+        queue = ci_files.load_json(QUEUE_FILE, [])
+        if not any(queued['id'] == job['id'] for queued in queue):
+            queue.append(job)
+            ci_files.save_json(QUEUE_FILE, queue)
+        os.remove(RUNNING_FILE)
+    return job
+
+
+def record_duration(job: Dict, duration: float) -> None:
+    with ci_files.file_lock(LOCK_FILE):
+        history = ci_files.load_json(HISTORY_FILE, {})
+        samples = history.setdefault(job['kind'], [])
+        samples.append({'files': job.get('files') or 0, 'patches': job.get('patches') or 0,
+                        'duration': round(duration, 1)})
+        del samples[:-HISTORY_SIZE]
+        ci_files.save_json(HISTORY_FILE, history)
+
+
+def lock_runner():
+    """
+    Return a context manager telling whether the caller is the only runner
+    of the queue.
+    """
+    return ci_files.file_lock(RUN_LOCK_FILE, blocking=False)
+
+
+def run_jobs(max_jobs: int = 0) -> int:
+    """
+    Run the queued jobs until the queue is empty or max_jobs were run.
+    Return the number of jobs run, -1 if another run holds the queue.
+    """
+    with lock_runner() as acquired:
+        if not acquired:
+            return -1
+        job = requeue_interrupted()
+        if job is not None:
+            print('%s was interrupted, queued again' % (job['id']), flush=True)
+
+        count = 0
+        while max_jobs <= 0 or count < max_jobs:
+            job = pop_job(track=True)
+            if job is None:
+                break
+            print('%s run %s: %s' % (time.strftime('%FT%T'), job['id'], ' '.join(job['command'])), flush=True)
+            start = time.monotonic()
+            p = subprocess.run(job['command'])
+            duration = time.monotonic() - start
+            print('%s %s done in %.0fs, status %d' % (time.strftime('%FT%T'), job['id'], duration, p.returncode),
+                  flush=True)
+            finish_job(job, duration, p.returncode)
+            count += 1
+        return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Queue the CI jobs and run them shortest first')
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.required = True
+
+    push_parser = subparsers.add_parser(
+        'push', help='add a job to the queue, its command follows --, test-series.sh <series_id> by default')
+    push_parser.add_argument('kind', choices=JOB_KINDS, help='The kind of job')
+    push_parser.add_argument('series_id', help='The series to test')
+    push_parser.add_argument('--patches', type=int, help='The number of patches of the series')
+    push_parser.add_argument('--files', type=int, help='The number of files changed by the series')
+
+    subparsers.add_parser('pop', help='remove the next job and print it')
+    subparsers.add_parser('list', help='print the queued jobs in the order they would run')
+
+    run_parser = subparsers.add_parser('run', help='run the queued jobs')
+    run_parser.add_argument('--max-jobs', type=int, default=0, help='Stop after this many jobs, 0 for no limit')
+
+    argv = sys.argv[1:]
+    job_command = None
+    if '--' in argv:
+        job_command = argv[argv.index('--') + 1:]
+        argv = argv[:argv.index('--')]
+    args = parser.parse_args(argv)
+
+    if args.command == 'push':
+        if not push_job(args.kind, args.series_id, job_command or None, args.patches, args.files):
+            print('%s %s is already queued' % (args.kind, args.series_id))
+    elif args.command == 'pop':
+        job = pop_job()
+        if job is not None:
+            print(json.dumps(job))
+    elif args.command == 'list':
+        with ci_files.file_lock(LOCK_FILE):
+            queue = ci_files.load_json(QUEUE_FILE, [])
+            history = ci_files.load_json(HISTORY_FILE, {})
+        now = time.time()
+        queue.sort(key=lambda job: get_order(job, history, now))
+        for job in queue:
+            print('%s cost %.0fs waited %.0fs' % (job['id'], estimate_cost(job, history), now - job['enqueued']))
+    else:
+        if run_jobs(args.max_jobs) < 0:
+            print('the queue is already being run')
+
+
+if __name__ == '__main__':
+    ci_profile.start()
+    main()
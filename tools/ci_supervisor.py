@@ -0,0 +1,318 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# SPDX-License-Identifier: BSD-3-Clause
+# Copyright 2024 Loongson
+
+"""
+Run the whole CI in one long-lived process instead of the cron jobs of
+run-dpdk-ci.sh and run-ci-monitor.sh.
+
+The supervisor polls Patchwork with a warm poll_pw.Poller and executes the
+jobs of ci_queue.py as soon as they are queued. It runs recheck.py and
+dpdk-ci-monitor.sh on their timers; with --mail, it reads the mails of the
+sources with mail_ingest.py, which finds the rechecks instead of
+recheck.py. With DPDK_CI_MAIL_QUEUE, it also sends the report mails
+queued by the jobs with mail_queue.py, and with DPDK_CI_MIRROR it fetches
+the mirrors of mirror_fetcher.py on a timer. Every stage runs as a
+subprocess in its own process group, killed when it exceeds its timeout.
+The metrics of the spans of ci_trace.py are exported every minute.
+
+The CI config is loaded once with load-ci-config.sh, before the CI tools
+run in the supervisor are imported, and passed to all the stages. The
+MAINTAINERS lookup is not kept warm: pw_maintainers_cli.py still runs in
+each test job, on the MAINTAINERS of the tree checked out for it.
+
+data/ci_supervisor.lock makes sure only one supervisor runs, and the
+queue runner lock keeps 'ci_queue.py run' away while it does. On SIGTERM
+or SIGINT the running stages are killed; the interrupted job is queued
+again at the next start and the timers resume from the times saved in
+data/ci_supervisor_state.json.
+
+Example usage:
+    ./ci_supervisor.py last.txt
+    ./ci_supervisor.py --recheck-interval 600 --monitor-interval 43200 last.txt
+"""
+
+import argparse
+import asyncio
+import os
+import signal
+import subprocess
+import sys
+import time
+from typing import Dict, List, Optional
+
+TOOLS_DIR = os.path.dirname(os.path.realpath(__file__))
+
+
+def log(message: str) -> None:
+    print('%s %s' % (time.strftime('%FT%T'), message), flush=True)
+
+
+def load_ci_env() -> Dict[str, str]:
+    """
+    Return the environment with the variables of the CI config files.
+    """
+    load_ci_config = os.path.join(TOOLS_DIR, 'load-ci-config.sh')
+    try:
+        p = subprocess.run(['sh', '-c', '. "$0" && env -0', load_ci_config],
+                           capture_output=True, check=True, timeout=60)
+    except (OSError, subprocess.SubprocessError) as e:
+        log('loading the CI config failed: %s' % (e))
+        return dict(os.environ)
+    env = {}
+    for item in p.stdout.decode(errors='replace').split('\0'):
+        key, sep, value = item.partition('=')
+        if sep:
+            env[key] = value
+    return env
+
+
+# The CI tools read their config from the environment when they are imported,
+# so it must be loaded first
+if __name__ == '__main__':
+    os.environ.update(load_ci_env())
+
+import ci_files
+import ci_profile
+import ci_queue
+import ci_trace
+import mail_ingest
+import mail_queue
+import poll_pw
+
+DATA_DIR = os.path.join(TOOLS_DIR, '../data')
+LOCK_FILE = os.path.join(DATA_DIR, 'ci_supervisor.lock')
+STATE_FILE = os.path.join(DATA_DIR, 'ci_supervisor_state.json')
+
+RECHECK_INTERVAL = 300
+MONITOR_INTERVAL = 12 * 3600
+JOB_TIMEOUT = 4 * 3600
+RECHECK_TIMEOUT = 600
+MONITOR_TIMEOUT = 2 * 3600
+MIRROR_INTERVAL = 300
+MIRROR_TIMEOUT = 3600
+
+# Wake up the worker at least this often, for jobs queued from outside
+QUEUE_CHECK_INTERVAL = 60
+
+# Seconds between two checks of the mail sources
+MAIL_CHECK_INTERVAL = 5
+
+# Seconds between two exports of the metrics of the spans
+METRICS_INTERVAL = 60
+
+
+class Supervisor:
+    def __init__(self, args, env: Dict[str, str]):
+        self.args = args
+        self.env = env
+        self.stopping = asyncio.Event()
+        self.queued = asyncio.Event()
+        self.processes: Dict[str, asyncio.subprocess.Process] = {}
+        self.state: Dict[str, float] = ci_files.load_json(STATE_FILE, {})
+
+    def save_state(self, key: str) -> None:
+        self.state[key] = time.time()
+        ci_files.save_json(STATE_FILE, self.state)
+
+    async def sleep(self, seconds: float, event: Optional[asyncio.Event] = None) -> None:
+        """
+        Sleep until the timeout, the stop of the supervisor or the event.
+        """
+        waiters = [asyncio.ensure_future(self.stopping.wait())]
+        if event is not None:
+            waiters.append(asyncio.ensure_future(event.wait()))
+        _, pending = await asyncio.wait(waiters, timeout=max(seconds, 0), return_when=asyncio.FIRST_COMPLETED)
+        for waiter in pending:
+            waiter.cancel()
+
+    async def run_stage(self, name: str, command: List[str], timeout: float) -> Optional[int]:
+        """
+        Run a command in its own process group and return its status, None
+        when it was killed.
+        """
+        log('%s: %s' % (name, ' '.join(command)))
+        start = time.monotonic()
+        process = await asyncio.create_subprocess_exec(*command, env=self.env, cwd=os.path.join(TOOLS_DIR, '..'),
+                                                       start_new_session=True)
+        self.processes[name] = process
+        try:
+            status: Optional[int] = await asyncio.wait_for(process.wait(), timeout)
+        except asyncio.TimeoutError:
+            log('%s: timeout after %.0fs, killed' % (name, timeout))
+            self.kill(process)
+            await process.wait()
+            status = None
+        finally:
+            del self.processes[name]
+        if self.stopping.is_set():
+            status = None
+        log('%s: done in %.0fs, status %s' % (name, time.monotonic() - start, status))
+        return status
+
+    @staticmethod
+    def kill(process: asyncio.subprocess.Process) -> None:
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+
+    def stop(self) -> None:
+        if self.stopping.is_set():
+            return
+        log('stopping')
+        self.stopping.set()
+        for process in self.processes.values():
+            self.kill(process)
+
+    async def poll_loop(self) -> None:
+        loop = asyncio.get_event_loop()
+        poller = poll_pw.Poller('series', self.args.project, self.args.since_file,
+                                poll_pw.queue_series(self.args.defer_superseded))
+        interval = self.args.min_interval
+        while not self.stopping.is_set():
+            try:
+                found = await loop.run_in_executor(None, poller.poll)
+            except Exception as e:
+                log('poll failed: %s' % (e))
+                found = 0
+            if found:
+                self.queued.set()
+                interval = self.args.min_interval
+            else:
+                interval = min(interval * 2, self.args.max_interval)
+            await self.sleep(interval)
+
+    async def mail_loop(self) -> None:
+        loop = asyncio.get_event_loop()
+        ingester = mail_ingest.MailIngester(self.args.mail)
+        while not self.stopping.is_set():
+            try:
+                if ingester.has_changed() or ingester.has_pending():
+                    if await loop.run_in_executor(None, ingester.process):
+                        self.queued.set()
+            except Exception as e:
+                log('mail ingestion failed: %s' % (e))
+            await self.sleep(MAIL_CHECK_INTERVAL)
+
+    async def mail_send_loop(self) -> None:
+        loop = asyncio.get_event_loop()
+        sender = mail_queue.MailSender(mail_queue.MailQueue(), self.env)
+        while not self.stopping.is_set():
+            try:
+                await loop.run_in_executor(None, sender.send_queued)
+            except Exception as e:
+                log('sending the mails failed: %s' % (e))
+            await self.sleep(mail_queue.WATCH_INTERVAL)
+
+    async def metrics_loop(self) -> None:
+        loop = asyncio.get_event_loop()
+        while not self.stopping.is_set():
+            try:
+                await loop.run_in_executor(None, ci_trace.export_metrics, ci_trace.METRICS_FILE)
+            except Exception as e:
+                log('exporting the metrics failed: %s' % (e))
+            await self.sleep(METRICS_INTERVAL)
+
+    async def timer_loop(self, name: str, command: List[str], interval: float, timeout: float) -> None:
+        while not self.stopping.is_set():
+            await self.sleep(self.state.get(name, 0) + interval - time.time())
+            if self.stopping.is_set():
+                break
+            status = await self.run_stage(name, command, timeout)
+            if status is not None:
+                self.save_state(name)
+                self.queued.set()
+            else:
+                # Do not retry a killed stage in a loop
+                await self.sleep(interval / 4)
+
+    async def worker_loop(self) -> None:
+        loop = asyncio.get_event_loop()
+        job = await loop.run_in_executor(None, ci_queue.requeue_interrupted)
+        if job is not None:
+            log('%s was interrupted, queued again' % (job['id']))
+
+        while not self.stopping.is_set():
+            self.queued.clear()
+            job = await loop.run_in_executor(None, ci_queue.pop_job, True)
+            if job is None:
+                await self.sleep(QUEUE_CHECK_INTERVAL, self.queued)
+                continue
+
+            start = time.monotonic()
+            status = await self.run_stage(job['id'], job['command'], self.args.job_timeout)
+            if status is None and self.stopping.is_set():
+                # Left as the running job, to be queued again at restart
+                break
+            await loop.run_in_executor(None, ci_queue.finish_job, job, time.monotonic() - start, status)
+
+    async def run(self) -> None:
+        loop = asyncio.get_event_loop()
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(signum, self.stop)
+
+        python = sys.executable
+        tasks = [self.worker_loop(), self.poll_loop(), self.metrics_loop()]
+        if self.args.mail:
+            tasks.append(self.mail_loop())
+        if self.env.get('DPDK_CI_MAIL_QUEUE') == 'true':
+            tasks.append(self.mail_send_loop())
+        # mail_ingest.py finds the same rechecks in the mails
+        if self.args.recheck_interval > 0 and not self.args.mail:
+            tasks.append(self.timer_loop(
+                'recheck', [python, os.path.join(TOOLS_DIR, 'recheck.py'),
+                            os.path.join(DATA_DIR, 'last_recheck.txt'), os.path.join(DATA_DIR, 'recheck_db.txt')],
+                self.args.recheck_interval, RECHECK_TIMEOUT))
+        if self.args.monitor_interval > 0:
+            tasks.append(self.timer_loop(
+                'monitor', [os.path.join(TOOLS_DIR, 'dpdk-ci-monitor.sh'), '-p', '5'],
+                self.args.monitor_interval, MONITOR_TIMEOUT))
+        if self.env.get('DPDK_CI_MIRROR') == 'true':
+            tasks.append(self.timer_loop(
+                'mirror', [python, os.path.join(TOOLS_DIR, 'mirror_fetcher.py'), 'fetch'],
+                float(self.env.get('DPDK_CI_MIRROR_INTERVAL', MIRROR_INTERVAL)), MIRROR_TIMEOUT))
+        await asyncio.gather(*tasks)
+        log('stopped')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the poll, recheck, monitor and test jobs of the CI')
+    parser.add_argument('since_file', help='The file containing the first date to poll patchwork with')
+    parser.add_argument('--project', default='DPDK', help='The patchwork project name')
+    parser.add_argument('--min-interval', type=float, default=poll_pw.MIN_INTERVAL,
+                        help='Seconds between polls after activity')
+    parser.add_argument('--max-interval', type=float, default=poll_pw.MAX_INTERVAL,
+                        help='Seconds between polls when quiet')
+    parser.add_argument('--recheck-interval', type=float, default=RECHECK_INTERVAL,
+                        help='Seconds between two runs of recheck.py, 0 to disable, disabled with --mail')
+    parser.add_argument('--monitor-interval', type=float, default=MONITOR_INTERVAL,
+                        help='Seconds between two runs of dpdk-ci-monitor.sh, 0 to disable')
+    parser.add_argument('--job-timeout', type=float, default=JOB_TIMEOUT,
+                        help='Seconds after which a test job is killed')
+    parser.add_argument('-d', '--defer-superseded', action='store_true',
+                        help='queue the superseded series too, they are skipped by default')
+    parser.add_argument('--mail', metavar='SOURCE', action='append', default=[],
+                        help='also detect series, and rechecks instead of recheck.py, from this Maildir or mbox, '
+                        'may be repeated')
+
+    args = parser.parse_args()
+
+    os.makedirs(DATA_DIR, exist_ok=True)
+    with ci_files.file_lock(LOCK_FILE, blocking=False) as acquired:
+        if not acquired:
+            log('another ci_supervisor.py is running')
+            return
+        with ci_queue.lock_runner() as runner:
+            if not runner:
+                log('ci_queue.py run is running, retry later')
+                sys.exit(1)
+            supervisor = Supervisor(args, dict(os.environ))
+            asyncio.get_event_loop().run_until_complete(supervisor.run())
+
+
+if __name__ == '__main__':
+    ci_profile.start()
+    main()
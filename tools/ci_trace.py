@@ -0,0 +1,272 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# SPDX-License-Identifier: BSD-3-Clause
+# Copyright 2024 Loongson
+
+"""
+Record where the time of the CI goes, as one span event per stage, and
+export the latencies for Prometheus.
+
+A span is one JSON line appended to data/ci_trace.jsonl with the stage,
+the series ID, the start and end times, the outcome and the number of
+retries. The Python tools record spans with span() or emit(); the shell
+scripts call 'ci_trace.py span' with the start time they saved, e.g.
+
+    stage_start=$(date +%s.%N)
+    ninja -C build || failed=true
+    python3 ci_trace.py span ninja fail --start $stage_start --series-id 123
+
+'export' reads the spans added since the previous export and writes a
+Prometheus textfile, for the textfile collector of node_exporter, with
+one latency histogram per stage, the spans per stage and outcome, the
+retries per stage and the depths of the job and mail queues. The counts
+are kept in data/ci_trace_state.json, so the trace is read once and is
+rotated to ci_trace.jsonl.1 when it grows too large.
+
+Set DPDK_CI_TRACE=false to disable the spans.
+
+Example usage:
+    ./ci_trace.py span meson pass --start 1700000000.5 --series-id 123
+    ./ci_trace.py span download pass --start 1700000000.5 --series-id 123 --retries 2
+    ./ci_trace.py export
+    ./ci_trace.py export --output /var/lib/node_exporter/textfile/dpdk_ci.prom
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from typing import Dict, List, Optional
+
+import ci_files
+import ci_profile
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.realpath(__file__)), '../data')
+TRACE_FILE = os.environ.get('DPDK_CI_TRACE_FILE', os.path.join(DATA_DIR, 'ci_trace.jsonl'))
+STATE_FILE = os.path.join(DATA_DIR, 'ci_trace_state.json')
+LOCK_FILE = os.path.join(DATA_DIR, 'ci_trace.lock')
+METRICS_FILE = os.environ.get('DPDK_CI_METRICS_FILE', os.path.join(DATA_DIR, 'ci_metrics.prom'))
+QUEUE_FILE = os.path.join(DATA_DIR, 'ci_queue.json')
+MAIL_SPOOL_DIR = os.path.join(DATA_DIR, 'mail_queue/new')
+
+ENABLED = os.environ.get('DPDK_CI_TRACE', 'true') != 'false'
+
+# The trace is rotated by 'export' above this size
+MAX_TRACE_SIZE = 64 * 1024 * 1024
+
+# Upper bounds of the latency buckets, in seconds, from sending a report
+# to a full build and test run
+BUCKETS = (1, 5, 15, 30, 60, 120, 300, 600, 1200, 1800, 3600, 7200, 14400)
+
+OUTCOMES = ('pass', 'fail', 'skip')
+
+
+def emit(stage: str, start: float, end: Optional[float] = None, outcome: str = 'pass',
+         series_id: Optional[str] = None, retries: int = 0, **attrs) -> None:
+    """
+    Append a span to the trace. Tracing never fails the caller.
+    """
+    if not ENABLED:
+        return
+    if end is None:
+        end = time.time()
+    event = {
+        'stage': stage,
+        'series_id': series_id,
+        'start': round(start, 3),
+        'end': round(end, 3),
+        'duration': round(end - start, 3),
+        'outcome': outcome,
+        'retries': retries,
+    }
+    if attrs:
+        event['attrs'] = attrs
+    try:
+        # One write per line, appended whole by concurrent writers
+        fd = os.open(TRACE_FILE, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, (json.dumps(event, sort_keys=True) + '\n').encode())
+        finally:
+            os.close(fd)
+    except OSError as e:
+        print('trace %s: %s' % (stage, e), file=sys.stderr)
+
+
+class Span:
+    """
+    A span recorded when the with block ends, failed if it raises.
+    """
+
+    def __init__(self, stage: str, series_id: Optional[str] = None, **attrs):
+        self.stage = stage
+        self.series_id = series_id
+        self.attrs = attrs
+        self.outcome = 'pass'
+        self.retries = 0
+        self.start = 0.0
+
+    def __enter__(self) -> 'Span':
+        self.start = time.time()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        if exc_type is not None:
+            self.outcome = 'fail'
+        emit(self.stage, self.start, outcome=self.outcome, series_id=self.series_id,
+             retries=self.retries, **self.attrs)
+
+
+def span(stage: str, series_id: Optional[str] = None, **attrs) -> Span:
+    return Span(stage, series_id, **attrs)
+
+
+def load_state() -> Dict:
+    return ci_files.load_json(STATE_FILE, {'inode': None, 'offset': 0, 'stages': {}})
+
+
+def add_event(stages: Dict[str, Dict], event: Dict) -> None:
+    stats = stages.setdefault(event['stage'], {
+        'buckets': [0] * len(BUCKETS),
+        'count': 0,
+        'sum': 0.0,
+        'outcomes': {},
+        'retries': 0,
+    })
+    duration = event['duration']
+    for i, bound in enumerate(BUCKETS):
+        if duration <= bound:
+            stats['buckets'][i] += 1
+    stats['count'] += 1
+    stats['sum'] += duration
+    stats['outcomes'][event['outcome']] = stats['outcomes'].get(event['outcome'], 0) + 1
+    stats['retries'] += event.get('retries', 0)
+
+
+def read_events(path: str, offset: int, stages: Dict[str, Dict]) -> int:
+    """
+    Count the complete lines of the trace after offset, return the offset
+    of the first line not read.
+    """
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        for line in f:
+            if not line.endswith(b'\n'):
+                # Being written, read by the next export
+                break
+            offset += len(line)
+            try:
+                add_event(stages, json.loads(line))
+            except (ValueError, KeyError, TypeError):
+                continue
+    return offset
+
+
+def update_state(state: Dict) -> None:
+    if not os.path.isfile(TRACE_FILE):
+        return
+    inode = os.stat(TRACE_FILE).st_ino
+    if inode != state['inode']:
+        state['inode'] = inode
+        state['offset'] = 0
+    state['offset'] = read_events(TRACE_FILE, state['offset'], state['stages'])
+
+    if state['offset'] > MAX_TRACE_SIZE:
+        rotated = TRACE_FILE + '.1'
+        os.replace(TRACE_FILE, rotated)
+        # The spans appended before the rename
+        read_events(rotated, state['offset'], state['stages'])
+        state['inode'] = None
+        state['offset'] = 0
+
+
+def get_queue_depths() -> Dict[str, int]:
+    depths = {'jobs': 0, 'mails': 0}
+    try:
+        with open(QUEUE_FILE) as f:
+            depths['jobs'] = len(json.load(f))
+    except (OSError, ValueError):
+        pass
+    if os.path.isdir(MAIL_SPOOL_DIR):
+        depths['mails'] = len(os.listdir(MAIL_SPOOL_DIR))
+    return depths
+
+
+def format_metrics(stages: Dict[str, Dict], depths: Dict[str, int]) -> str:
+    lines: List[str] = [
+        '# HELP dpdk_ci_stage_duration_seconds Duration of the stages of the CI.',
+        '# TYPE dpdk_ci_stage_duration_seconds histogram',
+    ]
+    for stage, stats in sorted(stages.items()):
+        for bound, count in zip(BUCKETS, stats['buckets']):
+            lines.append('dpdk_ci_stage_duration_seconds_bucket{stage="%s",le="%s"} %d' % (stage, bound, count))
+        lines.append('dpdk_ci_stage_duration_seconds_bucket{stage="%s",le="+Inf"} %d' % (stage, stats['count']))
+        lines.append('dpdk_ci_stage_duration_seconds_sum{stage="%s"} %.3f' % (stage, stats['sum']))
+        lines.append('dpdk_ci_stage_duration_seconds_count{stage="%s"} %d' % (stage, stats['count']))
+
+    lines += [
+        '# HELP dpdk_ci_stage_total Spans of the stages of the CI per outcome.',
+        '# TYPE dpdk_ci_stage_total counter',
+    ]
+    for stage, stats in sorted(stages.items()):
+        for outcome, count in sorted(stats['outcomes'].items()):
+            lines.append('dpdk_ci_stage_total{stage="%s",outcome="%s"} %d' % (stage, outcome, count))
+
+    lines += [
+        '# HELP dpdk_ci_stage_retries_total Retries within the stages of the CI.',
+        '# TYPE dpdk_ci_stage_retries_total counter',
+    ]
+    for stage, stats in sorted(stages.items()):
+        lines.append('dpdk_ci_stage_retries_total{stage="%s"} %d' % (stage, stats['retries']))
+
+    lines += [
+        '# HELP dpdk_ci_queue_depth Jobs waiting in ci_queue.py and mails in mail_queue.py.',
+        '# TYPE dpdk_ci_queue_depth gauge',
+    ]
+    for queue, depth in sorted(depths.items()):
+        lines.append('dpdk_ci_queue_depth{queue="%s"} %d' % (queue, depth))
+    return '\n'.join(lines) + '\n'
+
+
+def export_metrics(output: str) -> None:
+    with ci_files.file_lock(LOCK_FILE):
+        state = load_state()
+        update_state(state)
+        ci_files.save_json(STATE_FILE, state)
+    # The textfile collector must never read a partial file
+    ci_files.save_text(output, format_metrics(state['stages'], get_queue_depths()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Record the spans of the CI stages and export their metrics')
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.required = True
+
+    span_parser = subparsers.add_parser('span', help='record a span ending now')
+    span_parser.add_argument('stage', help='The stage, e.g. download, apply, meson, ninja, test, report')
+    span_parser.add_argument('outcome', choices=OUTCOMES, help='The outcome of the stage')
+    span_parser.add_argument('--start', type=float, required=True, help='The start time, in seconds since the epoch')
+    span_parser.add_argument('--series-id', help='The series ID')
+    span_parser.add_argument('--retries', type=int, default=0, help='The number of retries within the stage')
+
+    export_parser = subparsers.add_parser('export', help='write the Prometheus textfile')
+    export_parser.add_argument('-o', '--output', default=METRICS_FILE,
+                               help='The textfile to write, default: %s' % (METRICS_FILE))
+
+    args = parser.parse_args()
+
+    if args.command == 'span':
+        emit(args.stage, args.start, outcome=args.outcome, series_id=args.series_id, retries=args.retries)
+        return
+
+    try:
+        export_metrics(args.output)
+    except (OSError, ValueError) as e:
+        print('export: %s' % (e), file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    ci_profile.start()
+    main()
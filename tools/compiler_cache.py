@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# SPDX-License-Identifier: BSD-3-Clause
+# Copyright 2024 Loongson
+
+"""
+Set up the ccache compiler cache shared by the builds of all the series,
+and report the cache hits and misses of the build of one series.
+
+The cache is bounded in size and its paths are normalized: the absolute
+paths under the base directory, the parent of the DPDK checkouts, are
+rewritten relative to the build directory, and the build directory itself
+is not hashed. An object built on a checkout of dpdk is then reused on a
+checkout of dpdk-next-net, or after the series branch changed, as long as
+the preprocessed source is the same. Meson compiles through ccache when it
+finds it in the PATH.
+
+The cache is shared and the statistics of ccache are global: 'snapshot'
+saves them before the build, and 'report' prints the difference after the
+build, optionally saved in the run record of the series. The series are
+built one at a time, so the difference is the build of the series.
+
+Example usage:
+    eval "$(./compiler_cache.py env --basedir /home/ci)"
+    ./compiler_cache.py snapshot series/123/ccache-stats.json
+    meson build && ninja -C build
+    ./compiler_cache.py report series/123/ccache-stats.json --record series/123/run_record.json
+"""
+
+import argparse
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+from typing import Dict
+
+import ci_files
+import ci_profile
+import run_record
+
+CCACHE_DIR = os.environ.get('DPDK_CI_CCACHE_DIR', os.path.expanduser('~/.cache/dpdk-ci/ccache'))
+CCACHE_MAXSIZE = os.environ.get('DPDK_CI_CCACHE_MAXSIZE', '20G')
+
+# The counters reported, with the lines of 'ccache -s' of ccache 3
+COUNTERS = (
+    ('direct_cache_hit', 'cache hit (direct)'),
+    ('preprocessed_cache_hit', 'cache hit (preprocessed)'),
+    ('cache_miss', 'cache miss'),
+)
+
+
+def get_env(basedir: str) -> Dict[str, str]:
+    """
+    Return the ccache settings of the builds.
+    """
+    return {
+        'CCACHE_DIR': CCACHE_DIR,
+        'CCACHE_MAXSIZE': CCACHE_MAXSIZE,
+        'CCACHE_BASEDIR': os.path.realpath(basedir),
+        # The build directory is in the debug info with -g
+        'CCACHE_NOHASHDIR': 'true',
+        # The compiler is hashed, not its path and mtime
+        'CCACHE_COMPILERCHECK': 'content',
+        # A checkout updates the mtime of the headers it changes
+        'CCACHE_SLOPPINESS': 'include_file_mtime,include_file_ctime',
+    }
+
+
+def read_stats() -> Dict[str, int]:
+    """
+    Return the counters of the cache, from the machine readable statistics
+    of ccache 4 or the summary of ccache 3.
+    """
+    proc = subprocess.run(['ccache', '--print-stats'], stdout=subprocess.PIPE,
+                          stderr=subprocess.DEVNULL, universal_newlines=True)
+    stats = {}
+    if proc.returncode == 0:
+        for line in proc.stdout.splitlines():
+            fields = line.split('\t')
+            if len(fields) == 2 and fields[1].isdigit():
+                stats[fields[0]] = int(fields[1])
+    else:
+        proc = subprocess.run(['ccache', '-s'], stdout=subprocess.PIPE, universal_newlines=True, check=True)
+        for key, title in COUNTERS:
+            match = re.search(r'^%s\s+(\d+)' % (re.escape(title)), proc.stdout, re.MULTILINE)
+            if match:
+                stats[key] = int(match.group(1))
+    return {key: stats.get(key, 0) for key, _ in COUNTERS}
+
+
+def get_report(before: Dict[str, int], after: Dict[str, int]) -> Dict:
+    stats: Dict = {key: after[key] - before.get(key, 0) for key, _ in COUNTERS}
+    hits = stats['direct_cache_hit'] + stats['preprocessed_cache_hit']
+    total = hits + stats['cache_miss']
+    stats['hit_rate'] = round(100.0 * hits / total, 1) if total else 0.0
+    return stats
+
+
+def format_report(stats: Dict) -> str:
+    hits = stats['direct_cache_hit'] + stats['preprocessed_cache_hit']
+    return 'compiler cache: %d hits (%d direct, %d preprocessed), %d misses, %.1f%% hit rate' % (
+        hits, stats['direct_cache_hit'], stats['preprocessed_cache_hit'], stats['cache_miss'], stats['hit_rate'])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Set up the shared compiler cache and report its hit rate')
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.required = True
+
+    env_parser = subparsers.add_parser('env', help='print the ccache settings as shell exports')
+    env_parser.add_argument('--basedir', required=True, help='The directory of the DPDK checkouts')
+
+    snapshot_parser = subparsers.add_parser('snapshot', help='save the statistics of the cache')
+    snapshot_parser.add_argument('snapshot', help='The file to save the statistics to')
+
+    report_parser = subparsers.add_parser('report', help='print the hits and misses since a snapshot')
+    report_parser.add_argument('snapshot', help='The statistics saved before the build')
+    report_parser.add_argument('--record', help='The run record to save the hits and misses in')
+
+    args = parser.parse_args()
+
+    if args.command == 'env':
+        # Without ccache, the builds are not cached
+        if shutil.which('ccache') is None:
+            print('ccache not found, builds are not cached', file=sys.stderr)
+            return
+        os.makedirs(CCACHE_DIR, exist_ok=True)
+        for var, value in sorted(get_env(args.basedir).items()):
+            print('export %s="%s"' % (var, value))
+        return
+
+    try:
+        if args.command == 'snapshot':
+            with open(args.snapshot, 'w') as f:
+                json.dump(read_stats(), f)
+        else:
+            with open(args.snapshot) as f:
+                before = json.load(f)
+            stats = get_report(before, read_stats())
+            print(format_report(stats))
+            if args.record:
+                record = run_record.load_record(args.record)
+                record['compiler_cache'] = stats
+                ci_files.save_json(args.record, record)
+    except (OSError, ValueError, subprocess.CalledProcessError) as e:
+        print('%s: %s' % (args.command, e), file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    ci_profile.start()
+    main()
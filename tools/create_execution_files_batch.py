@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# SPDX-License-Identifier: BSD-3-Clause
+# Copyright 2024 Loongson
+
+"""
+Create the execution files of many series in one run.
+
+Every line read from the input is a series ID followed by its tags. For
+each of them and each testing type, the execution file is the same as the
+one create_new_execution_file_from_tags.py writes for those tags.
+
+Example usage:
+    echo 123 core driver | ./create_execution_files_batch.py config/tests_for_tag.cfg template.ini out/
+    ./create_execution_files_batch.py -i series_tags.txt -t functional config/tests_for_tag.cfg template.ini out/
+"""
+
+import argparse
+import os
+import sys
+
+from create_new_execution_file_from_tags import ExecutionFileGenerator, TestingType
+
+import ci_profile
+
+OUTPUT_NAME = '{series_id}-{testing_type}.ini'
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Create the execution files of every "series_id tag..." line of the input')
+    parser.add_argument('config_file_path', help='The path to tests_for_tag.cfg')
+    parser.add_argument('template_execution_file', help='The path to the execution file to use as a template')
+    parser.add_argument('output_dir', help='The directory to write the execution files to')
+    parser.add_argument('-t', '--testing-type', type=TestingType, choices=list(TestingType), action='append',
+                        help='Only create execution files for this type of testing, may be repeated')
+    parser.add_argument('-i', '--input', type=argparse.FileType('r'), default=sys.stdin,
+                        help='The file to read the records from, the default is stdin')
+    parser.add_argument('--output-name', default=OUTPUT_NAME,
+                        help='The name of the execution files, default: %s' % (OUTPUT_NAME.replace('%', '%%')))
+
+    args = parser.parse_args()
+
+    testing_types = args.testing_type or list(TestingType)
+    generator = ExecutionFileGenerator(args.config_file_path, args.template_execution_file)
+    os.makedirs(args.output_dir, exist_ok=True)
+
+    failed = False
+    for line in args.input:
+        fields = line.split()
+        if not fields:
+            continue
+        series_id, tags = fields[0], fields[1:]
+        for testing_type in testing_types:
+            output_path = os.path.join(args.output_dir,
+                                       args.output_name.format(series_id=series_id, testing_type=testing_type))
+            try:
+                generator.write(output_path, testing_type, tags)
+            except KeyError as e:
+                print(f'Series {series_id}: tag {e} is not present in tests_for_tag.cfg', file=sys.stderr)
+                failed = True
+                break
+            except ValueError as e:
+                print(f'Series {series_id}: {e}', file=sys.stderr)
+                failed = True
+                break
+            print(output_path)
+
+    if failed:
+        exit(1)
+
+
+if __name__ == '__main__':
+    ci_profile.start()
+    main()
@@ -31,31 +31,22 @@
 # THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
 # (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
 # OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
-import sys
+import io
 from enum import Enum
 
 import itertools
 from configparser import ConfigParser
-from typing import List, Dict, Set
+from types import MappingProxyType
+from typing import List, Dict, FrozenSet, Iterable, Mapping, Tuple
 import argparse
 
+import ci_profile
+
 
 def parse_comma_delimited_list_from_string(mod_str: str) -> List[str]:
     return list(map(str.strip, mod_str.split(',')))
 
 
-def map_tags_to_tests(tags: List[str], test_map: Dict[str, List[str]]) -> Set[str]:
-    """
-    Returns a list that is the union of all of the map lookups.
-    """
-    try:
-        return set(
-            filter(lambda test: test != '', set(itertools.chain.from_iterable(map(lambda tag: test_map[tag], tags)))))
-    except KeyError as e:
-        print(f'Tag {e} is not present in tests_for_tag.cfg')
-        exit(1)
-
-
 class TestingType(Enum):
     functional = 'functional'
     performance = 'performance'
@@ -64,7 +55,83 @@ class TestingType(Enum):
         return self.value
 
 
+class ExecutionFileGenerator:
+    """
+    Create execution files for any number of tag sets while reading
+    tests_for_tag.cfg and the template only once.
+
+    The tests of every tag are kept in a frozen index, and the template is
+    parsed again from its cached text for every file so that the output is
+    the same as the one of a separate run of this script.
+    """
+
+    def __init__(self, config_file_path: str, template_execution_file: str):
+        tag_to_test_map_parser = ConfigParser()
+        tag_to_test_map_parser.read(config_file_path)
+
+        self.test_maps: Mapping[TestingType, Mapping[str, FrozenSet[str]]] = MappingProxyType({
+            testing_type: MappingProxyType({
+                key: frozenset(filter(lambda test: test != '', parse_comma_delimited_list_from_string(value.strip())))
+                for key, value in tag_to_test_map_parser[str(testing_type)].items()})
+            for testing_type in TestingType if tag_to_test_map_parser.has_section(str(testing_type))})
+
+        # ConfigParser.read() skips missing files, an empty template does the same
+        try:
+            with open(template_execution_file) as f:
+                self.template = f.read()
+        except OSError:
+            self.template = ''
+
+        self._tests_cache: Dict[Tuple[TestingType, FrozenSet[str]], FrozenSet[str]] = {}
+
+    def get_tests(self, testing_type: TestingType, tags: Iterable[str]) -> FrozenSet[str]:
+        """
+        Returns the union of the tests of the tags, raises KeyError for an
+        unknown tag and ValueError when tests_for_tag.cfg has no section for
+        the testing type.
+        """
+        key = (testing_type, frozenset(tags))
+        tests = self._tests_cache.get(key)
+        if tests is None:
+            if testing_type not in self.test_maps:
+                raise ValueError(f'Section [{testing_type}] is not present in tests_for_tag.cfg')
+            test_map = self.test_maps[testing_type]
+            tests = frozenset(itertools.chain.from_iterable(test_map[tag] for tag in key[1]))
+            self._tests_cache[key] = tests
+        return tests
+
+    def render(self, testing_type: TestingType, tags: Iterable[str]) -> str:
+        tests = self.get_tests(testing_type, tags)
+
+        template_execution_file_parser = ConfigParser()
+        template_execution_file_parser.read_string(self.template)
+
+        for execution_plan in template_execution_file_parser:
+            # The DEFAULT section is always present and contains top-level items, so it needs to be ignored
+            if execution_plan != 'DEFAULT':
+                test_allowlist = parse_comma_delimited_list_from_string(
+                    template_execution_file_parser[execution_plan]['test_suites'])
+                tests_to_run = list(set(test_allowlist).intersection(tests))
+                tests_to_run.sort()
+                template_execution_file_parser[execution_plan]['test_suites'] = ", ".join(tests_to_run)
+
+                if testing_type == TestingType.functional:
+                    template_execution_file_parser[execution_plan]['parameters'] += ':func=true:perf=false'
+                elif testing_type == TestingType.performance:
+                    template_execution_file_parser[execution_plan]['parameters'] += ':func=false:perf=true'
+
+        output = io.StringIO()
+        template_execution_file_parser.write(output)
+        return output.getvalue()
+
+    def write(self, output_path: str, testing_type: TestingType, tags: Iterable[str]) -> None:
+        text = self.render(testing_type, tags)
+        with open(output_path, 'w') as output_file:
+            output_file.write(text)
+
+
 if __name__ == '__main__':
+    ci_profile.start()
     parser = argparse.ArgumentParser(
         description='Take a template execution file and add the relevant tests'
                     ' for the given tags to it, creating a new file.')
@@ -77,38 +144,12 @@ if __name__ == '__main__':
 
     args = parser.parse_args()
 
-    tag_to_test_map_parser = ConfigParser()
-    tag_to_test_map_parser.read(args.config_file_path)
-
-    template_execution_file_parser = ConfigParser()
-    template_execution_file_parser.read(args.template_execution_file)
-
-    test_map = {key: parse_comma_delimited_list_from_string(value.strip()) for key, value in
-                tag_to_test_map_parser[str(args.testing_type)].items()}
-
-    tests = map_tags_to_tests(args.tags, test_map)
-
+    generator = ExecutionFileGenerator(args.config_file_path, args.template_execution_file)
     try:
-        output_file = open(args.output_path, 'x')
-    except FileExistsError:
-        output_file = open(args.output_path, 'w')
-
-    for execution_plan in template_execution_file_parser:
-        # The DEFAULT section is always present and contains top-level items, so it needs to be ignored
-        if execution_plan != 'DEFAULT':
-            test_allowlist = parse_comma_delimited_list_from_string(
-                template_execution_file_parser[execution_plan]['test_suites'])
-            tests_to_run = list(set(test_allowlist).intersection(tests))
-            tests_to_run.sort()
-            template_execution_file_parser[execution_plan]['test_suites'] = ", ".join(tests_to_run)
-
-            if args.testing_type == TestingType.functional:
-                template_execution_file_parser[execution_plan]['parameters'] += ':func=true:perf=false'
-            elif args.testing_type == TestingType.performance:
-                template_execution_file_parser[execution_plan]['parameters'] += ':func=false:perf=true'
-            else:
-                # This code should be unreachable, since this is checked at the top of the file
-                print("Fatal error: testing type is neither performance nor functional", file=sys.stderr)
-                exit(1)
-
-    template_execution_file_parser.write(output_file)
+        generator.write(args.output_path, args.testing_type, args.tags)
+    except KeyError as e:
+        print(f'Tag {e} is not present in tests_for_tag.cfg')
+        exit(1)
+    except ValueError as e:
+        print(e)
+        exit(1)
@@ -14,6 +14,7 @@ print_usage () {
 
 . $(dirname $(readlink -e $0))/load-ci-config.sh
 pwclient=${DPDK_CI_PWCLIENT:-$(dirname $(readlink -m $0))/pwclient}
+pw_url=${DPDK_CI_PW_URL:-http://patches.dpdk.org}
 
 http_get=false
 while getopts gh arg ; do
@@ -32,7 +33,7 @@ if [ -z "$pwid" ] ; then
 fi
 
 if $http_get ; then
-	url="http://patches.dpdk.org/patch/$pwid/mbox/"
+	url="$pw_url/patch/$pwid/mbox/"
 	timeout -s SIGKILL 120s curl -sfL $url
 else
 	timeout -s SIGKILL 120s python3.8 $pwclient view $pwid
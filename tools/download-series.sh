@@ -3,10 +3,13 @@
 # SPDX-License-Identifier: BSD-3-Clause
 # Copyright 2022 Loongson
 
-URL=http://patches.dpdk.org/api/series
+. $(dirname $(readlink -e $0))/load-ci-config.sh
+URL=${DPDK_CI_PW_API_URL:-http://patches.dpdk.org/api}/series
 download_patch=$(dirname $(readlink -e $0))/download-patch.sh
 filter_patch_email=$(dirname $(readlink -e $0))/filter-patch-email.sh
 parse_encoded_file=$(dirname $(readlink -e $0))/parse_encoded_file.py
+parse_email=$(dirname $(readlink -e $0))/parse_email.py
+ci_trace=$(dirname $(readlink -e $0))/ci_trace.py
 
 print_usage() {
 	cat <<- END_OF_HELP
@@ -37,6 +40,19 @@ if [ -z "$series_id" -o -z "$save_dir" ] ; then
 	exit 1
 fi
 
+# Record the time taken and the patches downloaded again in the trace
+download_start=$(date +%s.%N)
+retries=0
+trace_download() {
+	outcome=pass
+	if [ $1 -ne 0 ] ; then
+		outcome=fail
+	fi
+	python3 $ci_trace span download $outcome --start $download_start \
+		--series-id $series_id --retries $retries || true
+}
+trap 'trace_download $?' EXIT
+
 if [ ! -d $save_dir ] ; then
 	mkdir -p $save_dir
 fi
@@ -70,6 +86,7 @@ echo "$ids" > $save_dir/pwid_order.txt
 
 num=$(wc -l $save_dir/pwid_order.txt | awk '{print $1}')
 echo "The number of patch(es) is: $num"
+emails=""
 for id in $ids ; do
 	email=$save_dir/$id.patch
 	if [ ! -f $email ] ; then
@@ -82,6 +99,7 @@ for id in $ids ; do
 		echo "$email lines: $lines"
 		if [ $((lines)) -lt 8 ] ; then
 			echo "download $email"
+			retries=$((retries+1))
 			$download_patch $g_opt $id > $email
 		else
 			downloaded=true
@@ -101,7 +119,11 @@ for id in $ids ; do
 		echo "filter patch email failed: $email"
 		#exit 1
 	fi
-	python3 $parse_encoded_file $email $email
+	emails="$emails $email"
 done
 
+# Decode the mail headers of the whole series in one process
+python3 $parse_encoded_file -i $emails
+python3 $parse_email -d $save_dir
+
 echo "download series done!"
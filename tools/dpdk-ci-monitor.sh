@@ -27,6 +27,7 @@ print_usage() {
 
 get_patch_check=$(dirname $(readlink -e $0))/../tools/get-patch-check.sh
 check_test_results=$(dirname $(readlink -e $0))/../tools/check_test_results.py
+latency_report=$(dirname $(readlink -e $0))/../tools/latency_report.py
 
 project=DPDK
 resource_type=series
@@ -41,6 +42,10 @@ mail_send_interval=30
 
 . $(dirname $(readlink -e $0))/load-ci-config.sh
 sendmail=${DPDK_CI_MAILER:-/usr/sbin/sendmail}
+if ${DPDK_CI_MAIL_QUEUE:-false} ; then
+	# Only queue the mails, mail_queue.py send delivers them
+	sendmail="python3.8 $(dirname $(readlink -e $0))/mail_queue.py enqueue"
+fi
 
 writeheaders () # <subject> <ref> <to> [cc]
 {
@@ -162,7 +167,7 @@ check_series_test_report() {
 			if [ -f $mail_path ] ; then
 				echo "try send build report for $series_id: $mail_path ..."
 				cat $mail_path | $sendmail -f"$smtp_user" -t
-				sleep $mail_send_interval
+				${DPDK_CI_MAIL_QUEUE:-false} || sleep $mail_send_interval
 			else
 				echo "resend failed because test report not existed: $mail_path" >> $tmp_file
 			fi
@@ -186,7 +191,7 @@ check_series_test_report() {
 			if [ -f $mail_path ] ; then
 				echo "try send test report for $series_id: $mail_path ..."
 				cat $mail_path | $sendmail -f"$smtp_user" -t
-				sleep $mail_send_interval
+				${DPDK_CI_MAIL_QUEUE:-false} || sleep $mail_send_interval
 			else
 				echo "resend failed because test report not existed: $mail_path" >> $tmp_file
 			fi
@@ -256,6 +261,19 @@ while true ; do
 	page=$(($page + 1))
 done
 
+# How long the submitters waited for the reports
+latency_file=`mktemp -t ci_monitor.XXXXXX`
+failed=false
+timeout -s SIGKILL 600s python3.8 $latency_report update || echo "update the latency of the reports failed"
+python3.8 $latency_report report > $latency_file || failed=true
+if ! $failed ; then
+	(
+	writeheaders "Latency of the test reports" 'maobibo@loongson.cn' 'lixianglai@loongson.cn, zhoumin@loongson.cn'
+	cat $latency_file
+	) | $sendmail -f"$smtp_user" -t
+fi
+rm -f $latency_file
+
 if test -s $tmp_file ; then
 	(
 	writeheaders "Test reports not found!" 'maobibo@loongson.cn' 'lixianglai@loongson.cn, zhoumin@loongson.cn'
@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# SPDX-License-Identifier: BSD-3-Clause
+# Copyright 2024 Loongson
+
+"""
+Map DPDK source files to their components (lib/<name>,
+drivers/<class>/<name>) and extract the dependencies between components.
+
+The dependencies come from meson introspection of a configured build
+directory when one is available: the include directories of every
+librte_* target name the components it depends on. Otherwise they are
+read from the deps declared in the meson.build files of the checkout.
+
+The result only depends on the tree, so it is cached per base commit in
+data/components/<commit>.json.
+"""
+
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+from typing import Dict, Iterable, List, Optional, Set
+
+import ci_profile
+
+CACHE_DIR = os.path.join(os.path.dirname(os.path.realpath(__file__)), '../data/components')
+
+_deps_regex = re.compile(r'\b(deps|std_deps)\s*\+?=\s*\[([^\]]*)\]', re.DOTALL)
+_quoted_regex = re.compile(r"'([^']+)'")
+
+
+def component_of(path: str) -> Optional[str]:
+    """
+    Return the component a source path belongs to, or None if it is not
+    part of a library or a driver.
+    """
+    parts = path.split('/')
+    if parts[0] == 'lib' and len(parts) > 2:
+        return '/'.join(parts[:2])
+    if parts[0] == 'drivers' and len(parts) > 3:
+        return '/'.join(parts[:3])
+    return None
+
+
+def _read(path: str) -> str:
+    with open(path, 'r', encoding='utf-8', errors='replace') as f:
+        return f.read()
+
+
+def _parse_deps(meson_build: str) -> Dict[str, List[str]]:
+    deps: Dict[str, List[str]] = {}
+    for kind, values in _deps_regex.findall(_read(meson_build)):
+        deps.setdefault(kind, []).extend(_quoted_regex.findall(values))
+    return deps
+
+
+def _list_components(dpdk_dir: str) -> List[str]:
+    components = []
+    lib_dir = os.path.join(dpdk_dir, 'lib')
+    for name in sorted(os.listdir(lib_dir)):
+        if os.path.isfile(os.path.join(lib_dir, name, 'meson.build')):
+            components.append('lib/' + name)
+
+    drivers_dir = os.path.join(dpdk_dir, 'drivers')
+    for dclass in sorted(os.listdir(drivers_dir)):
+        class_dir = os.path.join(drivers_dir, dclass)
+        if not os.path.isdir(class_dir):
+            continue
+        for name in sorted(os.listdir(class_dir)):
+            if os.path.isfile(os.path.join(class_dir, name, 'meson.build')):
+                components.append('drivers/%s/%s' % (dclass, name))
+    return components
+
+
+def resolve_dep_name(name: str, components: Set[str]) -> Optional[str]:
+    """
+    Resolve a meson dependency name ('ring', 'bus_pci', 'common_mlx5') to
+    a component.
+    """
+    if 'lib/' + name in components:
+        return 'lib/' + name
+    dclass, sep, driver = name.partition('_')
+    if sep and 'drivers/%s/%s' % (dclass, driver) in components:
+        return 'drivers/%s/%s' % (dclass, driver)
+    return None
+
+
+def scan_components(dpdk_dir: str) -> Dict:
+    """
+    Walk a checkout and return its components, the headers each of them
+    provides and the components each of them depends on.
+    """
+    components = _list_components(dpdk_dir)
+    known = set(components)
+
+    class_std_deps: Dict[str, List[str]] = {}
+    drivers_dir = os.path.join(dpdk_dir, 'drivers')
+    for dclass in os.listdir(drivers_dir):
+        meson_build = os.path.join(drivers_dir, dclass, 'meson.build')
+        if os.path.isfile(meson_build):
+            class_std_deps[dclass] = _parse_deps(meson_build).get('std_deps', [])
+
+    headers: Dict[str, List[str]] = {}
+    depends: Dict[str, List[str]] = {}
+    for component in components:
+        comp_dir = os.path.join(dpdk_dir, component)
+        names = _parse_deps(os.path.join(comp_dir, 'meson.build')).get('deps', [])
+        if component.startswith('drivers/'):
+            names = class_std_deps.get(component.split('/')[1], []) + names
+        resolved = set(filter(None, (resolve_dep_name(name, known) for name in names)))
+        resolved.discard(component)
+        depends[component] = sorted(resolved)
+
+        for _, _, files in os.walk(comp_dir):
+            for header in files:
+                if header.endswith('.h'):
+                    headers.setdefault(header, []).append(component)
+
+    return {'components': components, 'headers': headers, 'depends': depends}
+
+
+def introspect_depends(build_dir: str, components: List[str]) -> Optional[Dict[str, List[str]]]:
+    """
+    Return the dependencies of the components built in build_dir, or None
+    if meson cannot introspect it.
+    """
+    try:
+        p = subprocess.run(['meson', 'introspect', '--targets', build_dir],
+                           capture_output=True, check=True, timeout=120)
+        targets = json.loads(p.stdout)
+    except (OSError, subprocess.SubprocessError, ValueError) as e:
+        print('meson introspect failed: %s' % (e), file=sys.stderr)
+        return None
+
+    known = set(components)
+    depends: Dict[str, Set[str]] = {}
+    for target in targets:
+        if not target['name'].startswith('rte_'):
+            continue
+        component = resolve_dep_name(target['name'][len('rte_'):], known)
+        if component is None:
+            continue
+
+        deps = depends.setdefault(component, set())
+        for sources in target.get('target_sources', []):
+            for param in sources.get('parameters', []):
+                if not param.startswith('-I'):
+                    continue
+                # Include directories are relative to the build directory,
+                # either in the source tree (../lib/ring) or generated
+                # (lib/ring).
+                path = os.path.normpath(param[2:])
+                while path.startswith('../'):
+                    path = path[3:]
+                dep = component_of(path + '/')
+                if dep is not None and dep in known and dep != component:
+                    deps.add(dep)
+
+    if not depends:
+        return None
+    return {component: sorted(depends.get(component, ())) for component in components}
+
+
+def load_components(dpdk_dir: str, base_commit: Optional[str] = None,
+                    build_dir: Optional[str] = None) -> Dict:
+    """
+    Return scan_components(dpdk_dir), from the cache of base_commit when
+    there is one. When build_dir is given, the dependencies introspected
+    from it replace the cached ones.
+    """
+    cache_file = None
+    if base_commit:
+        cache_file = os.path.join(CACHE_DIR, base_commit + '.json')
+        if os.path.isfile(cache_file) and not build_dir:
+            with open(cache_file) as f:
+                return json.load(f)
+
+    info = scan_components(dpdk_dir)
+    if build_dir:
+        depends = introspect_depends(build_dir, info['components'])
+        if depends is not None:
+            info['depends'] = depends
+            info['introspected'] = True
+
+    if cache_file:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        tmp_file = cache_file + '.tmp'
+        with open(tmp_file, 'w') as f:
+            json.dump(info, f)
+        os.replace(tmp_file, cache_file)
+    return info
+
+
+def get_dependents(info: Dict, changed: Iterable[str]) -> Set[str]:
+    """
+    Return the changed components plus every component depending on them,
+    directly or not.
+    """
+    reverse: Dict[str, Set[str]] = {}
+    for component, deps in info['depends'].items():
+        for dep in deps:
+            reverse.setdefault(dep, set()).add(component)
+
+    result = set(changed)
+    pending = list(result)
+    while pending:
+        for dependent in reverse.get(pending.pop(), ()):
+            if dependent not in result:
+                result.add(dependent)
+                pending.append(dependent)
+    return result
+
+
+def get_dependencies(info: Dict, components: Iterable[str]) -> Set[str]:
+    """
+    Return the given components plus every component they depend on,
+    directly or not.
+    """
+    result = set(components)
+    pending = list(result)
+    while pending:
+        for dep in info['depends'].get(pending.pop(), ()):
+            if dep not in result:
+                result.add(dep)
+                pending.append(dep)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Show the components of a DPDK checkout and their dependencies')
+    parser.add_argument('dpdk_dir', help='The path to the DPDK checkout')
+    parser.add_argument('--base', help='The base commit to cache the result for')
+    parser.add_argument('--build-dir', help='A configured build directory to introspect')
+    parser.add_argument('--dependents', metavar='component', nargs='*',
+                        help='print the given components and all their dependents')
+
+    args = parser.parse_args()
+
+    info = load_components(args.dpdk_dir, args.base, args.build_dir)
+    if args.dependents is not None:
+        print('\n'.join(sorted(get_dependents(info, args.dependents))))
+    else:
+        json.dump(info['depends'], sys.stdout, indent=4, sort_keys=True)
+        print()
+
+
+if __name__ == '__main__':
+    ci_profile.start()
+    main()
@@ -6,6 +6,8 @@
 
 import sys
 
+import ci_profile
+
 def is_contain_chinese(check_str):
     for ch in check_str:
         if u'\u4e00' <= ch <= u'\u9fff':
@@ -15,30 +17,25 @@ def is_contain_chinese(check_str):
 def is_contain_8bit(check_str):
     return len(check_str) != len(check_str.encode())
 
-def main():
-    if len(sys.argv) != 2:
-        sys.exit(0)
-
-    mailaddr = sys.argv[1]
-    #print(mailaddr)
+def format_mail_address(mailaddr):
     a = mailaddr.find("<")
     b = mailaddr.find(">")
 
-    if is_contain_chinese(mailaddr):
+    if is_contain_chinese(mailaddr) or is_contain_8bit(mailaddr):
         if a == -1 or b == -1 or b <= a:
-            print(mailaddr)
-        else:
-            print(mailaddr[a + 1 : b])
-        return
+            return mailaddr
+        return mailaddr[a + 1 : b]
 
-    if is_contain_8bit(mailaddr):
-        if a == -1 or b == -1 or b <= a:
-            print(mailaddr)
-        else:
-            print(mailaddr[a + 1 : b])
-        return
+    return mailaddr
 
-    print(mailaddr)
+def main():
+    if len(sys.argv) != 2:
+        sys.exit(0)
+
+    mailaddr = sys.argv[1]
+    #print(mailaddr)
+    print(format_mail_address(mailaddr))
 
 if __name__ == "__main__":
+    ci_profile.start()
     main()
@@ -3,21 +3,29 @@
 # SPDX-License-Identifier: BSD-3-Clause
 # Copyright 2022 Loongson
 
+build_log_excerpt=$(dirname $(readlink -e $0))/../tools/build_log_excerpt.py
+
 getheader() # <header_name> <email_file>
 {
 	sed "/^$1: */!d;s///;N;s,\n[[:space:]]\+, ,;s,\n.*,,;q" "$2" |
 	sed 's,",\\",g'
 }
 
-get_submitter() {
-	prefix="X-Patchwork-Submitter"
-	sed "/^${prefix}: */!d;s///;N;s,\n[[:space:]]\+, ,;s,\n.*,,;q" "$1" |
-	sed 's,",,g'
+# Set subject, from, msgid, pwid, listid, reply, submitter and date from
+# the headers of an email, using the <pwid>.headers file written by
+# parse_email.py -d when it exists.
+load_email_headers() # <email_file>
+{
+	headers_file=${1%.patch}.headers
+	if [ -f "$headers_file" ] ; then
+		eval "$(cat $headers_file)"
+	else
+		eval "$($parse_email "$1")"
+	fi
 }
 
 write_patch_info() {
-	submitter=$(get_submitter "$1")
-	date=$(getheader Date "$1")
+	load_email_headers "$1"
 
 	echo "Submitter: $submitter"
 	echo "Date: $date"
@@ -117,19 +125,7 @@ write_meson_build_error_log() {
 	echo "Meson build logs:"
 	echo "-------------------------------BEGIN LOGS----------------------------"
 
-	start_print=false
-	while read line ; do
-		if $start_print ; then
-			echo $line
-			continue
-		fi
-
-		if echo $line | grep -q "\--- stderr ---" ; then
-			start_print=true
-			echo $line
-			continue
-		fi
-	done < $log
+	python3 $build_log_excerpt meson $log || sed -n '/--- stderr ---/,$p' $log
 
 	echo "-------------------------------END LOGS------------------------------"
 
@@ -141,19 +137,7 @@ write_ninja_build_error_log() {
 	echo "Ninja build logs:"
 	echo "-------------------------------BEGIN LOGS----------------------------"
 
-	start_print=false
-	while read line ; do
-		if $start_print ; then
-			echo $line
-			continue
-		fi
-
-		if echo $line | grep -q "FAILED:" ; then
-			start_print=true
-			echo $line
-			continue
-		fi
-	done < $log
+	python3 $build_log_excerpt ninja $log || sed -n '/FAILED:/,$p' $log
 
 	echo "-------------------------------END LOGS------------------------------"
 }
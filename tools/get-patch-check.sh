@@ -29,7 +29,8 @@ if [ -z "$pwid" ] ; then
 	exit 1
 fi
 
-URL=http://patches.dpdk.org/api/patches/$pwid/checks/
+. $(dirname $(readlink -e $0))/load-ci-config.sh
+URL=${DPDK_CI_PW_API_URL:-http://patches.dpdk.org/api}/patches/$pwid/checks/
 if $verbose ; then
 	echo "request: $URL"
 fi
@@ -6,12 +6,17 @@
 import argparse
 import datetime
 import json
+import os
 import re
 from json import JSONEncoder
 from typing import Dict, List, Set, Optional, Tuple
 
 import requests
 
+import ci_profile
+
+PW_API_URL = os.environ.get("DPDK_CI_PW_API_URL", "http://patches.dpdk.org/api")
+
 
 class JSONSetEncoder(JSONEncoder):
     """Custom JSON encoder to handle sets.
@@ -86,7 +91,7 @@ class RerunProcessor:
         self._multipage = multipage
 
     def process_reruns(self) -> None:
-        patchwork_url = f"http://patches.dpdk.org/api/events/?since={self._time_since}"
+        patchwork_url = f"{PW_API_URL}/events/?since={self._time_since}"
         comment_request_info = []
         for item in [
             "&category=cover-comment-created",
@@ -101,7 +106,7 @@ class RerunProcessor:
                 response.raise_for_status()
                 comment_request_info.extend(response.json())
 
-        rerun_processor.process_comment_info(comment_request_info)
+        self.process_comment_info(comment_request_info)
 
     def process_comment_info(self, list_of_comment_blobs: List[Dict]) -> None:
         """Takes the list of json blobs of comment information and associates
@@ -218,6 +223,7 @@ class RerunProcessor:
 
 
 if __name__ == "__main__":
+    ci_profile.start()
     parser = argparse.ArgumentParser(description="Help text for getting reruns")
     parser.add_argument(
         "-ts",
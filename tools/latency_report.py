@@ -0,0 +1,407 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# SPDX-License-Identifier: BSD-3-Clause
+# Copyright 2024 Loongson
+
+"""
+Report the latency from the completion of a series on Patchwork to the
+loongarch checks of its patches, the time submitters wait for our results.
+
+'update' reads the series-completed events since its previous run, the
+creation dates of the loongarch checks on the first and last patches of
+each series, and the spans of the local stages from ci_trace.py. A series
+is done when its last check is posted: the unit testing one, or the
+compilation one when the build failed. The passing check of the affected
+tests only is followed by the one of the whole suite, unless
+DPDK_CI_TEST_IMPACT_FULL is false. A series without its last check after
+PENDING_DAYS is counted as missed.
+
+The latencies are counted in histograms with logarithmic bins, per day,
+per series size and per outcome, so percentiles are estimated within 5%
+from a bounded state, however long the history. The slowest series are
+kept with the stage they spent the most time in. The state is saved in
+data/latency_state.json and the trace is read from where the previous
+update stopped. 'report' prints the p50, p90 and p99 latencies and the
+outliers.
+
+Example usage:
+    ./latency_report.py update
+    ./latency_report.py report --days 14 --top 10
+"""
+
+import argparse
+import datetime
+import heapq
+import json
+import math
+import os
+import sys
+import time
+from typing import Dict, List, Optional, Tuple
+
+import requests
+
+import ci_files
+import ci_profile
+import ci_trace
+
+PW_API_URL = os.environ.get('DPDK_CI_PW_API_URL', 'http://patches.dpdk.org/api')
+DATA_DIR = os.path.join(os.path.dirname(os.path.realpath(__file__)), '../data')
+STATE_FILE = os.path.join(DATA_DIR, 'latency_state.json')
+
+PROJECT = 'DPDK'
+COMPILATION_CONTEXT = 'loongarch-compilation'
+UNIT_TESTING_CONTEXT = 'loongarch-unit-testing'
+# The description of the report of the affected tests in test-series.sh
+SUBSET_DESCRIPTION = '(affected tests only)'
+TEST_IMPACT_FULL = os.environ.get('DPDK_CI_TEST_IMPACT_FULL', 'true') != 'false'
+
+DATE_FORMAT = '%Y-%m-%dT%H:%M:%S'
+
+# Days to wait for the checks of a series before counting it as missed
+PENDING_DAYS = 2
+# Days of history of the first update
+FIRST_UPDATE_DAYS = 7
+# Days kept in the per day histograms
+KEEP_DAYS = 400
+# Outliers kept in the state
+MAX_OUTLIERS = 100
+# Series whose stage durations are kept until their checks come
+MAX_TRACKED = 5000
+
+# The bins of the histograms grow by 10%, the middle of a bin is within 5%
+# of any value in it
+BIN_BASE = 1.1
+
+# Upper bounds of the series size classes, in patches
+SIZE_CLASSES = ((1, '1'), (4, '2-4'), (9, '5-9'), (19, '10-19'), (None, '20+'))
+
+
+def parse_date(date: str) -> float:
+    value = datetime.datetime.strptime(date.split('.')[0], DATE_FORMAT)
+    return value.replace(tzinfo=datetime.timezone.utc).timestamp()
+
+
+def format_date(timestamp: float) -> str:
+    return datetime.datetime.fromtimestamp(timestamp, datetime.timezone.utc).strftime(DATE_FORMAT)
+
+
+def get_size_class(patches: int) -> str:
+    for bound, name in SIZE_CLASSES:
+        if bound is None or patches <= bound:
+            return name
+    return SIZE_CLASSES[-1][1]
+
+
+class Histogram:
+    """
+    Counts of latencies in logarithmic bins, stored sparsely.
+    """
+
+    def __init__(self, data: Optional[Dict] = None):
+        data = data or {}
+        self.bins: Dict[str, int] = data.get('bins', {})
+        self.count: int = data.get('count', 0)
+        self.sum: float = data.get('sum', 0.0)
+
+    def add(self, value: float) -> None:
+        key = str(int(math.log(max(value, 1.0), BIN_BASE)))
+        self.bins[key] = self.bins.get(key, 0) + 1
+        self.count += 1
+        self.sum += value
+
+    def merge(self, other: 'Histogram') -> None:
+        for key, count in other.bins.items():
+            self.bins[key] = self.bins.get(key, 0) + count
+        self.count += other.count
+        self.sum += other.sum
+
+    def percentile(self, percent: float) -> float:
+        rank = max(math.ceil(self.count * percent / 100), 1)
+        seen = 0
+        for key in sorted(self.bins, key=int):
+            seen += self.bins[key]
+            if seen >= rank:
+                # The geometric middle of the bin
+                return BIN_BASE ** (int(key) + 0.5)
+        return 0.0
+
+    def to_dict(self) -> Dict:
+        return {'bins': self.bins, 'count': self.count, 'sum': round(self.sum, 1)}
+
+
+class LatencyState:
+    def __init__(self, path: str = STATE_FILE):
+        self.path = path
+        data: Dict = ci_files.load_json(path, {})
+        self.since: Optional[str] = data.get('since')
+        # Series waiting for their checks, by ID
+        self.pending: Dict[str, Dict] = data.get('pending', {})
+        # Completion time of the series already read, to skip the events
+        # returned again by the next update
+        self.seen: Dict[str, float] = data.get('seen', {})
+        self.groups: Dict[str, Dict[str, Histogram]] = {
+            group: {key: Histogram(value) for key, value in histograms.items()}
+            for group, histograms in data.get('groups', {'day': {}, 'size': {}, 'outcome': {}}).items()
+        }
+        self.outcomes: Dict[str, int] = data.get('outcomes', {})
+        self.outliers: List[List] = data.get('outliers', [])
+        self.trace: Dict = data.get('trace', {'inode': None, 'offset': 0})
+        # Seconds spent in each stage by the recent series
+        self.stages: Dict[str, Dict[str, float]] = data.get('stages', {})
+
+    def save(self) -> None:
+        data = {
+            'since': self.since,
+            'pending': self.pending,
+            'seen': self.seen,
+            'groups': {group: {key: histogram.to_dict() for key, histogram in histograms.items()}
+                       for group, histograms in self.groups.items()},
+            'outcomes': self.outcomes,
+            'outliers': self.outliers,
+            'trace': self.trace,
+            'stages': self.stages,
+        }
+        ci_files.save_json(self.path, data, indent=None)
+
+    def add_span(self, event: Dict) -> None:
+        series_id = event.get('series_id')
+        if not series_id:
+            return
+        stages = self.stages.pop(series_id, {})
+        stages[event['stage']] = stages.get(event['stage'], 0.0) + event['duration']
+        # Most recent last, the oldest are dropped first
+        self.stages[series_id] = stages
+        while len(self.stages) > MAX_TRACKED:
+            del self.stages[next(iter(self.stages))]
+
+    def read_trace(self) -> None:
+        """
+        Read the spans added to the trace of ci_trace.py since the previous
+        update.
+        """
+        path = ci_trace.TRACE_FILE
+        if not os.path.isfile(path):
+            return
+        inode = os.stat(path).st_ino
+        if inode != self.trace['inode']:
+            rotated = path + '.1'
+            if self.trace['inode'] is not None and os.path.isfile(rotated) \
+                    and os.stat(rotated).st_ino == self.trace['inode']:
+                self.read_spans(rotated, self.trace['offset'])
+            self.trace = {'inode': inode, 'offset': 0}
+        self.trace['offset'] = self.read_spans(path, self.trace['offset'])
+
+    def read_spans(self, path: str, offset: int) -> int:
+        with open(path, 'rb') as f:
+            f.seek(offset)
+            for line in f:
+                if not line.endswith(b'\n'):
+                    break
+                offset += len(line)
+                try:
+                    self.add_span(json.loads(line))
+                except (ValueError, KeyError, TypeError):
+                    continue
+        return offset
+
+    def get_bottleneck(self, series_id: str) -> Tuple[str, float]:
+        stages = self.stages.pop(series_id, {})
+        if not stages:
+            return 'unknown', 0.0
+        stage = max(stages, key=lambda name: stages[name])
+        return stage, round(stages[stage], 1)
+
+    def add_result(self, series_id: str, series: Dict, outcome: str, latency: Optional[float]) -> None:
+        self.outcomes[outcome] = self.outcomes.get(outcome, 0) + 1
+        if latency is None:
+            self.stages.pop(series_id, None)
+            return
+        day = format_date(series['completed'])[:10]
+        for group, key in (('day', day), ('size', get_size_class(series['patches'])), ('outcome', outcome)):
+            self.groups[group].setdefault(key, Histogram()).add(latency)
+
+        stage, duration = self.get_bottleneck(series_id)
+        outlier = [round(latency, 1), series_id, day, outcome, stage, duration]
+        if len(self.outliers) < MAX_OUTLIERS:
+            heapq.heappush(self.outliers, outlier)
+        else:
+            heapq.heappushpop(self.outliers, outlier)
+
+    def prune(self, now: float) -> None:
+        oldest_day = format_date(now - KEEP_DAYS * 86400)[:10]
+        for day in [day for day in self.groups['day'] if day < oldest_day]:
+            del self.groups['day'][day]
+        since = parse_date(self.since) if self.since else now
+        for series_id in [sid for sid, completed in self.seen.items() if completed < since - PENDING_DAYS * 86400]:
+            del self.seen[series_id]
+
+
+class PatchworkReader:
+    def __init__(self):
+        self.session = requests.Session()
+
+    def get_all(self, url: str, params: Optional[Dict[str, str]] = None) -> List[Dict]:
+        items: List[Dict] = []
+        next_url: Optional[str] = url
+        while next_url:
+            response = self.session.get(next_url, params=params, timeout=60)
+            response.raise_for_status()
+            items += response.json()
+            next_url = response.links.get('next', {}).get('url')
+            params = None
+        return items
+
+    def get_completed(self, since: str) -> List[Dict]:
+        events = self.get_all('%s/events/' % (PW_API_URL), {'category': 'series-completed', 'since': since})
+        return [event for event in events if (event.get('project') or {}).get('name') == PROJECT]
+
+    def get_series(self, series_id: str) -> Dict:
+        response = self.session.get('%s/series/%s/' % (PW_API_URL, series_id), timeout=60)
+        response.raise_for_status()
+        return response.json()
+
+    def get_checks(self, patch_id: int) -> List[Dict]:
+        return self.get_all('%s/patches/%d/checks/' % (PW_API_URL, patch_id))
+
+
+def get_last_check(checks: List[Dict]) -> Optional[Dict]:
+    """
+    Return the check which ends the testing of a series, None if the
+    series is still being tested.
+    """
+    unit_testing = [check for check in checks if check['context'] == UNIT_TESTING_CONTEXT]
+    if TEST_IMPACT_FULL:
+        # The whole suite runs after the affected tests passed
+        unit_testing = [check for check in unit_testing
+                        if check['state'] != 'success' or SUBSET_DESCRIPTION not in (check.get('description') or '')]
+    if unit_testing:
+        return max(unit_testing, key=lambda check: check['date'])
+    compilation = [check for check in checks if check['context'] == COMPILATION_CONTEXT]
+    # No unit testing follows a failed apply or build
+    failed = [check for check in compilation if check['state'] in ('warning', 'fail')]
+    if failed:
+        return max(failed, key=lambda check: check['date'])
+    return None
+
+
+def update(state: LatencyState, reader: PatchworkReader) -> int:
+    """
+    Read the new series and the checks of the pending ones, return the
+    number of series done.
+    """
+    now = time.time()
+    state.read_trace()
+
+    since = state.since or format_date(now - FIRST_UPDATE_DAYS * 86400)
+    newest = since
+    for event in reader.get_completed(since):
+        series_id = str(event['payload']['series']['id'])
+        newest = max(newest, event['date'].split('.')[0])
+        if series_id in state.seen:
+            continue
+        series = reader.get_series(series_id)
+        completed = parse_date(event['date'])
+        state.seen[series_id] = completed
+        patches = [patch['id'] for patch in series.get('patches', [])]
+        if patches:
+            state.pending[series_id] = {'completed': completed, 'patches': len(patches),
+                                        'first': patches[0], 'last': patches[-1]}
+    # Only once all the events were read, an error reads them again
+    state.since = newest
+
+    done = 0
+    for series_id, series in list(state.pending.items()):
+        checks = reader.get_checks(series['last'])
+        if series['first'] != series['last']:
+            # The apply failures are reported on the first patch
+            checks += reader.get_checks(series['first'])
+        check = get_last_check(checks)
+        if check is not None:
+            latency = max(parse_date(check['date']) - series['completed'], 0.0)
+            state.add_result(series_id, series, check['state'], latency)
+        elif now - series['completed'] > PENDING_DAYS * 86400:
+            state.add_result(series_id, series, 'missed', None)
+        else:
+            continue
+        del state.pending[series_id]
+        done += 1
+
+    state.prune(now)
+    return done
+
+
+def format_duration(seconds: float) -> str:
+    if seconds >= 3600:
+        return '%.1fh' % (seconds / 3600)
+    if seconds >= 60:
+        return '%.0fm' % (seconds / 60)
+    return '%.0fs' % (seconds)
+
+
+def format_table(title: str, histograms: Dict[str, Histogram]) -> List[str]:
+    lines = [title, '%-12s %8s %8s %8s %8s' % ('', 'series', 'p50', 'p90', 'p99')]
+    for key, histogram in histograms.items():
+        lines.append('%-12s %8d %8s %8s %8s' % (key, histogram.count, format_duration(histogram.percentile(50)),
+                                                format_duration(histogram.percentile(90)),
+                                                format_duration(histogram.percentile(99))))
+    return lines + ['']
+
+
+def format_report(state: LatencyState, days: int, top: int) -> str:
+    oldest_day = format_date(time.time() - days * 86400)[:10]
+    day_histograms = {day: histogram for day, histogram in sorted(state.groups['day'].items())
+                      if day >= oldest_day}
+    total = Histogram()
+    for histogram in day_histograms.values():
+        total.merge(histogram)
+    day_histograms['all'] = total
+
+    sizes = dict((name, state.groups['size'][name]) for _, name in SIZE_CLASSES if name in state.groups['size'])
+
+    lines = ['Latency from the series completion to the last loongarch check', '']
+    lines += format_table('Per day, last %d days:' % (days), day_histograms)
+    lines += format_table('Per series size, in patches:', sizes)
+    lines += format_table('Per outcome:', dict(sorted(state.groups['outcome'].items())))
+    lines.append('Series: %s, %d pending' % (
+        ', '.join('%d %s' % (count, outcome) for outcome, count in sorted(state.outcomes.items())),
+        len(state.pending)))
+    lines += ['', 'Slowest series:']
+    for latency, series_id, day, outcome, stage, duration in heapq.nlargest(top, state.outliers):
+        lines.append('  series %s on %s: %s, %s, bottleneck %s (%s)' % (
+            series_id, day, format_duration(latency), outcome, stage, format_duration(duration)))
+    return '\n'.join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Report the latency of the loongarch checks of the series')
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.required = True
+
+    subparsers.add_parser('update', help='read the new series, checks and stage spans')
+
+    report_parser = subparsers.add_parser('report', help='print the latency percentiles and outliers')
+    report_parser.add_argument('--days', type=int, default=14, help='The days listed, default: 14')
+    report_parser.add_argument('--top', type=int, default=10, help='The outliers listed, default: 10')
+
+    args = parser.parse_args()
+
+    state = LatencyState()
+    if args.command == 'update':
+        try:
+            done = update(state, PatchworkReader())
+        except (requests.RequestException, ValueError, KeyError) as e:
+            print('update: %s' % (e), file=sys.stderr)
+            # Keep what was read until the error
+            state.save()
+            sys.exit(1)
+        state.save()
+        print('%d series done, %d pending' % (done, len(state.pending)))
+    else:
+        print(format_report(state, args.days, args.top))
+
+
+if __name__ == '__main__':
+    ci_profile.start()
+    main()
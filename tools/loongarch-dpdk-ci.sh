@@ -7,6 +7,10 @@ DEBUG=false
 project=DPDK
 resource_type=series
 test_series=$(dirname $(readlink -e $0))/test-series.sh
+ci_queue=$(dirname $(readlink -e $0))/ci_queue.py
+mail_queue=$(dirname $(readlink -e $0))/mail_queue.py
+mirror_fetcher=$(dirname $(readlink -e $0))/mirror_fetcher.py
+ci_trace=$(dirname $(readlink -e $0))/ci_trace.py
 series_id_file=$(dirname $(readlink -e $0))/../data/series_to_test.txt
 last_recheck_file=$(dirname $(readlink -e $0))/../data/last_recheck.txt
 recheck_db_file=$(dirname $(readlink -e $0))/../data/recheck_db.txt
@@ -82,6 +86,25 @@ fi
 
 setup
 
-$(dirname $(readlink -e $0))/poll-pw $resource_type $project $SINCE_FILE $test_series
+. $(dirname $(readlink -e $0))/load-ci-config.sh
+if ${DPDK_CI_MAIL_QUEUE:-false} ; then
+	# Send the reports queued by the jobs while they run, and those still
+	# queued when the jobs are done before exiting
+	python3.8 $mail_queue send --watch &
+	mail_sender=$!
+	trap "kill $mail_sender 2>/dev/null; wait $mail_sender" EXIT
+fi
+if ${DPDK_CI_MIRROR:-false} ; then
+	# Update the mirrors of the trees while the jobs run
+	python3.8 $mirror_fetcher fetch >/dev/null &
+fi
+
+# New series and rechecks are queued, then run shortest first
+python3.8 $(dirname $(readlink -e $0))/poll_pw.py $resource_type $project $SINCE_FILE
+#$(dirname $(readlink -e $0))/poll-pw $resource_type $project $SINCE_FILE python3.8 $ci_queue push series
 #$(dirname $(readlink -e $0))/poll-file $resource_type $series_id_file $test_series -k
 python3.8 $(dirname $(readlink -e $0))/recheck.py $last_recheck_file $recheck_db_file
+python3.8 $ci_queue run
+
+# Export the metrics of the stages run, for Prometheus
+python3 $ci_trace export || true
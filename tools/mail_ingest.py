@@ -0,0 +1,401 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# SPDX-License-Identifier: BSD-3-Clause
+# Copyright 2024 Loongson
+
+"""
+Detect new series and recheck requests from the mails received from the
+DPDK lists, instead of polling the Patchwork events and comments.
+
+The messages of a Maildir or an mbox file are read incrementally and
+indexed by Message-Id in data/mail_index.json. A series is complete when
+all the [PATCH n/m] of a thread and version are there; it is then mapped
+to its Patchwork series ID with one request by Message-Id and pushed to
+ci_queue.py, unless poll_pw.py already handled it. A reply containing a
+Recheck-request line, matched with RerunProcessor.regex, queues a
+retest-series.sh of the series it replies to, like recheck.py. Both record
+the rechecks in data/recheck_db.txt under different dates, so recheck.py
+must not run on the same requests: ci_supervisor.py does not run it with
+--mail.
+
+The first time a source is read, its existing mails are skipped: they
+arrived before the ingestion started and the polls handled them. The mails
+older than INDEX_DAYS are ignored.
+
+Example usage:
+    ./mail_ingest.py ~/Maildir/dpdk-dev
+    ./mail_ingest.py --watch --interval 5 /var/mail/dpdk
+"""
+
+import argparse
+import datetime
+import email
+import email.policy
+import email.utils
+import mailbox
+import os
+import re
+import sys
+import time
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import requests
+
+import ci_files
+import ci_profile
+import ci_queue
+import poll_pw
+import recheck
+from get_reruns import RerunProcessor
+
+PW_API_URL = os.environ.get('DPDK_CI_PW_API_URL', 'http://patches.dpdk.org/api')
+TOOLS_DIR = os.path.dirname(os.path.realpath(__file__))
+DATA_DIR = os.path.join(TOOLS_DIR, '../data')
+INDEX_FILE = os.path.join(DATA_DIR, 'mail_index.json')
+RECHECK_DB_FILE = os.path.join(DATA_DIR, 'recheck_db.txt')
+RETEST_SERIES = os.path.join(TOOLS_DIR, 'retest-series.sh')
+
+RECHECK_CONTEXTS = ['loongarch-compilation', 'loongarch-unit-testing']
+
+# Forget the messages and series older than this
+INDEX_DAYS = 14
+# Patchwork may not have parsed the mails yet, retry the mapping this long
+# and this often
+MAPPING_HOURS = 6
+MAPPING_RETRY = 60
+
+_patch_prefix_regex = re.compile(r'^\s*\[([^\]]*\bPATCH\b[^\]]*)\]', re.IGNORECASE)
+_part_regex = re.compile(r'\b(\d+)/(\d+)\b')
+_version_regex = re.compile(r'\bv(\d+)\b', re.IGNORECASE)
+
+DATE_FORMAT = '%Y-%m-%dT%H:%M:%S'
+
+
+def parse_patch_subject(subject: str) -> Optional[Tuple[int, int, int]]:
+    """
+    Return (version, part, total) of a patch subject, None if the subject
+    is not the one of a patch.
+    """
+    match = _patch_prefix_regex.match(subject)
+    if match is None:
+        return None
+    prefix = match.group(1)
+    part = _part_regex.search(prefix)
+    version = _version_regex.search(prefix)
+    return (int(version.group(1)) if version else 1,
+            int(part.group(1)) if part else 1,
+            int(part.group(2)) if part else 1)
+
+
+def _msgids(value: Optional[str]) -> List[str]:
+    return re.findall(r'<([^>]+)>', str(value or ''))
+
+
+def _get_body(msg: email.message.EmailMessage) -> str:
+    part = msg.get_body(preferencelist=('plain',))
+    if part is None:
+        return ''
+    try:
+        return part.get_content()
+    except (LookupError, ValueError):
+        return ''
+
+
+def _utcnow() -> datetime.datetime:
+    # The dates of the index are in UTC, without a timezone
+    return datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+
+
+def _get_date(msg: email.message.EmailMessage) -> str:
+    try:
+        date = email.utils.parsedate_to_datetime(str(msg['Date']))
+        if date.tzinfo is not None:
+            date = date.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    except (TypeError, ValueError):
+        date = _utcnow()
+    return date.strftime(DATE_FORMAT)
+
+
+def _get_limit() -> str:
+    """
+    Return the date of the oldest mails kept in the index.
+    """
+    return (_utcnow() - datetime.timedelta(days=INDEX_DAYS)).strftime(DATE_FORMAT)
+
+
+class MailSource:
+    """
+    Yield the raw messages added to a Maildir or an mbox file since the
+    previous call, remembering the position in state.
+    """
+
+    def __init__(self, path: str, state: Dict):
+        self.path = path
+        self.state = state
+
+    def read_new(self) -> Iterator[bytes]:
+        if os.path.isdir(self.path):
+            yield from self._read_maildir()
+        elif os.path.isfile(self.path):
+            yield from self._read_mbox()
+
+    def _read_maildir(self) -> Iterator[bytes]:
+        box = mailbox.Maildir(self.path, factory=None, create=False)
+        keys = set(box.keys())
+        if 'seen' not in self.state:
+            # First read, start after the existing mails
+            self.state['seen'] = sorted(keys)
+            return
+        seen = set(self.state['seen'])
+        for key in sorted(keys - seen):
+            try:
+                yield box.get_bytes(key)
+            except KeyError:
+                # Removed in the meantime
+                continue
+            seen.add(key)
+        # Only remember the keys still in the Maildir
+        self.state['seen'] = sorted(seen & keys)
+
+    def _read_mbox(self) -> Iterator[bytes]:
+        if 'offset' not in self.state:
+            # First read, start after the existing mails
+            self.state['offset'] = os.path.getsize(self.path)
+            return
+        offset = self.state['offset']
+        if os.path.getsize(self.path) < offset:
+            # The mbox was rotated or truncated
+            offset = 0
+        with open(self.path, 'rb') as f:
+            f.seek(offset)
+            data = f.read()
+
+        starts = [m.start() for m in re.finditer(rb'^From ', data, re.MULTILINE)]
+        if not starts:
+            return
+        # The last message may still be written, wait for its end
+        ends = starts[1:] + ([len(data)] if data.endswith(b'\n\n') else [])
+        for start, end in zip(starts, ends):
+            message = data[start:end]
+            yield message[message.index(b'\n') + 1:]
+            self.state['offset'] = offset + end
+
+
+class MailIngester:
+    def __init__(self, sources: List[str], index_file: str = INDEX_FILE):
+        self.index_file = index_file
+        self.index: Dict = {'sources': {}, 'messages': {}, 'series': {}}
+        self.index.update(ci_files.load_json(index_file, {}))
+        self.sources = [MailSource(path, self.index['sources'].setdefault(path, {})) for path in sources]
+        self.session = requests.Session()
+        self.handled = poll_pw.IdStore(os.path.join(DATA_DIR, 'poll_pw_series_ids'))
+        self.rerun_processor = RerunProcessor(RECHECK_CONTEXTS, '', False)
+        self.api_calls = 0
+
+    def save(self) -> None:
+        ci_files.save_json(self.index_file, self.index, indent=None)
+
+    def _api_get(self, resource: str, msgid: str) -> List[Dict]:
+        self.api_calls += 1
+        response = self.session.get('%s/%s/' % (PW_API_URL, resource), params={'msgid': msgid}, timeout=60)
+        response.raise_for_status()
+        return response.json()
+
+    def get_series_id(self, msgid: str) -> Optional[str]:
+        """
+        Return the Patchwork series of the patch or cover letter msgid.
+        """
+        for resource in ('patches', 'covers'):
+            for item in self._api_get(resource, msgid):
+                if item.get('series'):
+                    return str(item['series'][0]['id'])
+        return None
+
+    def add_message(self, raw: bytes) -> None:
+        msg = email.message_from_bytes(raw, policy=email.policy.default)
+        msgids = _msgids(msg['Message-Id'])
+        if not msgids or msgids[0] in self.index['messages']:
+            return
+        msgid = msgids[0]
+        subject = ' '.join(str(msg['Subject'] or '').split())
+        references = _msgids(msg['References'])
+        in_reply_to = _msgids(msg['In-Reply-To'])
+        date = _get_date(msg)
+        if date < _get_limit():
+            return
+        info: Dict = {'date': date}
+        self.index['messages'][msgid] = info
+
+        patch = None if subject.lower().startswith('re:') else parse_patch_subject(subject)
+        if patch is not None:
+            version, part, total = patch
+            root = (references or in_reply_to or [msgid])[0]
+            key = '%s v%d %d' % (root, version, total)
+            info['series'] = key
+            series = self.index['series'].setdefault(key, {'total': total, 'parts': {}, 'files': [], 'date': date})
+            series['parts'][str(part)] = msgid
+            if part > 0:
+                body = _get_body(msg)
+                files = set(series['files'])
+                files.update(re.findall(r'^diff --git a/(\S+)', body, re.MULTILINE))
+                series['files'] = sorted(files)
+            return
+
+        if in_reply_to:
+            args, labels = self.rerun_processor.get_test_names_and_parameters(_get_body(msg))
+            if labels or (args and RerunProcessor._VALID_ARGS.issuperset(args.keys())):
+                info['recheck'] = {'reply_to': in_reply_to[0], 'args': args}
+
+    def is_expired(self, date: str) -> bool:
+        """
+        Tell if Patchwork should have parsed a mail of that date by now.
+        """
+        age = _utcnow() - datetime.datetime.strptime(date, DATE_FORMAT)
+        return age > datetime.timedelta(hours=MAPPING_HOURS)
+
+    def is_complete(self, series: Dict) -> bool:
+        return all(str(part) in series['parts'] for part in range(1, series['total'] + 1))
+
+    def queue_series(self) -> List[str]:
+        queued = []
+        for key, series in self.index['series'].items():
+            if series.get('id') or series.get('failed') or not self.is_complete(series):
+                continue
+            if series.get('retry', 0) > time.time():
+                continue
+            try:
+                # The last patch is the last one Patchwork adds to the series
+                series_id = self.get_series_id(series['parts'][str(series['total'])])
+            except (requests.RequestException, ValueError, KeyError) as e:
+                print('cannot map series %s: %s' % (key, e), file=sys.stderr)
+                continue
+            if series_id is None:
+                if self.is_expired(series['date']):
+                    series['failed'] = True
+                series['retry'] = time.time() + MAPPING_RETRY
+                continue
+
+            series['id'] = series_id
+            if series_id in self.handled:
+                continue
+            ci_queue.push_job('series', series_id, patches=series['total'], files=len(series['files']))
+            self.handled.add(series_id)
+            queued.append(series_id)
+        return queued
+
+    def queue_rechecks(self) -> List[str]:
+        queued = []
+        for msgid, info in self.index['messages'].items():
+            request = info.get('recheck')
+            if request is None or request.get('done') or request.get('retry', 0) > time.time():
+                continue
+            # Avoid the API when the replied mail is one of the index
+            replied = self.index['messages'].get(request['reply_to'], {})
+            series = self.index['series'].get(replied.get('series'), {})
+            series_id = series.get('id')
+            try:
+                if series_id is None:
+                    series_id = self.get_series_id(request['reply_to'])
+            except (requests.RequestException, ValueError, KeyError) as e:
+                print('cannot map recheck %s: %s' % (msgid, e), file=sys.stderr)
+                continue
+            if series_id is None:
+                # The replied mail may not be parsed by Patchwork yet
+                if self.is_expired(info['date']):
+                    request['done'] = True
+                request['retry'] = time.time() + MAPPING_RETRY
+                continue
+            request['done'] = True
+
+            times = recheck.get_retest_times(RECHECK_DB_FILE, series_id, info['date'])
+            if times == -1:
+                continue
+            command = ['/usr/bin/bash', RETEST_SERIES, '-t', str(times)]
+            if request['args'].get('rebase'):
+                command += ['-b', request['args']['rebase']]
+            if series_id == series.get('id'):
+                ci_queue.push_job('recheck', series_id, command + [series_id],
+                                  patches=series['total'], files=len(series['files']))
+            else:
+                ci_queue.push_job('recheck', series_id, command + [series_id])
+            recheck.recheck_db_insert(RECHECK_DB_FILE, series_id, info['date'])
+            queued.append(series_id)
+        return queued
+
+    def prune(self) -> None:
+        limit = _get_limit()
+        self.index['messages'] = {msgid: info for msgid, info in self.index['messages'].items()
+                                  if info['date'] >= limit}
+        self.index['series'] = {key: series for key, series in self.index['series'].items()
+                                if series['date'] >= limit}
+
+    def process(self) -> int:
+        """
+        Index the new messages and queue what they complete. Return the
+        number of jobs queued.
+        """
+        for source in self.sources:
+            for raw in source.read_new():
+                self.add_message(raw)
+        # Nothing older than the index is queued
+        self.prune()
+        queued = self.queue_series()
+        for series_id in queued:
+            print('%s queued series %s' % (time.strftime('%FT%T'), series_id), flush=True)
+        rechecks = self.queue_rechecks()
+        for series_id in rechecks:
+            print('%s queued recheck of series %s' % (time.strftime('%FT%T'), series_id), flush=True)
+        self.save()
+        return len(queued) + len(rechecks)
+
+    def has_pending(self) -> bool:
+        """
+        Tell if a complete series or a recheck waits for its mapping to be
+        retried.
+        """
+        now = time.time()
+        if any(self.is_complete(series) and not series.get('id') and not series.get('failed')
+               and series.get('retry', 0) <= now for series in self.index['series'].values()):
+            return True
+        return any(info['recheck'].get('retry', now + 1) <= now and not info['recheck'].get('done')
+                   for info in self.index['messages'].values() if 'recheck' in info)
+
+    def has_changed(self) -> bool:
+        """
+        Tell if a source was modified since the previous call.
+        """
+        changed = False
+        for source in self.sources:
+            paths = [source.path]
+            if os.path.isdir(source.path):
+                paths = [os.path.join(source.path, 'new'), os.path.join(source.path, 'cur')]
+            mtime = max((os.stat(path).st_mtime for path in paths if os.path.exists(path)), default=0)
+            if mtime != source.state.get('mtime'):
+                source.state['mtime'] = mtime
+                changed = True
+        return changed
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Queue the series and rechecks found in the mails of a Maildir or an mbox')
+    parser.add_argument('sources', metavar='source', nargs='+', help='A Maildir directory or an mbox file')
+    parser.add_argument('--watch', action='store_true', help='keep checking the sources for new mails')
+    parser.add_argument('--interval', type=float, default=5, help='Seconds between two checks with --watch')
+
+    args = parser.parse_args()
+
+    ingester = MailIngester(args.sources)
+    while True:
+        if ingester.has_changed() or ingester.has_pending() or not args.watch:
+            ingester.process()
+        if not args.watch:
+            break
+        time.sleep(args.interval)
+    print('%d patchwork API calls' % (ingester.api_calls), file=sys.stderr)
+
+
+if __name__ == '__main__':
+    ci_profile.start()
+    main()
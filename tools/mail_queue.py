@@ -0,0 +1,452 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# SPDX-License-Identifier: BSD-3-Clause
+# Copyright 2024 Loongson
+
+"""
+Queue the report mails in a spool directory and send them from a separate
+worker, so that a slow MTA never blocks the tests.
+
+'enqueue' takes the same arguments as 'sendmail -t' and returns as soon as
+the mail is saved in data/mail_queue/new/. A queued report replaces the
+pending one with the same patchwork ID, test label, test status and
+description, and is dropped when such a report was sent in the last
+minutes. The description tells apart the reports of the affected tests
+and of the full suite which follows them.
+
+'send' delivers the queued mails over one SMTP connection per batch. The
+rate is limited by a token bucket shared by all the senders, and a mail
+which could not be sent is tried again later with an exponential backoff,
+up to a limit after which it is moved to data/mail_queue/failed/. With
+--drain, it waits for the rate to send all the mails which are due, and
+'send --watch' does the same before exiting on SIGTERM.
+
+The SMTP server is set by DPDK_CI_SMTP_HOST, DPDK_CI_SMTP_PORT,
+DPDK_CI_SMTP_USER, DPDK_CI_SMTP_PASSWORD and DPDK_CI_SMTP_STARTTLS, the
+rate by DPDK_CI_MAIL_RATE (mails per minute) and DPDK_CI_MAIL_BURST.
+
+Example usage:
+    ./mail_queue.py enqueue -fqemudev@loongson.cn -t < mail.txt
+    ./mail_queue.py send
+    ./mail_queue.py send --watch
+    ./mail_queue.py send --drain
+    ./mail_queue.py list
+"""
+
+import argparse
+import email.parser
+import email.utils
+import json
+import os
+import re
+import signal
+import smtplib
+import sys
+import threading
+import time
+import uuid
+from typing import Dict, List, Optional, Tuple
+
+import ci_files
+import ci_profile
+
+SPOOL_DIR = os.path.join(os.path.dirname(os.path.realpath(__file__)), '../data/mail_queue')
+
+# Mails per minute and number of mails which may be sent at once
+MAIL_RATE = 6
+MAIL_BURST = 10
+BATCH_SIZE = 20
+
+# A report with the same key as one sent this number of seconds ago is a
+# duplicate
+DEDUPE_WINDOW = 600
+
+# Backoff after a failed attempt: RETRY_DELAY * 2^(attempts - 1), bounded
+RETRY_DELAY = 60
+MAX_RETRY_DELAY = 3600
+MAX_ATTEMPTS = 10
+
+# Seconds between two checks of the spool with --watch
+WATCH_INTERVAL = 5
+
+_pwid_regex = re.compile(r'^https?://(?:patches\.)?dpdk\.org/.*patch/(\d+)', re.MULTILINE)
+_subject_pwid_regex = re.compile(r'\bpw(\d[\d-]*)')
+_label_regex = re.compile(r'^Test-Label: *(.+?)\s*$', re.MULTILINE)
+_status_regex = re.compile(r'^Test-Status: *(.+?)\s*$', re.MULTILINE)
+_desc_regex = re.compile(r'^_(.+)_\s*$', re.MULTILINE)
+
+
+def log(message: str) -> None:
+    print('%s %s' % (time.strftime('%FT%T'), message), flush=True)
+
+
+def get_report_key(message: bytes) -> Optional[List[str]]:
+    """
+    Return the (pwid, label, status, description) of a test report, None
+    for the other mails.
+    """
+    headers, _, body = message.decode('utf-8', errors='replace').partition('\n\n')
+    label = _label_regex.search(body)
+    status = _status_regex.search(body)
+    if not label or not status:
+        return None
+    pwid = _pwid_regex.search(body)
+    if not pwid:
+        subject = email.parser.Parser().parsestr(headers + '\n\n', headersonly=True).get('Subject', '')
+        pwid = _subject_pwid_regex.search(subject)
+    if not pwid:
+        return None
+    desc = _desc_regex.search(body)
+    return [pwid.group(1), label.group(1), status.group(1), desc.group(1) if desc else '']
+
+
+def get_recipients(message: bytes) -> List[str]:
+    """
+    Return the recipients of a mail like sendmail -t does.
+    """
+    headers = email.parser.BytesHeaderParser().parsebytes(message)
+    fields = []
+    for name in ('To', 'Cc', 'Bcc'):
+        fields += headers.get_all(name, [])
+    return [address for _, address in email.utils.getaddresses(fields) if address]
+
+
+class MailQueue:
+    def __init__(self, spool_dir: str = SPOOL_DIR):
+        self.spool_dir = spool_dir
+        self.new_dir = os.path.join(spool_dir, 'new')
+        self.tmp_dir = os.path.join(spool_dir, 'tmp')
+        self.failed_dir = os.path.join(spool_dir, 'failed')
+        self.lock_file = os.path.join(spool_dir, 'queue.lock')
+        self.sender_lock_file = os.path.join(spool_dir, 'sender.lock')
+        self.state_file = os.path.join(spool_dir, 'state.json')
+        for path in (self.new_dir, self.tmp_dir, self.failed_dir):
+            os.makedirs(path, exist_ok=True)
+
+    def _write(self, directory: str, entry: Dict) -> None:
+        ci_files.save_json(os.path.join(directory, entry['id']), entry,
+                           tmp_file=os.path.join(self.tmp_dir, entry['id']))
+
+    def _read(self, name: str) -> Optional[Dict]:
+        try:
+            with open(os.path.join(self.new_dir, name)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            # Sent or replaced meanwhile
+            return None
+
+    def reload(self, entry: Dict) -> Optional[Dict]:
+        """
+        Return the entry as currently queued, None if it was removed.
+        """
+        return self._read(entry['id'])
+
+    def entries(self) -> List[Dict]:
+        """
+        Return the queued mails, oldest first.
+        """
+        entries = [self._read(name) for name in os.listdir(self.new_dir)]
+        return sorted((entry for entry in entries if entry is not None), key=lambda entry: entry['enqueued'])
+
+    def enqueue(self, message: bytes, sender: Optional[str] = None, key: Optional[List[str]] = None) -> Dict:
+        if key is None:
+            key = get_report_key(message)
+        entry = {
+            'id': '%d.%s' % (time.time() * 1000, uuid.uuid4().hex[:8]),
+            'sender': sender,
+            'key': key,
+            'message': message.decode('utf-8', errors='surrogateescape'),
+            'enqueued': time.time(),
+            'attempts': 0,
+            'next_try': 0,
+            'error': None,
+        }
+        with ci_files.file_lock(self.lock_file):
+            if key is not None:
+                for queued in self.entries():
+                    if queued['key'] == key:
+                        log('mail %s replaces mail %s for %s' % (entry['id'], queued['id'], ' '.join(key)))
+                        self.remove(queued)
+            self._write(self.new_dir, entry)
+        return entry
+
+    def remove(self, entry: Dict) -> None:
+        try:
+            os.remove(os.path.join(self.new_dir, entry['id']))
+        except FileNotFoundError:
+            pass
+
+    def retry_later(self, entry: Dict, error: str) -> None:
+        entry['attempts'] += 1
+        entry['error'] = error
+        with ci_files.file_lock(self.lock_file):
+            if not os.path.isfile(os.path.join(self.new_dir, entry['id'])):
+                # Replaced by a newer report
+                return
+            if entry['attempts'] >= MAX_ATTEMPTS:
+                log('mail %s failed %d times, giving up: %s' % (entry['id'], entry['attempts'], error))
+                self._write(self.failed_dir, entry)
+                self.remove(entry)
+                return
+            entry['next_try'] = time.time() + min(RETRY_DELAY * 2 ** (entry['attempts'] - 1), MAX_RETRY_DELAY)
+            self._write(self.new_dir, entry)
+
+    def fail(self, entry: Dict, error: str) -> None:
+        log('mail %s rejected: %s' % (entry['id'], error))
+        entry['error'] = error
+        with ci_files.file_lock(self.lock_file):
+            self._write(self.failed_dir, entry)
+            self.remove(entry)
+
+    def load_state(self) -> Dict:
+        return ci_files.load_json(self.state_file, {})
+
+    def save_state(self, state: Dict) -> None:
+        ci_files.save_json(self.state_file, state)
+
+
+class MailSender:
+    def __init__(self, queue: MailQueue, env: Dict[str, str], batch_size: int = BATCH_SIZE,
+                 dedupe_window: float = DEDUPE_WINDOW):
+        self.queue = queue
+        self.host = env.get('DPDK_CI_SMTP_HOST', 'localhost')
+        self.port = int(env.get('DPDK_CI_SMTP_PORT', '25'))
+        self.user = env.get('DPDK_CI_SMTP_USER')
+        self.password = env.get('DPDK_CI_SMTP_PASSWORD')
+        self.starttls = env.get('DPDK_CI_SMTP_STARTTLS', 'false') == 'true'
+        self.rate = float(env.get('DPDK_CI_MAIL_RATE', MAIL_RATE)) / 60
+        self.burst = float(env.get('DPDK_CI_MAIL_BURST', MAIL_BURST))
+        self.batch_size = batch_size
+        self.dedupe_window = dedupe_window
+        self.stopping = threading.Event()
+
+    def connect(self) -> smtplib.SMTP:
+        smtp = smtplib.SMTP(self.host, self.port, timeout=60)
+        if self.starttls:
+            smtp.starttls()
+        if self.user:
+            smtp.login(self.user, self.password or '')
+        return smtp
+
+    def take_tokens(self, state: Dict, wanted: int) -> int:
+        """
+        Refill the token bucket of the state and take up to wanted tokens.
+        """
+        now = time.time()
+        bucket = state.setdefault('bucket', {'tokens': self.burst, 'updated': now})
+        bucket['tokens'] = min(self.burst, bucket['tokens'] + (now - bucket['updated']) * self.rate)
+        bucket['updated'] = now
+        taken = min(wanted, int(bucket['tokens']))
+        bucket['tokens'] -= taken
+        return taken
+
+    def get_wait(self, state: Dict) -> float:
+        """
+        Return the seconds until the next token.
+        """
+        bucket = state.get('bucket')
+        if bucket is None or self.rate <= 0:
+            return WATCH_INTERVAL
+        return max(0, (1 - bucket['tokens']) / self.rate)
+
+    def record_sent(self, sent: Dict[str, float]) -> None:
+        state = self.queue.load_state()
+        state['sent'] = sent
+        self.queue.save_state(state)
+
+    def send_batch(self, entries: List[Dict], sent: Dict[str, float]) -> Tuple[int, int, bool]:
+        """
+        Send the entries over one connection. Return the number of mails
+        sent, the number of mails which did not need a token and whether the
+        connection failed. Every report sent is saved at once in the state.
+        """
+        count = 0
+        unused = 0
+        smtp = None
+        current = 0
+        try:
+            for current, entry in enumerate(entries):
+                # The entries were listed before the batch started
+                entry = self.queue.reload(entry)
+                if entry is None:
+                    unused += 1
+                    continue
+                entries[current] = entry
+
+                key = ' '.join(entry['key']) if entry['key'] else None
+                if key is not None and time.time() - sent.get(key, 0) < self.dedupe_window:
+                    log('mail %s is a duplicate of the report sent for %s' % (entry['id'], key))
+                    self.queue.remove(entry)
+                    unused += 1
+                    continue
+
+                message = entry['message'].encode('utf-8', errors='surrogateescape')
+                recipients = get_recipients(message)
+                if not recipients:
+                    self.queue.fail(entry, 'no recipient')
+                    unused += 1
+                    continue
+
+                if smtp is None:
+                    smtp = self.connect()
+                try:
+                    smtp.sendmail(entry['sender'] or '', recipients, message)
+                except smtplib.SMTPRecipientsRefused as e:
+                    self.queue.fail(entry, str(e.recipients))
+                    continue
+                except (smtplib.SMTPSenderRefused, smtplib.SMTPDataError) as e:
+                    if e.smtp_code >= 500:
+                        self.queue.fail(entry, '%d %s' % (e.smtp_code, e.smtp_error))
+                    else:
+                        self.queue.retry_later(entry, '%d %s' % (e.smtp_code, e.smtp_error))
+                    continue
+
+                log('mail %s sent to %s' % (entry['id'], ', '.join(recipients)))
+                self.queue.remove(entry)
+                if key is not None:
+                    sent[key] = time.time()
+                    self.record_sent(sent)
+                count += 1
+        except (smtplib.SMTPException, OSError) as e:
+            # The connection is broken: retry the rest of the batch later
+            for entry in entries[current:]:
+                if self.queue.reload(entry) is None:
+                    continue
+                self.queue.retry_later(entry, str(e))
+            log('sending failed after %d mails: %s' % (count, e))
+            return count, unused, True
+        finally:
+            if smtp is not None:
+                try:
+                    smtp.quit()
+                except (smtplib.SMTPException, OSError):
+                    pass
+        return count, unused, False
+
+    def send_queued(self) -> int:
+        """
+        Send the mails which are due as long as the rate allows it and
+        return the number of mails sent, -1 if another sender is running.
+        """
+        with ci_files.file_lock(self.queue.sender_lock_file, blocking=False) as acquired:
+            if not acquired:
+                return -1
+            total = 0
+            while True:
+                now = time.time()
+                due = [entry for entry in self.queue.entries() if entry['next_try'] <= now]
+                if not due:
+                    break
+                state = self.queue.load_state()
+                sent = {key: date for key, date in state.get('sent', {}).items()
+                        if now - date < self.dedupe_window}
+                tokens = self.take_tokens(state, min(len(due), self.batch_size))
+                self.queue.save_state(state)
+                if tokens == 0:
+                    break
+
+                count, unused, broken = self.send_batch(due[:tokens], sent)
+                total += count
+
+                state = self.queue.load_state()
+                state['sent'] = sent
+                if unused:
+                    # Give back the tokens of the mails which were not sent
+                    bucket = state['bucket']
+                    bucket['tokens'] = min(self.burst, bucket['tokens'] + unused)
+                self.queue.save_state(state)
+                if broken:
+                    break
+            return total
+
+    def drain(self) -> int:
+        """
+        Send all the mails which are due, waiting for the rate to allow it.
+        Return the number of mails sent, -1 if another sender is running.
+        """
+        total = 0
+        while True:
+            count = self.send_queued()
+            if count < 0:
+                return -1
+            total += count
+            now = time.time()
+            if not any(entry['next_try'] <= now for entry in self.queue.entries()):
+                return total
+            time.sleep(max(self.get_wait(self.queue.load_state()), 0.1))
+
+    def watch(self) -> None:
+        """
+        Send the mails as they are queued until stop() is called, then
+        drain the queue.
+        """
+        while not self.stopping.is_set():
+            if self.send_queued() < 0:
+                log('another sender is running')
+                return
+            now = time.time()
+            entries = self.queue.entries()
+            wait: float = WATCH_INTERVAL
+            if entries and min(entry['next_try'] for entry in entries) <= now:
+                wait = max(wait, self.get_wait(self.queue.load_state()))
+            self.stopping.wait(wait)
+        log('%d mails sent before exiting' % (self.drain()))
+
+    def stop(self, *args) -> None:
+        self.stopping.set()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Queue the report mails and send them at a limited rate')
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.required = True
+
+    enqueue_parser = subparsers.add_parser(
+        'enqueue', help='queue the mail read on stdin, with the arguments of sendmail -t')
+    enqueue_parser.add_argument('-f', dest='sender', help='The envelope sender')
+    enqueue_parser.add_argument('-t', action='store_true',
+                                help='read the recipients from the mail, always done')
+    enqueue_parser.add_argument('-k', '--key', nargs=3, metavar=('PWID', 'LABEL', 'STATUS'),
+                                help='The report to deduplicate on, read from the mail by default')
+
+    send_parser = subparsers.add_parser('send', help='send the queued mails which are due')
+    send_mode = send_parser.add_mutually_exclusive_group()
+    send_mode.add_argument('--watch', action='store_true',
+                           help='keep sending the mails as they are queued, drain the queue on SIGTERM')
+    send_mode.add_argument('--drain', action='store_true', help='wait for the rate to send all the mails due')
+    send_parser.add_argument('--batch', type=int, default=BATCH_SIZE,
+                             help='The number of mails per SMTP connection, default: %d' % (BATCH_SIZE))
+    send_parser.add_argument('--dedupe-window', type=float, default=DEDUPE_WINDOW,
+                             help='Seconds during which a sent report is not sent again, default: %d'
+                             % (DEDUPE_WINDOW))
+
+    subparsers.add_parser('list', help='print the queued mails')
+
+    args = parser.parse_args()
+
+    queue = MailQueue()
+    if args.command == 'enqueue':
+        if sys.stdin.isatty():
+            print('nothing to read on stdin', file=sys.stderr)
+            sys.exit(1)
+        entry = queue.enqueue(sys.stdin.buffer.read(), args.sender, args.key)
+        print('mail %s queued' % (entry['id']))
+    elif args.command == 'send':
+        sender = MailSender(queue, dict(os.environ), max(args.batch, 1), args.dedupe_window)
+        if args.watch:
+            signal.signal(signal.SIGTERM, sender.stop)
+            sender.watch()
+        elif (sender.drain() if args.drain else sender.send_queued()) < 0:
+            print('another sender is running')
+    else:
+        now = time.time()
+        for entry in queue.entries():
+            print('%s %s attempts %d next try in %.0fs%s' % (
+                entry['id'], ' '.join(entry['key']) if entry['key'] else '-', entry['attempts'],
+                max(0, entry['next_try'] - now), ': ' + entry['error'] if entry['error'] else ''))
+
+
+if __name__ == '__main__':
+    ci_profile.start()
+    main()
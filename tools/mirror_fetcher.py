@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# SPDX-License-Identifier: BSD-3-Clause
+# Copyright 2024 Loongson
+
+"""
+Keep local mirrors of the DPDK trees up to date in the background, so that
+the test jobs take their base commit without waiting on the network.
+
+Every repo of config/repo_branch.cfg and config/repo_branch_v2.cfg has a
+bare mirror <repo>.git in the mirror directory. The mirrors of the other
+trees borrow the objects of the dpdk.git mirror through alternates, so
+the history shared by all the trees is stored and fetched once. 'fetch'
+updates all the mirrors; it is run on a timer by ci_supervisor.py or in
+the background by loongarch-dpdk-ci.sh. The branches fetched and the time
+of the fetch are saved in data/mirror_state.json.
+
+'update' sets a remote branch of the DPDK checkout to the freshest fetched
+commit of a tree: the fetch is local and, with the mirrors added to the
+alternates of the checkout, does not copy any object. It prints the commit
+for the job to record as its base.
+
+Example usage:
+    ./mirror_fetcher.py fetch
+    ./mirror_fetcher.py fetch dpdk dpdk-next-net
+    ./mirror_fetcher.py update --checkout ~/dpdk dpdk-next-net main refs/remotes/origin/next-net-for-main
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from typing import Dict, List
+
+import ci_files
+import ci_profile
+
+TOOLS_DIR = os.path.dirname(os.path.realpath(__file__))
+DATA_DIR = os.path.join(TOOLS_DIR, '../data')
+STATE_FILE = os.path.join(DATA_DIR, 'mirror_state.json')
+LOCK_FILE = os.path.join(DATA_DIR, 'mirror_fetcher.lock')
+REPO_BRANCH_FILES = [os.path.join(TOOLS_DIR, '../config/repo_branch.cfg'),
+                     os.path.join(TOOLS_DIR, '../config/repo_branch_v2.cfg')]
+
+MIRROR_DIR = os.environ.get('DPDK_CI_MIRROR_DIR', os.path.expanduser('~/dpdk-ci-mirrors'))
+# The URL of a repo, {path} being e.g. dpdk or next/dpdk-next-net
+MIRROR_URL = os.environ.get('DPDK_CI_MIRROR_URL', 'https://dpdk.org/git/{path}')
+
+# The mirror storing the objects shared by all the trees
+SHARED_REPO = 'dpdk'
+
+FETCH_TIMEOUT = 600
+
+
+def get_repos() -> List[str]:
+    repos = set()
+    for path in REPO_BRANCH_FILES:
+        with open(path) as f:
+            repos.update(json.load(f))
+    # The shared mirror first, the others borrow its objects
+    return sorted(repos, key=lambda repo: (repo != SHARED_REPO, repo))
+
+
+def get_url(repo: str) -> str:
+    path = 'next/' + repo if repo.startswith('dpdk-next-') else repo
+    return MIRROR_URL.format(path=path, repo=repo)
+
+
+def get_mirror(repo: str) -> str:
+    return os.path.join(MIRROR_DIR, repo + '.git')
+
+
+def git(git_dir: str, *args: str, timeout: float = None) -> str:
+    return subprocess.run(['git', '--git-dir', git_dir] + list(args), stdout=subprocess.PIPE,
+                          universal_newlines=True, check=True, timeout=timeout).stdout
+
+
+def add_alternates(git_dir: str, object_dirs: List[str]) -> None:
+    """
+    Let a repo use the objects of other repos, keeping its alternates.
+    """
+    path = os.path.join(git_dir, 'objects/info/alternates')
+    alternates = []
+    if os.path.isfile(path):
+        with open(path) as f:
+            alternates = [line.strip() for line in f if line.strip()]
+    missing = [object_dir for object_dir in object_dirs if object_dir not in alternates]
+    if not missing:
+        return
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as f:
+        f.write(''.join(line + '\n' for line in alternates + missing))
+
+
+def init_mirror(repo: str) -> str:
+    mirror = get_mirror(repo)
+    if not os.path.isdir(mirror):
+        subprocess.run(['git', 'init', '-q', '--bare', mirror], check=True)
+        git(mirror, 'remote', 'add', 'origin', get_url(repo))
+        git(mirror, 'config', 'remote.origin.fetch', '+refs/heads/*:refs/heads/*')
+        # The other mirrors and the checkouts may need objects it no
+        # longer references
+        git(mirror, 'config', 'gc.pruneExpire', 'never')
+    if repo != SHARED_REPO:
+        add_alternates(mirror, [os.path.join(get_mirror(SHARED_REPO), 'objects')])
+    return mirror
+
+
+def fetch_mirror(repo: str) -> Dict:
+    mirror = init_mirror(repo)
+    git(mirror, 'fetch', '--quiet', '--prune', '--no-tags', 'origin', timeout=FETCH_TIMEOUT)
+    heads = {}
+    for line in git(mirror, 'for-each-ref', '--format=%(refname:short) %(objectname)', 'refs/heads').splitlines():
+        branch, commit = line.split()
+        heads[branch] = commit
+    return {'fetched': time.time(), 'heads': heads}
+
+
+def load_state() -> Dict[str, Dict]:
+    return ci_files.load_json(STATE_FILE, {})
+
+
+def save_state(state: Dict[str, Dict]) -> None:
+    ci_files.save_json(STATE_FILE, state)
+
+
+def fetch_mirrors(repos: List[str]) -> int:
+    """
+    Fetch the mirrors of the repos and return the number of failures. A
+    failed fetch keeps the previous state of its mirror.
+    """
+    failures = 0
+    for repo in repos:
+        start = time.time()
+        try:
+            result = fetch_mirror(repo)
+        except (OSError, subprocess.CalledProcessError, subprocess.TimeoutExpired) as e:
+            print('fetch %s failed: %s' % (repo, e), file=sys.stderr)
+            failures += 1
+            continue
+        print('fetched %s in %.1fs' % (repo, time.time() - start))
+        state = load_state()
+        state[repo] = result
+        save_state(state)
+    return failures
+
+
+def update_checkout(checkout: str, repo: str, branch: str, ref: str) -> str:
+    """
+    Set a ref of the checkout to the fetched branch of a repo and return
+    its commit.
+    """
+    mirror = get_mirror(repo)
+    if not os.path.isdir(mirror):
+        raise ValueError('no mirror of %s' % (repo))
+    # The objects of a worktree are in the common directory
+    git_dir = subprocess.run(['git', '-C', checkout, 'rev-parse', '--git-common-dir'], stdout=subprocess.PIPE,
+                             universal_newlines=True, check=True).stdout.strip()
+    git_dir = os.path.join(checkout, git_dir)
+    add_alternates(git_dir, [os.path.join(get_mirror(SHARED_REPO), 'objects'), os.path.join(mirror, 'objects')])
+    commit = git(mirror, 'rev-parse', '--verify', 'refs/heads/%s^{commit}' % (branch)).strip()
+    git(git_dir, 'fetch', '--quiet', '--no-tags', mirror, '+refs/heads/%s:%s' % (branch, ref))
+    fetched = load_state().get(repo, {}).get('fetched')
+    if fetched:
+        print('%s %s: %s fetched at %s' % (repo, branch, commit,
+                                           time.strftime('%FT%T', time.localtime(fetched))), file=sys.stderr)
+    return commit
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Keep local mirrors of the DPDK trees up to date')
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.required = True
+
+    fetch_parser = subparsers.add_parser('fetch', help='fetch the mirrors')
+    fetch_parser.add_argument('repos', nargs='*', help='The repos to fetch, default: all the configured ones')
+
+    update_parser = subparsers.add_parser('update', help='set a ref of a checkout to a fetched branch')
+    update_parser.add_argument('--checkout', required=True, help='The DPDK checkout')
+    update_parser.add_argument('repo', help='The repo of the branch')
+    update_parser.add_argument('branch', help='The branch in the repo')
+    update_parser.add_argument('ref', help='The ref of the checkout to update, e.g. refs/remotes/origin/main')
+
+    args = parser.parse_args()
+
+    if args.command == 'fetch':
+        os.makedirs(MIRROR_DIR, exist_ok=True)
+        with ci_files.file_lock(LOCK_FILE, blocking=False) as acquired:
+            if not acquired:
+                print('another fetch is running')
+                return
+            if fetch_mirrors(args.repos or get_repos()):
+                sys.exit(1)
+        return
+
+    try:
+        print(update_checkout(args.checkout, args.repo, args.branch, args.ref))
+    except (OSError, ValueError, subprocess.CalledProcessError) as e:
+        print('update: %s' % (e), file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    ci_profile.start()
+    main()
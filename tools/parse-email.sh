@@ -3,7 +3,7 @@
 # SPDX-License-Identifier: BSD-3-Clause
 # Copyright 2016 6WIND S.A.
 
-format_mailaddr=$(dirname $(readlink -e $0))/../tools/format_mail_address.py
+parse_email=$(dirname $(readlink -e $0))/../tools/parse_email.py
 
 print_usage () {
 	cat <<- END_OF_HELP
@@ -27,25 +27,5 @@ if [ -z "$1" ] ; then
 	exit 1
 fi
 
-getheader () # <header_name> <email_file>
-{
-	sed "/^$1: */!d;s///;N;s,\n[[:space:]]\+, ,;s,\n.*,,;q" "$2" |
-	sed 's,",\\",g'
-}
-
-subject=$(getheader Subject "$1")
-from=$(getheader From "$1")
-msgid=$(getheader Message-[iI][dD] "$1")
-pwid=$(getheader X-Patchwork-Id "$1")
-listid=$(getheader List-Id "$1")
-reply=$(getheader In-Reply-To "$1")
-
-from="`python3 $format_mailaddr "$from"`"
-cat <<- END_OF_HEADERS
-	subject="$subject"
-	from="$from"
-	msgid="$msgid"
-	pwid="$pwid"
-	listid="$listid"
-	reply="$reply"
-END_OF_HEADERS
+# All headers are parsed in one pass over the header block
+exec python3 $parse_email "$1"
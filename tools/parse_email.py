@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# SPDX-License-Identifier: BSD-3-Clause
+# Copyright 2022 Loongson
+
+import argparse
+import os
+import sys
+
+import ci_profile
+from format_mail_address import format_mail_address
+
+# (shell variable, header name) in the order parse-email.sh prints them
+HEADERS = [
+    ('subject', 'subject'),
+    ('from', 'from'),
+    ('msgid', 'message-id'),
+    ('pwid', 'x-patchwork-id'),
+    ('listid', 'list-id'),
+    ('reply', 'in-reply-to'),
+    ('submitter', 'x-patchwork-submitter'),
+    ('date', 'date'),
+]
+
+HEADERS_SUFFIX = '.headers'
+
+def read_headers(email_path):
+    """
+    Return a dict of the wanted headers of an email, keyed by lower-case
+    header name. Only the header block is read, continuation lines are
+    unfolded and the first occurrence of a header wins.
+    """
+    wanted = set(name for _, name in HEADERS)
+    headers = {}
+    current = None
+    with open(email_path, 'r', encoding='utf-8', errors='replace') as f:
+        for line in f:
+            line = line.rstrip('\r\n')
+            if line == '':
+                break
+            if line[0] in ' \t':
+                if current is not None:
+                    headers[current] += ' ' + line.strip()
+                continue
+
+            current = None
+            name, sep, value = line.partition(':')
+            if not sep:
+                continue
+            name = name.strip().lower()
+            if name in wanted and name not in headers:
+                headers[name] = value.lstrip(' ')
+                current = name
+    return headers
+
+def shell_quote(value):
+    for ch in '\\"$`':
+        value = value.replace(ch, '\\' + ch)
+    return value
+
+def get_header_values(headers):
+    """
+    Return the values of the shell variables, keyed by variable name.
+    """
+    values = {var: headers.get(name, '') for var, name in HEADERS}
+    values['from'] = format_mail_address(values['from'])
+    values['submitter'] = values['submitter'].replace('"', '')
+    return values
+
+def format_headers(headers):
+    values = get_header_values(headers)
+
+    return ''.join('%s="%s"\n' % (var, shell_quote(values[var]))
+                   for var, _ in HEADERS)
+
+def parse_email(email_path):
+    return format_headers(read_headers(email_path))
+
+def write_series_headers(patches_dir):
+    """
+    Write <pwid>.headers next to every <pwid>.patch listed in
+    pwid_order.txt, so that the reports can eval them without parsing
+    the emails again.
+    """
+    with open(os.path.join(patches_dir, 'pwid_order.txt')) as f:
+        pwids = [line.strip() for line in f if line.strip()]
+
+    for pwid in pwids:
+        email_path = os.path.join(patches_dir, pwid + '.patch')
+        with open(os.path.join(patches_dir, pwid + HEADERS_SUFFIX), 'w') as f:
+            f.write(parse_email(email_path))
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Parse basic headers of the email and print them as'
+            ' shell variable assignments to evaluate')
+    parser.add_argument('email_file', nargs='?', help='The email to parse')
+    parser.add_argument('-d', '--series-dir', dest='series_dir',
+            help='write <pwid>%s for every patch of a series directory'
+                % (HEADERS_SUFFIX))
+
+    args = parser.parse_args()
+
+    if args.series_dir:
+        write_series_headers(args.series_dir)
+        return
+
+    if not args.email_file:
+        print('file argument is missing', file=sys.stderr)
+        parser.print_usage(sys.stderr)
+        sys.exit(1)
+
+    sys.stdout.write(parse_email(args.email_file))
+
+if __name__ == "__main__":
+    ci_profile.start()
+    main()
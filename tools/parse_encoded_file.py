@@ -4,29 +4,79 @@
 # SPDX-License-Identifier: BSD-3-Clause
 # Copyright 2022 Loongson
 
+import argparse
 import codecs
 import email.header
+import os
 import re
+import shutil
 import sys
+import tempfile
+
+import ci_profile
+
+ENCODED_WORD_PATTERN = re.compile(r'=\?utf-8\?[bq]\?.*\?=', re.IGNORECASE)
 
 def decode_mime_words(s):
     return u''.join(
         word.decode(encoding or 'utf8') if isinstance(word, bytes) else word
         for word, encoding in email.header.decode_header(s))
 
+def decode_header_line(line, cached):
+    # Most header lines carry no encoded-word at all, skip the regex for them
+    if '=?' not in line:
+        return line
+
+    for item in ENCODED_WORD_PATTERN.findall(line):
+        if item not in cached:
+            cached[item] = decode_mime_words(item)
+        line = line.replace(item, cached[item])
+    return line
+
+def decode_header_block(ori_path, new_path, cached=None):
+    """
+    Decode the RFC 2822 header block of ori_path into new_path.
+
+    Only the lines up to the first blank line are inspected, the body is
+    copied as raw bytes. The result is written to a temporary file in the
+    directory of new_path and renamed over it, so ori_path and new_path may
+    be the same file.
+    """
+    if cached is None:
+        cached = {}
+
+    new_dir = os.path.dirname(os.path.abspath(new_path))
+    fd, tmp_path = tempfile.mkstemp(prefix='.decode-', dir=new_dir)
+    try:
+        with open(ori_path, 'rb') as src, os.fdopen(fd, 'wb') as dst:
+            for raw in src:
+                if b'=?' in raw:
+                    line = raw.decode('utf-8', errors='surrogateescape')
+                    line = decode_header_line(line, cached)
+                    raw = line.encode('utf-8', errors='surrogateescape')
+                dst.write(raw)
+                if raw.strip(b'\r\n') == b'':
+                    break
+            shutil.copyfileobj(src, dst)
+        shutil.copymode(ori_path, tmp_path)
+        os.replace(tmp_path, new_path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
 def parse_decoded_file(ori_path, new_path):
     fp = open(ori_path)
     if fp == None:
         print("open %s failed" % (ori_path))
         exit(1)
-    
-    pattern = re.compile('=\?utf-8\?[bq]\?.*\?=', re.IGNORECASE)
+
+    pattern = ENCODED_WORD_PATTERN
 
     cached = {}
     lines = []
     line = fp.readline()
     while line:
-        ret = pattern.findall(line) 
+        ret = pattern.findall(line)
         if len(ret) == 0:
             lines.append(line)
             line = fp.readline()
@@ -41,7 +91,7 @@ def parse_decoded_file(ori_path, new_path):
         line = fp.readline()
     fp.close()
 
-    fp = codecs.open(new_path, 'w', encoding='utf-8') 
+    fp = codecs.open(new_path, 'w', encoding='utf-8')
     if fp == None:
         print("open %s failed" % (new_path))
         exit(1)
@@ -51,11 +101,36 @@ def parse_decoded_file(ori_path, new_path):
     fp.close()
 
 def main():
-    if len(sys.argv) != 3:
+    parser = argparse.ArgumentParser(
+        description='Decode the MIME encoded-words in patch emails. Without'
+            ' -i, decode ori_file into new_file; with -i, decode the header'
+            ' block of every given file in place.')
+    parser.add_argument('files', metavar='file', nargs='+',
+            help='ori_file new_file, or the files to decode with -i')
+    parser.add_argument('-i', '--in-place', action='store_true',
+            help='decode only the header block of each file in place')
+
+    args = parser.parse_args()
+
+    if args.in_place:
+        cached = {}
+        failed = False
+        for path in args.files:
+            try:
+                decode_header_block(path, path, cached)
+            except OSError as e:
+                print("decode %s failed: %s" % (path, e))
+                failed = True
+        if failed:
+            sys.exit(1)
+        return
+
+    if len(args.files) != 2:
         print("Usage: %s ori_file new_file" % (sys.argv[0]))
         exit(1)
 
-    parse_decoded_file(sys.argv[1], sys.argv[2])
+    parse_decoded_file(args.files[0], args.files[1])
 
 if __name__ == "__main__":
+    ci_profile.start()
     main()
@@ -1,10 +1,12 @@
 #!/usr/bin/env python3
 
 import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from configparser import ConfigParser
-from typing import List, Dict, Set
+from typing import List, Dict, FrozenSet, Iterable, Optional, Set, Tuple
 
 import itertools
+import os
 # BSD LICENSE
 #
 # Copyright(c) 2020 Intel Corporation. All rights reserved.
@@ -38,6 +40,8 @@ import itertools
 # OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 import sys
 
+import ci_profile
+
 try:
     import whatthepatch
 except ImportError:
@@ -45,14 +49,50 @@ except ImportError:
     exit(1)
 
 
+def get_changed_file_of_diff(diff) -> str:
+    # A deleted file has /dev/null as its new path
+    path = diff.header.new_path
+    if path == '/dev/null':
+        path = diff.header.old_path
+    # whatthepatch takes the paths of the added and deleted files from the
+    # 'diff --git a/<path> b/<path>' line, without stripping its prefixes
+    if path.startswith('b/') and diff.header.old_path == 'a/' + path[2:]:
+        path = path[2:]
+    return path
+
+
 def get_changed_files_in_patch(patch_file: str) -> List[str]:
     with open(patch_file, 'r') as f:
-        filenames = map(lambda diff: diff.header.new_path, whatthepatch.parse_patch(f.read()))
+        filenames = map(get_changed_file_of_diff,
+                        filter(lambda diff: diff.header is not None, whatthepatch.parse_patch(f.read())))
         return list(filenames)
 
 
-def get_all_files_from_patches(patch_files: List[str]) -> Set[str]:
-    return set(itertools.chain.from_iterable(map(get_changed_files_in_patch, patch_files)))
+# Below this many patch files the cost of starting worker processes is
+# higher than parsing the patches one after another. Starting and stopping
+# a forked pool takes 7, 11 and 19 ms with 2, 4 and 8 workers, and parsing
+# a patch 1 ms at 5 files x 100 lines, 3.6 ms at 10 files x 200 lines. The
+# pool wins once n * parse * (1 - 1 / workers) exceeds its start cost: from
+# 4 to 6 patches of the larger size and 13 to 21 of the smaller one with 2
+# to 8 workers. These costs were measured on one CPU; run
+# bench/bench_patch_parser.py on the multi-core CI host to check the
+# crossover there.
+PARALLEL_THRESHOLD = 8
+
+
+def get_all_files_from_patches(patch_files: List[str], max_workers: Optional[int] = None) -> Set[str]:
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+
+    if len(patch_files) < PARALLEL_THRESHOLD or max_workers < 2:
+        return set(itertools.chain.from_iterable(map(get_changed_files_in_patch, patch_files)))
+
+    changed_files: Set[str] = set()
+    with ProcessPoolExecutor(max_workers=min(max_workers, len(patch_files))) as executor:
+        futures = [executor.submit(get_changed_files_in_patch, patch_file) for patch_file in patch_files]
+        for future in as_completed(futures):
+            changed_files.update(future.result())
+    return changed_files
 
 
 def parse_comma_delimited_list_from_string(mod_str: str) -> List[str]:
@@ -66,34 +106,133 @@ def get_dictionary_attributes_from_config_file(conf_obj: ConfigParser) -> Dict[s
     }
 
 
+class PathTagTrie:
+    """
+    The [Paths] rules compiled into a trie of path components.
+
+    A rule matches a file when its components are a prefix of the file's
+    components, so 'drivers' matches 'drivers/net/foo.c' but not
+    'driversX/foo.c'. Lookups walk at most the depth of the file path and
+    are memoized, so the same trie can be shared by every patch of a run.
+    """
+
+    def __init__(self, dir_attrs: Dict[str, List[str]]):
+        self._root: Dict = {}
+        for directory, tags in dir_attrs.items():
+            node = self._root
+            for component in self._split(directory):
+                node = node.setdefault(component, {})
+            node.setdefault(None, []).extend(tags)
+        self._cache: Dict[str, FrozenSet[str]] = {}
+
+    @staticmethod
+    def _split(path: str) -> List[str]:
+        return [component for component in path.split('/') if component]
+
+    def get_tags(self, patch_file: str) -> FrozenSet[str]:
+        try:
+            return self._cache[patch_file]
+        except KeyError:
+            pass
+
+        tags: Set[str] = set()
+        node = self._root
+        for component in self._split(patch_file):
+            node = node.get(component)
+            if node is None:
+                break
+            tags.update(node.get(None, ()))
+
+        result = frozenset(tags)
+        self._cache[patch_file] = result
+        return result
+
+    def get_longest_match_tags(self, patch_file: str) -> Optional[List[str]]:
+        """
+        Return the tags of the most specific rule matching the file, or
+        None when no rule matches.
+        """
+        tags = None
+        node = self._root
+        for component in self._split(patch_file):
+            node = node.get(component)
+            if node is None:
+                break
+            tags = node.get(None, tags)
+        return tags
+
+
+# The tries of the rules given to the functions below, built once per config
+_tries: Dict[Tuple, PathTagTrie] = {}
+
+
+def get_trie(dir_attrs: Dict[str, Set[str]]) -> PathTagTrie:
+    key = tuple(sorted((directory, tuple(tags)) for directory, tags in dir_attrs.items()))
+    trie = _tries.get(key)
+    if trie is None:
+        trie = _tries[key] = PathTagTrie(dir_attrs)
+    return trie
+
+
 def get_tags_for_patch_file(patch_file: str, dir_attrs: Dict[str, Set[str]]) -> Set[str]:
-    return set(itertools.chain.from_iterable(
-        tags for directory, tags in dir_attrs.items() if patch_file.startswith(directory)
-    ))
+    return set(get_trie(dir_attrs).get_tags(patch_file))
 
 
 def get_tags_for_patches(patch_files: Set[str], dir_attrs: Dict[str, Set[str]]) -> Set[str]:
-    return set(itertools.chain.from_iterable(
-        map(lambda patch_file: get_tags_for_patch_file(patch_file, dir_attrs), patch_files)
-    ))
+    return set(itertools.chain.from_iterable(map(get_trie(dir_attrs).get_tags, patch_files)))
+
+
+class PatchTagger:
+    """
+    Library entry point: parse patch_parser.cfg once and return the
+    ordered tags for any number of patch files or series.
+    """
+
+    def __init__(self, config_file_path: str):
+        conf_obj = ConfigParser()
+        # The paths are case sensitive, e.g. VERSION
+        conf_obj.optionxform = str
+        conf_obj.read(config_file_path)
+        self.trie = PathTagTrie(get_dictionary_attributes_from_config_file(conf_obj))
+        self.priority_list = parse_comma_delimited_list_from_string(conf_obj['Priority']['priority_list'])
+
+    def order_tags(self, tags: Set[str]) -> List[str]:
+        return [tag for tag in self.priority_list if tag in tags]
+
+    def get_tags_for_files(self, changed_files: Iterable[str]) -> List[str]:
+        return self.order_tags(set(itertools.chain.from_iterable(map(self.trie.get_tags, changed_files))))
+
+    def get_tags_for_patches(self, patch_files: List[str]) -> List[str]:
+        return self.get_tags_for_files(get_all_files_from_patches(patch_files))
+
+    def get_tags_for_series(self, series_dir: str) -> List[str]:
+        return self.get_tags_for_patches(get_patch_files_in_series(series_dir))
+
+
+def get_patch_files_in_series(series_dir: str) -> List[str]:
+    with open(os.path.join(series_dir, 'pwid_order.txt')) as f:
+        return [os.path.join(series_dir, line.strip() + '.patch') for line in f if line.strip()]
 
 
 if __name__ == '__main__':
+    ci_profile.start()
     parser = argparse.ArgumentParser(
         description='Takes a patch file and a config file and creates a list of tags for that patch')
     parser.add_argument('config_file_path', help='The path to patch_parser.cfg', default='config/patch_parser.cfg')
-    parser.add_argument('patch_file_paths', help='A list of patch files', type=str, metavar='patch file', nargs='+')
+    parser.add_argument('patch_file_paths', help='A list of patch files', type=str, metavar='patch file', nargs='*')
+    parser.add_argument('--series-dir', dest='series_dirs', action='append', default=[],
+                        help='A series directory containing pwid_order.txt, may be repeated')
 
     args = parser.parse_args()
 
-    conf_obj = ConfigParser()
-    conf_obj.read(args.config_file_path)
+    if not args.patch_file_paths and not args.series_dirs:
+        parser.error('at least one patch file or --series-dir is required')
 
-    patch_files = get_all_files_from_patches(args.patch_file_paths)
-    dir_attrs = get_dictionary_attributes_from_config_file(conf_obj)
-    priority_list = parse_comma_delimited_list_from_string(conf_obj['Priority']['priority_list'])
+    patch_tagger = PatchTagger(args.config_file_path)
+    patch_file_paths = list(args.patch_file_paths)
+    for series_dir in args.series_dirs:
+        patch_file_paths += get_patch_files_in_series(series_dir)
 
-    unordered_tags: Set[str] = get_tags_for_patches(patch_files, dir_attrs)
-    ordered_tags: List[str] = [tag for tag in priority_list if tag in unordered_tags]
+    ordered_tags: List[str] = patch_tagger.get_tags_for_patches(patch_file_paths)
 
     print("\n".join(ordered_tags))
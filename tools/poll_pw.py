@@ -0,0 +1,280 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# SPDX-License-Identifier: BSD-3-Clause
+# Copyright 2024 Loongson
+
+"""
+Poll the Patchwork events for completed patches or series and hand every
+new ID to the CI, like poll-pw but in one process.
+
+The IDs already handled are kept in a set backed by the same
+data/poll_pw_<type>_ids file as poll-pw. The first events page is
+requested with If-None-Match/If-Modified-Since so that an unchanged page
+costs a 304. The interval between polls is short after new IDs were found
+and grows up to the maximum while Patchwork is quiet.
+
+Series are pushed to ci_queue.py by default, without the versions replaced
+by a newer one found in the same poll or already queued, see
+series_queue.py. With
+--command, the command is run for every ID as poll-pw does.
+
+Example usage:
+    ./poll_pw.py series DPDK last.txt
+    ./poll_pw.py --forever --min-interval 30 --max-interval 600 series DPDK last.txt
+    ./poll_pw.py -n 3 --command 'tools/test-series.sh' series DPDK last.txt
+"""
+
+import argparse
+import datetime
+import os
+import subprocess
+import sys
+import time
+from typing import Callable, Dict, List, Optional
+
+import requests
+
+import ci_files
+import ci_profile
+import ci_queue
+import ci_trace
+import series_queue
+
+PW_API_URL = os.environ.get('DPDK_CI_PW_API_URL', 'http://patches.dpdk.org/api')
+DATA_DIR = os.path.join(os.path.dirname(os.path.realpath(__file__)), '../data')
+
+MIN_INTERVAL = 30
+MAX_INTERVAL = 600
+
+# Keep the ID file between these sizes, as poll-pw does
+MAX_IDS = 1000
+KEEP_IDS = 500
+
+# The since date only moves once it is a day old, so that the events of
+# a series completed late are not missed
+SINCE_UPDATE_SECONDS = 86400
+
+DATE_FORMAT = '%Y-%m-%dT%H:%M:%S'
+
+
+class IdStore:
+    """
+    The set of the IDs already handled, appended to its file as they come.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.ids: List[str] = []
+        if os.path.isfile(path):
+            with open(path) as f:
+                self.ids = [line.strip() for line in f if line.strip()]
+        self.known = set(self.ids)
+
+    def __contains__(self, pw_id: str) -> bool:
+        return pw_id in self.known
+
+    def add(self, pw_id: str) -> None:
+        if pw_id in self.known:
+            return
+        self.ids.append(pw_id)
+        self.known.add(pw_id)
+        with open(self.path, 'a') as f:
+            f.write(pw_id + '\n')
+        if len(self.ids) >= MAX_IDS:
+            self.compact()
+
+    def compact(self) -> None:
+        self.ids = self.ids[-KEEP_IDS:]
+        self.known = set(self.ids)
+        ci_files.save_text(self.path, ''.join(pw_id + '\n' for pw_id in self.ids))
+
+
+class Poller:
+    def __init__(self, resource_type: str, project: str, since_file: str,
+                 callback: Callable[[List[str]], None]):
+        self.resource_type = resource_type
+        self.project = project
+        self.since_file = since_file
+        self.callback = callback
+        self.session = requests.Session()
+        self.store = IdStore(os.path.join(DATA_DIR, 'poll_pw_%s_ids' % (resource_type)))
+        # Validators of the first events page, per since date
+        self.validators: Dict[str, Dict[str, str]] = {}
+        # Dates of the events of the new IDs, for the poll delay
+        self.event_dates: Dict[str, str] = {}
+
+    def check_project(self) -> bool:
+        response = self.session.get('%s/projects/' % (PW_API_URL), params={'per_page': 100}, timeout=60)
+        response.raise_for_status()
+        return any(p['name'].lower() == self.project.lower() for p in response.json())
+
+    def read_since(self) -> str:
+        with open(self.since_file) as f:
+            text = ' '.join(f.read().split())
+        # Same formats as date -d for the files written by poll-pw
+        for date_format in (DATE_FORMAT, '%Y-%m-%dT%H:%M', '%Y-%m-%d'):
+            try:
+                return datetime.datetime.strptime(text.split('.')[0], date_format).strftime(DATE_FORMAT)
+            except ValueError:
+                pass
+        raise ValueError("The file '%s' doesn't contain a valid date format" % (self.since_file))
+
+    def fetch_new_ids(self, since: str) -> List[str]:
+        ids: List[str] = []
+        url: Optional[str] = '%s/events/' % (PW_API_URL)
+        params: Optional[Dict[str, str]] = {'category': '%s-completed' % (self.resource_type), 'since': since}
+        first = True
+        while url:
+            headers = self.validators.get(since, {}) if first else {}
+            response = self.session.get(url, params=params, headers=headers, timeout=60)
+            if first and response.status_code == 304:
+                return []
+            response.raise_for_status()
+            if first:
+                validators = {}
+                if 'ETag' in response.headers:
+                    validators['If-None-Match'] = response.headers['ETag']
+                if 'Last-Modified' in response.headers:
+                    validators['If-Modified-Since'] = response.headers['Last-Modified']
+                self.validators = {since: validators}
+
+            for event in response.json():
+                if (event.get('project') or {}).get('name') != self.project:
+                    continue
+                pw_id = str(event['payload'][self.resource_type]['id'])
+                if pw_id not in self.store and pw_id not in ids:
+                    ids.append(pw_id)
+                    self.event_dates[pw_id] = event.get('date') or ''
+
+            url = response.links.get('next', {}).get('url')
+            params = None
+            first = False
+        return ids
+
+    def update_since(self, since: str, date_now: str) -> None:
+        now = datetime.datetime.strptime(date_now, DATE_FORMAT)
+        if (now - datetime.datetime.strptime(since, DATE_FORMAT)).total_seconds() > SINCE_UPDATE_SECONDS:
+            with open(self.since_file, 'w') as f:
+                f.write(date_now)
+
+    def trace_delay(self, pw_id: str) -> None:
+        """
+        Record the time from the Patchwork event to its handling.
+        """
+        date = self.event_dates.pop(pw_id, '')
+        try:
+            start = datetime.datetime.strptime(date.split('.')[0], DATE_FORMAT)
+        except ValueError:
+            return
+        start = start.replace(tzinfo=datetime.timezone.utc).timestamp()
+        ci_trace.emit('poll', start, series_id=pw_id if self.resource_type == 'series' else None)
+
+    def poll(self) -> int:
+        """
+        Poll once, hand the new IDs to the callback and return their number.
+        """
+        date_now = datetime.datetime.now(datetime.timezone.utc).strftime(DATE_FORMAT)
+        since = self.read_since()
+        ids = self.fetch_new_ids(since)
+        print('%s fetched %s ids since %s: %s' % (date_now, self.resource_type, since, ' '.join(ids)), flush=True)
+        if ids:
+            self.callback(ids)
+            for pw_id in ids:
+                self.store.add(pw_id)
+                self.trace_delay(pw_id)
+        self.update_since(since, date_now)
+        return len(ids)
+
+
+def queue_series(defer_superseded: bool) -> Callable[[List[str]], None]:
+    def callback(ids: List[str]) -> None:
+        session = requests.Session()
+        series_list = {series_id: series_queue.get_series(session, series_id) for series_id in ids}
+        superseded = series_queue.find_superseded(series_list)
+        for series_id in ids:
+            series = series_list[series_id]
+            if series is not None and series_id not in superseded:
+                # The older versions still waiting in the queue
+                superseded.update(series_queue.supersede_queued(series_id, series, defer_superseded))
+            if series_id in superseded and not defer_superseded:
+                continue
+            group = series_queue.get_series_group(series) if series is not None else None
+            ci_queue.push_job('series', series_id, group=group,
+                              version=series.get('version') if series is not None else None,
+                              superseded_by=superseded.get(series_id), series=series)
+        for series_id, newer in superseded.items():
+            print('series %s is superseded by series %s' % (series_id, newer), flush=True)
+        series_queue.record_superseded(superseded)
+    return callback
+
+
+def run_command(command: str) -> Callable[[List[str]], None]:
+    def callback(ids: List[str]) -> None:
+        for pw_id in ids:
+            print('%s %s %s' % (time.strftime('%FT%T'), command, pw_id), flush=True)
+            subprocess.run('%s %s' % (command, pw_id), shell=True)
+    return callback
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Poll patchwork and hand each new patch/series id to the CI')
+    parser.add_argument('resource_type', choices=['patch', 'series'], help='The kind of events to poll')
+    parser.add_argument('project', help='The patchwork project name, e.g. DPDK')
+    parser.add_argument('since_file', help='The file containing the first date to filter with')
+    parser.add_argument('-n', '--times', type=int, default=1, help='The number of polls, default to 1')
+    parser.add_argument('--forever', action='store_true', help='poll until killed')
+    parser.add_argument('--command', help='run this command with each id instead of queueing series')
+    parser.add_argument('-d', '--defer-superseded', action='store_true',
+                        help='queue the superseded series too, they are skipped by default')
+    parser.add_argument('--min-interval', type=float, default=MIN_INTERVAL,
+                        help='Seconds between polls after activity, default: %d' % (MIN_INTERVAL))
+    parser.add_argument('--max-interval', type=float, default=MAX_INTERVAL,
+                        help='Seconds between polls when quiet, default: %d' % (MAX_INTERVAL))
+
+    args = parser.parse_args()
+
+    if args.times < 1:
+        parser.error('the poll times must be a positive integer')
+    if args.resource_type == 'patch' and not args.command:
+        parser.error('--command is required for patches')
+
+    if args.command:
+        callback = run_command(args.command)
+    else:
+        callback = queue_series(args.defer_superseded)
+    poller = Poller(args.resource_type, args.project, args.since_file, callback)
+
+    try:
+        poller.read_since()
+        if not poller.check_project():
+            print("The project '%s' doesn't exist." % (args.project), file=sys.stderr)
+            sys.exit(1)
+    except (OSError, ValueError, requests.RequestException) as e:
+        print(e, file=sys.stderr)
+        sys.exit(1)
+
+    interval = args.min_interval
+    count = 0
+    while True:
+        try:
+            found = poller.poll()
+        except (ValueError, KeyError, requests.RequestException) as e:
+            print('poll failed: %s' % (e), file=sys.stderr, flush=True)
+            found = 0
+        count += 1
+        if not args.forever and count >= args.times:
+            break
+
+        # Poll again soon while series are coming, back off when quiet
+        if found:
+            interval = args.min_interval
+        else:
+            interval = min(interval * 2, args.max_interval)
+        time.sleep(interval)
+
+
+if __name__ == '__main__':
+    ci_profile.start()
+    main()
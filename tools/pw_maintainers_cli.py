@@ -53,6 +53,8 @@ from git_pw import api
 from git_pw import utils
 from git_pw import patch as git_pw_patch
 
+import ci_profile
+
 MAINTAINERS_FILE_PATH = os.environ.get('MAINTAINERS_FILE_PATH')
 if not MAINTAINERS_FILE_PATH:
     print('MAINTAINERS_FILE_PATH is not set.', file=sys.stderr)
@@ -316,6 +318,7 @@ class Maintainers(object):
 
 if __name__ == '__main__':
     """Main procedure."""
+    ci_profile.start()
     parser = argparse.ArgumentParser()
     git_pw_conf_parser = parser.add_argument_group('git-pw configurations')
     required_args_parser = parser.add_argument_group('required arguments')
@@ -11,6 +11,9 @@ import json
 import os
 import subprocess
 
+import ci_profile
+import ci_queue
+
 def get_recheck_time(path):
     now = datetime.now()
     rc_time = now + timedelta(hours=-12)
@@ -147,13 +150,17 @@ def main():
             rebase = one_retest["arguments"]["rebase"]
         print("retest sid(%s) rebase(%s)" % (sid, rebase))
 
+        # The retest runs from the CI queue, with the new series
         if len(rebase) > 0:
-            subprocess.run(['/usr/bin/bash', script_path, '-t', str(times), '-b', rebase, sid])
+            command = ['/usr/bin/bash', script_path, '-t', str(times), '-b', rebase, sid]
         else:
-            subprocess.run(['/usr/bin/bash', script_path, '-t', str(times), sid])
+            command = ['/usr/bin/bash', script_path, '-t', str(times), sid]
+        if not ci_queue.push_job('recheck', sid, command):
+            print("retest sid(%s) is already queued" % (sid))
         recheck_db_insert(args.recheck_db, sid, last_ts)
 
     save_recheck_time(args.last_file, rechecks)
 
 if __name__ == "__main__":
+    ci_profile.start()
     main()
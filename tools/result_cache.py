@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# SPDX-License-Identifier: BSD-3-Clause
+# Copyright 2024 Loongson
+
+"""
+Reuse the compilation and unit testing results of a series whose diffs were
+already tested on the same base commit, e.g. a RESEND or a new version only
+changing the cover letter or the commit logs.
+
+The key is the sha256 of the base commit and of the diffs of the patches in
+order, without the 'index' lines and the signature which change with the
+sender's git. Every result is stored in data/result_cache/<key>/ with the
+logs needed to generate its report again for the new series.
+
+Example usage:
+    ./result_cache.py key --series-dir series/123 --base <commit>
+    ./result_cache.py store <key> compilation ninja_fail --series-id 123 --log build/ninja-log.txt
+    ./result_cache.py lookup <key> --rerun test_fail --max-age 30
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import shutil
+import sys
+import time
+from typing import Dict, List, Optional
+
+import ci_profile
+
+CACHE_DIR = os.path.join(os.path.dirname(os.path.realpath(__file__)), '../data/result_cache')
+RESULT_FILE = 'result.json'
+
+# The results of every label and the logs their reports are generated from
+RESULTS = {
+    'compilation': ('meson_fail', 'ninja_fail', 'build_pass'),
+    'unit_testing': ('test_fail', 'test_pass', 'test_subset_pass', 'test_skip'),
+}
+
+# The line counts of a hunk, in the old and the new file
+_hunk_regex = re.compile(rb'^@@ -\d+(?:,(\d+))? \+\d+(?:,(\d+))? @@')
+
+
+def normalize_diff(patch: bytes) -> bytes:
+    """
+    Return the diff part of a patch email without what differs between two
+    sendings of the same change.
+    """
+    lines = []
+    in_diff = False
+    # The lines left in the current hunk, in the old and the new file
+    old_left = new_left = 0
+    for line in patch.splitlines(keepends=True):
+        if old_left > 0 or new_left > 0:
+            # A removed line may read '-- ' too, only the hunk counts tell
+            if line.startswith(b'-'):
+                old_left -= 1
+            elif line.startswith(b'+'):
+                new_left -= 1
+            elif not line.startswith(b'\\'):
+                # Context, its space may have been stripped by a mailer
+                old_left -= 1
+                new_left -= 1
+            lines.append(line.rstrip() + b'\n')
+            continue
+        if line.startswith(b'diff --git '):
+            in_diff = True
+        if not in_diff:
+            continue
+        if line.rstrip(b'\r\n') == b'-- ':
+            # The signature, e.g. the git version
+            break
+        if line.startswith(b'index '):
+            continue
+        match = _hunk_regex.match(line)
+        if match:
+            old_left = int(match.group(1) or 1)
+            new_left = int(match.group(2) or 1)
+        lines.append(line.rstrip() + b'\n')
+    return b''.join(lines)
+
+
+def get_series_key(series_dir: str, base_commit: str) -> str:
+    digest = hashlib.sha256()
+    digest.update(base_commit.encode() + b'\n')
+    with open(os.path.join(series_dir, 'pwid_order.txt')) as f:
+        pwids = [line.strip() for line in f if line.strip()]
+    for pwid in pwids:
+        with open(os.path.join(series_dir, pwid + '.patch'), 'rb') as f:
+            digest.update(normalize_diff(f.read()))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+def _entry_dir(key: str) -> str:
+    return os.path.join(CACHE_DIR, key)
+
+
+def load_entry(key: str) -> Optional[Dict]:
+    path = os.path.join(_entry_dir(key), RESULT_FILE)
+    if not os.path.isfile(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def store_result(key: str, label: str, result: str, series_id: str, logs: List[str]) -> None:
+    """
+    Record the result of a label for the series of key, with a copy of the
+    logs of its report.
+    """
+    entry_dir = _entry_dir(key)
+    os.makedirs(entry_dir, exist_ok=True)
+
+    entry = load_entry(key) or {}
+    if label == 'compilation':
+        # A new build invalidates the unit testing result of an older one
+        entry.pop('unit_testing', None)
+
+    saved = []
+    for i, log in enumerate(logs):
+        name = '%s-%d-%s' % (label, i, os.path.basename(log))
+        shutil.copyfile(log, os.path.join(entry_dir, name))
+        saved.append(name)
+    entry[label] = {'result': result, 'series_id': series_id, 'time': int(time.time()), 'logs': saved}
+
+    tmp_file = os.path.join(entry_dir, RESULT_FILE + '.tmp')
+    with open(tmp_file, 'w') as f:
+        json.dump(entry, f, indent=4, sort_keys=True)
+    os.replace(tmp_file, os.path.join(entry_dir, RESULT_FILE))
+
+
+def lookup_results(key: str, rerun: List[str], max_age_days: float) -> Optional[List[Dict]]:
+    """
+    Return the results to reuse in label order, or None when the series
+    must be tested: unknown key, incomplete or outdated results, or a
+    result configured to be always rerun.
+    """
+    entry = load_entry(key)
+    if entry is None or 'compilation' not in entry:
+        return None
+
+    labels = ['compilation']
+    if entry['compilation']['result'] == 'build_pass':
+        if 'unit_testing' not in entry:
+            return None
+        labels.append('unit_testing')
+
+    results = []
+    for label in labels:
+        saved = entry[label]
+        if saved['result'] in rerun:
+            return None
+        if max_age_days > 0 and time.time() - saved['time'] > max_age_days * 86400:
+            return None
+        logs = [os.path.join(_entry_dir(key), name) for name in saved['logs']]
+        if not all(map(os.path.isfile, logs)):
+            return None
+        results.append({'label': label, 'result': saved['result'], 'series_id': saved['series_id'], 'logs': logs})
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Reuse the results of series identical to tested ones')
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.required = True
+
+    key_parser = subparsers.add_parser('key', help='print the key of a series')
+    key_parser.add_argument('--series-dir', required=True, help='A series directory containing pwid_order.txt')
+    key_parser.add_argument('--base', required=True, help='The base commit the series is applied on')
+
+    store_parser = subparsers.add_parser('store', help='record the result of a label')
+    store_parser.add_argument('key', help='The key of the series')
+    store_parser.add_argument('label', choices=list(RESULTS), help='The label of the result')
+    store_parser.add_argument('result', help='The result, one of %s' % (
+        ', '.join(result for results in RESULTS.values() for result in results)))
+    store_parser.add_argument('--series-id', required=True, help='The series the result comes from')
+    store_parser.add_argument('--log', action='append', default=[], help='A log the report is generated from')
+
+    lookup_parser = subparsers.add_parser(
+        'lookup', help='print "<label> <result> <series_id> <log>..." lines of the results to reuse')
+    lookup_parser.add_argument('key', help='The key of the series')
+    lookup_parser.add_argument('--rerun', default='',
+                               help='Comma separated results which are never reused, e.g. test_fail')
+    lookup_parser.add_argument('--max-age', type=float, default=0,
+                               help='Do not reuse results older than this many days, 0 for no limit')
+
+    args = parser.parse_args()
+
+    if args.command == 'key':
+        print(get_series_key(args.series_dir, args.base))
+    elif args.command == 'store':
+        if args.result not in RESULTS[args.label]:
+            parser.error('invalid result %s for %s' % (args.result, args.label))
+        store_result(args.key, args.label, args.result, args.series_id, args.log)
+    else:
+        rerun = [result.strip() for result in args.rerun.split(',') if result.strip()]
+        results = lookup_results(args.key, rerun, args.max_age)
+        if results is None:
+            sys.exit(1)
+        for result in results:
+            print(' '.join([result['label'], result['result'], result['series_id']] + result['logs']))
+
+
+if __name__ == '__main__':
+    ci_profile.start()
+    main()
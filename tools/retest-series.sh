@@ -8,6 +8,7 @@ REUSE_PATCH=false
 RETEST_TIMES=-1
 KEEP_BASE=false
 REBASE=""
+RERUN_ALL=false
 last_gpr_file="last_gpr.txt"
 
 parse_email=$(dirname $(readlink -e $0))/../tools/parse-email.sh
@@ -16,6 +17,11 @@ download_series=$(dirname $(readlink -e $0))/../tools/download-series.sh
 get_patch_check=$(dirname $(readlink -e $0))/../tools/get-patch-check.sh
 parse_testlog=$(dirname $(readlink -e $0))/../tools/parse_testlog.py
 pw_maintainers_cli=$(dirname $(readlink -e $0))/../tools/pw_maintainers_cli.py
+run_record=$(dirname $(readlink -e $0))/../tools/run_record.py
+test_rerun=$(dirname $(readlink -e $0))/../tools/test_rerun.py
+compiler_cache=$(dirname $(readlink -e $0))/../tools/compiler_cache.py
+mirror_fetcher=$(dirname $(readlink -e $0))/../tools/mirror_fetcher.py
+ci_trace=$(dirname $(readlink -e $0))/../tools/ci_trace.py
 repo_branch_cfg=$(dirname $(readlink -e $0))/../config/repo_branch.cfg
 repo_branch_cfg_v2=$(dirname $(readlink -e $0))/../config/repo_branch_v2.cfg
 token_file=$(dirname $(readlink -e $0))/../.pw_token.dat
@@ -28,6 +34,12 @@ status_warning="WARNING"
 status_failure="FAILURE"
 status_success="SUCCESS"
 
+. $(dirname $(readlink -e $0))/load-ci-config.sh
+compiler_cache_enabled=${DPDK_CI_CCACHE:-true}
+mirror_enabled=${DPDK_CI_MIRROR:-false}
+dpdk_home=${DPDK_CI_DPDK_HOME:-/home/zhoumin/gh_dpdk}
+pw_api_url=${DPDK_CI_PW_API_URL:-https://patches.dpdk.org/api}
+
 export LC="en_US.UTF-8"
 export LANG="en_US.UTF-8"
 
@@ -38,6 +50,12 @@ print_usage() {
 	options:
 		-t     retest times for <series_id>
 		-b     rebase for <series_id>
+		-a     rebuild and rerun all the unit tests, even if the series
+		       and its base commit did not change
+
+	When the unit tests failed on the same series and base commit, only the
+	failed tests are rerun on the kept build, or all of them when the failed
+	ones are not found.
 
 	Run dpdk ci tests for one series specified by the series_id
 	END_OF_HELP
@@ -89,7 +107,7 @@ send_series_test_report() {
 		pwids=$first_pwid-$last_pwid
 	fi
 
-	eval $($parse_email $patches_dir/$target_pwid.patch)
+	load_email_headers $patches_dir/$target_pwid.patch
 	if [ -z "$subject" -o -z "$from" -o -z "$msgid" \
 		-o -z "$pwid" -o -z "$listid" ] ; then
 		echo "parse email failed: $patches_dir/$target_pwid.patch"
@@ -98,14 +116,88 @@ send_series_test_report() {
 
 	#from="zhoumin@loongson.cn"
 	echo "send test report for series $series_id to $from"
+	report_start=$(date +%s.%N)
+	failed=false
 	$send_series_report -t "$subject" -f "$from" -m "$msgid" -p "$target_pwid" \
 		-r "$pwids" -o "$listid" -l "$label" \
-		-s "$status" -d "$desc" -k "$mail_path" < $report
+		-s "$status" -d "$desc" -k "$mail_path" < $report || failed=true
+	if $failed ; then
+		trace_span report fail $report_start
+		return 1
+	fi
+	trace_span report pass $report_start
+}
+
+# Record the time taken by a stage in the trace of ci_trace.py
+trace_span() { # <stage> <outcome> <start> [retries]
+	python3 $ci_trace span $1 $2 --start $3 --series-id $series_id --retries ${4:-0} || true
+}
+
+rerun_failed_tests() {
+	testlog_previous=$DPDK_HOME/testlog-previous.json
+	cp $testlog_json $testlog_previous
+
+	# Without the failed tests of the previous run, all of them are rerun
+	# and their results are not merged
+	rerun_all=false
+	tests=$(python3 $test_rerun failed $testlog_previous) || rerun_all=true
+	if [ -z "$tests" ] ; then
+		rerun_all=true
+	fi
+
+	test_failed=false
+	stage_start=$(date +%s.%N)
+	if $rerun_all ; then
+		echo "no failed unit test found in the previous run, rerun all the unit tests"
+		meson test -C build --no-rebuild --suite DPDK:fast-tests --test-args="-l 0-7" -t 20 || test_failed=true
+	else
+		echo "rerun the failed unit tests: $(echo $tests | tr '\n' ' ')"
+		meson test -C build --no-rebuild --suite DPDK:fast-tests --test-args="-l 0-7" -t 20 $tests || test_failed=true
+	fi
+	echo "test done!"
+	if ! $rerun_all ; then
+		failed=false
+		python3 $test_rerun merge $testlog_previous $testlog_json --txt $testlog_txt || failed=true
+		if $failed ; then
+			# Only the results of the rerun: the other tests are unknown
+			echo "merge the rerun results failed, report the rerun alone as a failure"
+			test_failed=true
+		fi
+	fi
+	if $test_failed ; then
+		trace_span test_rerun fail $stage_start
+	else
+		trace_span test_rerun pass $stage_start
+	fi
+	python3 $test_rerun record $testlog_json --series-id $series_id --rerun-of $testlog_previous || true
+
+	python3 $run_record init $record --series-dir $patches_dir --series-id $series_id \
+		--repo $repo --branch $ori_base --base-commit $base_commit
+	if $test_failed ; then
+		echo "unit testing fail"
+		python3 $run_record stage $record test fail --testlog $testlog_json $testlog_txt
+		python3 $run_record render $record test_fail -o $test_report >/dev/null
+		send_series_test_report $series_id $patches_dir "$label_unit_testing" $status_failure "$desc_unit_test_fail" $test_report $unit_test_mail
+		python3 $test_rerun keep --dpdk-dir $DPDK_HOME --series-dir $patches_dir --base $base_commit || true
+	else
+		echo "unit testing pass"
+		python3 $run_record stage $record test pass --testlog $testlog_json $testlog_txt
+		python3 $run_record render $record test_pass -o $test_report >/dev/null
+		send_series_test_report $series_id $patches_dir "$label_unit_testing" $status_success "$desc_unit_test_pass" $test_report $unit_test_mail
+	fi
+}
+
+# Print the compiler cache hits of the build of the series
+report_compiler_cache() {
+	if $compiler_cache_enabled ; then
+		python3 $compiler_cache report $ccache_stats || true
+	fi
 }
 
 try_apply() {
 	repo=$1
 	need_send=$2
+	apply_attempts=$((apply_attempts+1))
 
 	failed=false
 	ori_base=$(cat $repo_branch_cfg | jq "try ( .\"$repo\" )" |sed 's,",,g') || failed=true
@@ -131,7 +223,7 @@ try_apply() {
 
 	# Use the DPDK github mirrors as the remote repo
 	# DPDK_HOME=/home/zhoumin/$repo
-	DPDK_HOME=/home/zhoumin/gh_dpdk
+	DPDK_HOME=$dpdk_home
 	if [ ! -d "$DPDK_HOME" ] ; then
 		echo "$DPDK_HOME is not directory"
 		exit 1
@@ -158,9 +250,18 @@ try_apply() {
 
 	git checkout unused
 	git branch -D $base
+
+	# Take the freshest commit fetched by mirror_fetcher.py, without network
+	mirror_commit=""
+	if $mirror_enabled && ! $KEEP_BASE ; then
+		mirror_commit=$(python3.8 $mirror_fetcher update --checkout $DPDK_HOME \
+			$repo $ori_base refs/remotes/origin/$base) || mirror_commit=""
+	fi
 	git checkout origin/$base -b $base
 
-	if ! $KEEP_BASE ; then
+	if [ -n "$mirror_commit" ] ; then
+		echo "base $base updated from the mirror of $repo: $mirror_commit"
+	elif ! $KEEP_BASE ; then
 		need_update=true
 		if [ -f "$last_gpr_file" ] ; then
 			failed=false
@@ -228,8 +329,9 @@ try_apply() {
 	done < $patches_dir/pwid_order.txt
 }
 
-while getopts b:hkrt: arg ; do
+while getopts ab:hkrt: arg ; do
 	case $arg in
+		a ) RERUN_ALL=true ;;
 		b ) REBASE=$OPTARG ;;
 		k ) KEEP_BASE=true ;;
 		r ) REUSE_PATCH=true ;;
@@ -268,9 +370,13 @@ fi
 series_id=$1
 printf "To retest series: $series_id\n"
 patches_dir=$(dirname $(readlink -e $0))/../series/$series_id
+record=$patches_dir/run_record.json
 
 # This can also be "-g"
 g_opt=""
+if ${DPDK_CI_PW_HTTP_GET:-false} ; then
+	g_opt="-g"
+fi
 
 if $REUSE_PATCH ; then
 	if [ ! -d $patches_dir ] ; then
@@ -290,17 +396,19 @@ else
 	fi
 fi
 
-export PW_SERVER="https://patches.dpdk.org/api/1.2/"
+export PW_SERVER="$pw_api_url/1.2/"
 export PW_PROJECT=dpdk
 export PW_TOKEN=$(cat $token_file)
-export MAINTAINERS_FILE_PATH=/home/zhoumin/gh_dpdk/MAINTAINERS
+export MAINTAINERS_FILE_PATH=$dpdk_home/MAINTAINERS
 
 default_repo=dpdk
 
 failed=false
+stage_start=$(date +%s.%N)
 repo=$(timeout -s SIGKILL 120s python3.8 $pw_maintainers_cli --type series list-trees $series_id) || failed=true
 if $failed ; then
 	echo "list trees for series $series_id timeout, exit ..."
+	trace_span tree_lookup fail $stage_start
 	exit 1
 elif [ -z "$repo" ] ; then
 	echo "list trees for series $series_id failed, default to '$default_repo'"
@@ -308,10 +416,13 @@ elif [ -z "$repo" ] ; then
 else
 	echo "list trees for series $series_id: $repo"
 fi
+trace_span tree_lookup pass $stage_start
 
 . $(dirname $(readlink -e $0))/gen-test-report.sh
 
 applied=false
+apply_attempts=0
+apply_start=$(date +%s.%N)
 
 # Firstly, try to apply on prefer repo gotten from pw_maintainers_cli.py
 prefer_repo=$repo
@@ -335,47 +446,84 @@ if ! $applied ; then
 fi
 
 if ! $applied ; then
+	trace_span apply fail $apply_start $((apply_attempts-1))
 	echo "Cannot apply patch(es) for series $series_id, please check series directory and related repos"
 	echo "Test will not be executed!"
 	# exit successfully to skip this series
 	exit 0
 fi
 
+trace_span apply pass $apply_start $((apply_attempts-1))
+
+# The series and its base commit did not change since its unit tests
+# failed: the build is the same, only the failed tests are run again
+if ! $RERUN_ALL && python3 $test_rerun restore --dpdk-dir $DPDK_HOME \
+		--series-dir $patches_dir --base $base_commit ; then
+	echo "reuse the build of series $series_id on $base_commit"
+	test_report_series_build_pass $repo $ori_base $base_commit $patches_dir $test_report
+	send_series_test_report $series_id $patches_dir "$label_compilation" $status_success "$desc_build_pass" $test_report $build_mail
+	rerun_failed_tests
+	cd -
+	exit 0
+fi
+
 rm -rf build
 
+# Compile through the compiler cache shared by all the checkouts
+ccache_stats=$patches_dir/ccache-stats.json
+if $compiler_cache_enabled ; then
+	eval "$(python3 $compiler_cache env --basedir $(dirname $DPDK_HOME))"
+	python3 $compiler_cache snapshot $ccache_stats || compiler_cache_enabled=false
+fi
+
 failed=false
+stage_start=$(date +%s.%N)
 meson build || failed=true
 if $failed ; then
 	echo "meson build failure"
+	trace_span meson fail $stage_start
+	report_compiler_cache
 	test_report_series_meson_build_fail $repo $ori_base $base_commit $patches_dir $meson_log $test_report
 	send_series_test_report $series_id $patches_dir "$label_compilation" $status_failure "$desc_meson_build_failure" $test_report $build_mail
 	exit 0
 fi
 
+trace_span meson pass $stage_start
+
 failed=false
+stage_start=$(date +%s.%N)
 ninja -C build &> $ninja_log || failed=true
 if $failed ; then
 	echo "ninja build failure"
+	trace_span ninja fail $stage_start
+	report_compiler_cache
 	test_report_series_ninja_build_fail $repo $ori_base $base_commit $patches_dir $ninja_log $test_report
 	send_series_test_report $series_id $patches_dir "$label_compilation" $status_failure "$desc_ninja_build_failure" $test_report $build_mail
 	exit 0
 fi
 
+trace_span ninja pass $stage_start
+report_compiler_cache
 echo "meson & ninja build pass"
 test_report_series_build_pass $repo $ori_base $base_commit $patches_dir $test_report
 send_series_test_report $series_id $patches_dir "$label_compilation" $status_success "$desc_build_pass" $test_report $build_mail
 
 failed=false
+stage_start=$(date +%s.%N)
 meson test -C build --suite DPDK:fast-tests --test-args="-l 0-7" -t 20 || failed=true
 echo "test done!"
 if $failed ; then
 	echo "unit testing fail"
+	trace_span test fail $stage_start
+	python3 $test_rerun record $testlog_json --series-id $series_id || true
 	test_report_series_test_fail $repo $ori_base $base_commit $patches_dir $testlog_json $testlog_txt $test_report
 	send_series_test_report $series_id $patches_dir "$label_unit_testing" $status_failure "$desc_unit_test_fail" $test_report $unit_test_mail
+	python3 $test_rerun keep --dpdk-dir $DPDK_HOME --series-dir $patches_dir --base $base_commit || true
 	exit 0
 fi
 
 echo "unit testing pass"
+trace_span test pass $stage_start
 test_report_series_test_pass $repo $ori_base $base_commit $patches_dir $testlog_json $testlog_txt $test_report
 send_series_test_report $series_id $patches_dir "$label_unit_testing" $status_success "$desc_unit_test_pass" $test_report $unit_test_mail
 
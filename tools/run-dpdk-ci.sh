@@ -16,6 +16,12 @@ ci_is_running() {
 	return 1
 }
 
+# ci_supervisor.py runs everything itself when it is started
+if ! flock -n $DPDK_CI/data/ci_supervisor.lock true ; then
+	echo "$(basename $(readlink -e $0)) exits because ci_supervisor.py is running"
+	exit 0
+fi
+
 if ci_is_running ; then
 	echo "$(basename $(readlink -e $0)) exits because $prog is running"
 	exit 0
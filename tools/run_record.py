@@ -0,0 +1,349 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# SPDX-License-Identifier: BSD-3-Clause
+# Copyright 2024 Loongson
+
+"""
+Keep the facts of one test run of a series in a JSON run record and
+render the compilation and unit testing reports from it.
+
+The record is written next to the patches, in series/<id>/run_record.json.
+'init' saves the series, the headers of its patches and the base it was
+applied on, 'stage' the outcome, the duration and the failure excerpt or
+the test results of a stage. 'render' writes the report of a result with
+the same text as the templates of gen-test-report.sh, and prints the
+headers of the patch the report replies to as shell variable assignments.
+
+Example usage:
+    ./run_record.py init series/123/run_record.json --series-dir series/123 \\
+        --series-id 123 --repo dpdk --branch main --base-commit <commit>
+    ./run_record.py stage series/123/run_record.json ninja fail --log build/ninja-log.txt --started 1700000000
+    ./run_record.py stage series/123/run_record.json test pass \\
+        --testlog build/meson-logs/testlog.json build/meson-logs/testlog.txt
+    eval "$(./run_record.py render series/123/run_record.json test_pass -o test-report.txt)"
+"""
+
+import argparse
+import json
+import math
+import mmap
+import os
+import sys
+import time
+from typing import Dict, List, Optional
+
+import build_log_excerpt
+import ci_files
+import ci_profile
+import parse_email
+import test_rerun
+
+RECORD_FILE = 'run_record.json'
+
+STAGES = ('apply', 'scoped_meson', 'scoped_ninja', 'meson', 'ninja', 'test')
+OUTCOMES = ('pass', 'fail', 'skip')
+
+# The results reports are rendered for, with the stage they come from
+RESULTS = {
+    'apply_fail': 'apply',
+    'meson_fail': 'meson',
+    'ninja_fail': 'ninja',
+    'build_pass': 'ninja',
+    'test_fail': 'test',
+    'test_pass': 'test',
+    'test_subset_pass': 'test',
+    'test_skip': 'test',
+}
+
+# The variables printed for the shell by 'render'
+SHELL_VARIABLES = ('subject', 'from', 'msgid', 'pwid', 'listid', 'pwids', 'target_pwid')
+
+# Test return codes which are not failures: success and skipped
+TEST_OK_RETURNCODES = (0, 77)
+
+SUBSET_NOTE = 'Only the unit tests affected by the files changed in this patch set were run.'
+
+
+def load_record(path: str) -> Dict:
+    with open(path) as f:
+        return json.load(f)
+
+
+def init_record(series_dir: str, series_id: str, repo: str, branch: str, base_commit: str) -> Dict:
+    with open(os.path.join(series_dir, 'pwid_order.txt')) as f:
+        pwids = [line.strip() for line in f if line.strip()]
+    patches = []
+    for pwid in pwids:
+        headers = parse_email.read_headers(os.path.join(series_dir, pwid + '.patch'))
+        patch = parse_email.get_header_values(headers)
+        patch['pwid'] = pwid
+        patches.append(patch)
+    return {
+        'series_id': series_id,
+        'patches': patches,
+        'repo': repo,
+        'branch': branch,
+        'base_commit': base_commit,
+        'started': time.time(),
+        'stages': {},
+        'reports': [],
+    }
+
+
+def read_excerpt(tool: str, log: str) -> str:
+    with open(log, 'rb') as f:
+        try:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            return ''
+        try:
+            if tool == 'ninja':
+                return build_log_excerpt.excerpt_ninja(data, build_log_excerpt.MAX_BLOCKS,
+                                                       build_log_excerpt.MAX_LINES)
+            return build_log_excerpt.excerpt_meson(data, build_log_excerpt.MAX_BLOCKS,
+                                                   build_log_excerpt.MAX_LINES)
+        finally:
+            data.close()
+
+
+def read_tests(testlog_json: str, testlog_txt: str) -> Dict:
+    """
+    Return the results of the tests and the summary lines of meson test,
+    with the output of the failed tests and the known flaky failures.
+    """
+    results = []
+    failures = []
+    history = test_rerun.load_history()
+    with open(testlog_json) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            test = json.loads(line)
+            results.append({key: test[key] for key in ('name', 'result', 'duration', 'returncode')})
+            if test['returncode'] not in TEST_OK_RETURNCODES:
+                failure = {key: test[key] for key in ('name', 'result', 'stdout', 'stderr')}
+                flaky = test_rerun.describe_flaky(test, history)
+                if flaky:
+                    failure['flaky'] = flaky
+                failures.append(failure)
+
+    summary = []
+    with open(testlog_txt) as f:
+        for line in f:
+            if summary or line.startswith('Ok:'):
+                summary.append(line.strip())
+    return {'results': results, 'summary': summary, 'failures': failures}
+
+
+def set_stage(record: Dict, name: str, outcome: str, log: Optional[str] = None,
+              testlog: Optional[List[str]] = None, started: Optional[float] = None,
+              subset: bool = False) -> None:
+    stage: Dict = {'outcome': outcome, 'finished': time.time()}
+    if subset:
+        # Only the tests affected by the series were run
+        stage['subset'] = True
+    if started is not None:
+        stage['duration'] = round(stage['finished'] - started, 1)
+    if log is not None:
+        if name == 'apply':
+            with open(log, errors='replace') as f:
+                stage['log'] = f.read()
+        else:
+            stage['excerpt'] = read_excerpt(name.replace('scoped_', ''), log)
+    if testlog is not None:
+        stage['tests'] = read_tests(testlog[0], testlog[1])
+    record['stages'][name] = stage
+
+
+def get_patchset(record: Dict) -> str:
+    first = record['patches'][0]['pwid']
+    last = record['patches'][-1]['pwid']
+    return first if first == last else '%s-%s' % (first, last)
+
+
+def write_env_result(environment: str, result: str) -> List[str]:
+    return [
+        'Test environment and result as below:',
+        '',
+        '+---------------------+----------------+',
+        '|     Environment     | %-15s|' % (environment),
+        '+---------------------+----------------+',
+        '| Loongnix-Server 8.3 | %-15s|' % (result),
+        '+---------------------+----------------+',
+        '',
+        'Loongnix-Server 8.3',
+        '    Kernel: 4.19.190+',
+        '    Compiler: gcc 8.3',
+        '',
+        '',
+    ]
+
+
+def get_separator(title: str, char: str) -> str:
+    width = max((80 - len(title)) // 2, 20)
+    return char * width + title + char * width
+
+
+def write_test_summary(tests: Dict) -> List[str]:
+    lines = []
+    results = tests['results']
+    if results:
+        num = len(results)
+        index_width = int(math.log(num, 10) + 1) * 2 + 1
+        name_width = max(len(test['name']) for test in results) + 9
+        for i, test in enumerate(results):
+            index = '%d/%d' % (i + 1, num)
+            info = index.rjust(index_width) + ' '
+            info += test['name'].ljust(name_width) + ' '
+            info += test['result'].ljust(10) + ' '
+            info += ('%.2fs' % (test['duration'])).rjust(10)
+            if test['returncode'] != 0:
+                info += '   exit status %d' % (test['returncode'])
+            lines.append(info)
+    lines += ['', '']
+    lines += tests['summary']
+    lines += ['', '']
+    return lines
+
+
+def write_test_failures(tests: Dict) -> List[str]:
+    lines = []
+    for test in tests['failures']:
+        lines.append(get_separator('', '='))
+        lines.append('%s: %s' % (test['name'], test['result']))
+        if 'flaky' in test:
+            lines.append(test['flaky'])
+        lines.append(get_separator('', '='))
+        lines.append(get_separator('stdout', '-'))
+        lines.append(test['stdout'])
+        lines.append(get_separator('stderr', '-'))
+        lines.append(test['stderr'])
+    return lines
+
+
+def render_report(record: Dict, result: str, stage_name: Optional[str] = None) -> str:
+    """
+    Return the text of the report of a result of the series.
+    """
+    patchset = get_patchset(record)
+    first = record['patches'][0]
+    stage = record['stages'].get(stage_name or RESULTS[result], {})
+
+    lines = [
+        'Submitter: %s' % (first['submitter']),
+        'Date: %s' % (first['date']),
+        'DPDK git baseline: Repo:%s' % (record['repo']),
+        '  Branch: %s' % (record['branch']),
+        '  CommitID: %s' % (record['base_commit']),
+        '',
+    ]
+    if result == 'apply_fail':
+        lines += ['Apply patch set %s failed:' % (patchset), '']
+        return '\n'.join(lines) + '\n' + stage.get('log', '')
+
+    if result in ('meson_fail', 'ninja_fail'):
+        tool = result.split('_')[0]
+        lines += ['%s --> %s build failed' % (patchset, tool), '']
+        lines += write_env_result('compilation', 'FAIL')
+        lines += [
+            '%s build logs:' % (tool.capitalize()),
+            '-------------------------------BEGIN LOGS----------------------------',
+            stage.get('excerpt', ''),
+            '-------------------------------END LOGS------------------------------',
+        ]
+    elif result == 'build_pass':
+        lines += ['%s --> meson & ninja build successfully' % (patchset), '']
+        lines += write_env_result('compilation', 'PASS')
+    elif result == 'test_fail':
+        lines += ['%s --> testing fail' % (patchset), '']
+        lines += write_env_result('dpdk_unit_test', 'FAIL')
+        lines.append('Test result details:')
+        if stage.get('subset'):
+            lines.append(SUBSET_NOTE)
+        lines += write_test_summary(stage['tests'])
+        lines += ['', 'Test logs for failed test cases:']
+        lines += write_test_failures(stage['tests'])
+    elif result == 'test_skip':
+        lines += ['%s --> testing skipped' % (patchset), '']
+        lines += write_env_result('dpdk_unit_test', 'SKIPPED')
+        lines.append('Test result details:')
+        lines.append('No unit test is affected by the files changed in this patch set, none was run.')
+    else:
+        subset = result == 'test_subset_pass'
+        lines += ['%s --> testing pass%s' % (patchset, ' (affected tests only)' if subset else ''), '']
+        lines += write_env_result('dpdk_unit_test', 'PASS (subset)' if subset else 'PASS')
+        lines.append('Test result details:')
+        if subset:
+            lines.append(SUBSET_NOTE)
+        lines += write_test_summary(stage['tests'])
+    return '\n'.join(lines) + '\n'
+
+
+def get_report_headers(record: Dict, result: str) -> str:
+    """
+    Return the shell variable assignments of the patch the report replies
+    to: the first one when the series does not apply, the last one else.
+    """
+    target = record['patches'][0 if result == 'apply_fail' else -1]
+    values = dict(target)
+    values['pwids'] = get_patchset(record)
+    values['target_pwid'] = target['pwid']
+    return ''.join('%s="%s"\n' % (var, parse_email.shell_quote(values[var])) for var in SHELL_VARIABLES)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Record a test run of a series and render its reports')
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.required = True
+
+    init_parser = subparsers.add_parser('init', help='start the record of a run')
+    init_parser.add_argument('record', help='The run record file')
+    init_parser.add_argument('--series-dir', required=True, help='The directory with the patches of the series')
+    init_parser.add_argument('--series-id', required=True, help='The series ID')
+    init_parser.add_argument('--repo', required=True, help='The repo the series is applied on')
+    init_parser.add_argument('--branch', required=True, help='The branch the series is applied on')
+    init_parser.add_argument('--base-commit', required=True, help='The commit the series is applied on')
+
+    stage_parser = subparsers.add_parser('stage', help='record the outcome of a stage')
+    stage_parser.add_argument('record', help='The run record file')
+    stage_parser.add_argument('stage', choices=STAGES, help='The stage')
+    stage_parser.add_argument('outcome', choices=OUTCOMES, help='The outcome of the stage')
+    stage_parser.add_argument('--log', help='The log to keep the failure excerpt of')
+    stage_parser.add_argument('--testlog', nargs=2, metavar=('JSON', 'TXT'),
+                              help='The testlog.json and testlog.txt of meson test')
+    stage_parser.add_argument('--started', type=float, help='The time the stage started, in seconds since the epoch')
+    stage_parser.add_argument('--subset', action='store_true', help='only the tests affected by the series were run')
+
+    render_parser = subparsers.add_parser(
+        'render', help='write the report of a result and print the headers of the patch it replies to')
+    render_parser.add_argument('record', help='The run record file')
+    render_parser.add_argument('result', choices=sorted(RESULTS), help='The result to report')
+    render_parser.add_argument('--stage', choices=STAGES, help='The stage to take the result from')
+    render_parser.add_argument('-o', '--output', required=True, help='The report file to write')
+
+    args = parser.parse_args()
+
+    try:
+        if args.command == 'init':
+            record = init_record(args.series_dir, args.series_id, args.repo, args.branch, args.base_commit)
+            ci_files.save_json(args.record, record)
+        elif args.command == 'stage':
+            record = load_record(args.record)
+            set_stage(record, args.stage, args.outcome, args.log, args.testlog, args.started, args.subset)
+            ci_files.save_json(args.record, record)
+        else:
+            record = load_record(args.record)
+            with open(args.output, 'w') as f:
+                f.write(render_report(record, args.result, args.stage))
+            record['reports'].append({'result': args.result, 'time': time.time()})
+            ci_files.save_json(args.record, record)
+            sys.stdout.write(get_report_headers(record, args.result))
+    except (OSError, ValueError, KeyError, IndexError) as e:
+        print('%s: %s' % (args.command, e), file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    ci_profile.start()
+    main()
@@ -13,6 +13,10 @@ print_usage() {
 
 . $(dirname $(readlink -e $0))/load-ci-config.sh
 sendmail=${DPDK_CI_MAILER:-/usr/sbin/sendmail}
+if ${DPDK_CI_MAIL_QUEUE:-false} ; then
+	# Only queue the mails, mail_queue.py send delivers them
+	sendmail="python3.8 $(dirname $(readlink -e $0))/mail_queue.py enqueue"
+fi
 
 file=$1
 if [ -z "$file" ] ; then
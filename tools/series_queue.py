@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# SPDX-License-Identifier: BSD-3-Clause
+# Copyright 2024 Loongson
+
+"""
+Skip the series replaced by a newer version before they are tested.
+
+Two series are versions of each other when they come from the same
+submitter and have the same subject once the [PATCH vN m/n] like prefixes
+are removed. In every group only the highest Patchwork version is kept,
+the latest one for a RESEND. The versions are compared within one poll of
+Patchwork, and with the series still waiting in ci_queue.py: a new version
+drops the older one pending in the queue, or moves it last with --defer.
+Every superseded series is recorded in data/superseded_series.txt as
+"<series_id> <newer_series_id> <date>".
+
+Example usage:
+    ./series_queue.py 30001 30002 30005
+    ./series_queue.py --defer 30001 30002 30005
+"""
+
+import argparse
+import datetime
+import os
+import re
+import sys
+from typing import Dict, List, Optional, Tuple
+
+import requests
+
+import ci_profile
+import ci_queue
+
+PW_API_URL = os.environ.get('DPDK_CI_PW_API_URL', 'http://patches.dpdk.org/api')
+SUPERSEDED_FILE = os.path.join(os.path.dirname(os.path.realpath(__file__)), '../data/superseded_series.txt')
+
+_prefixes_regex = re.compile(r'^\s*(\[[^\]]*\]\s*)+')
+_space_regex = re.compile(r'\s+')
+
+
+def get_subject_stem(name: str) -> str:
+    """
+    Return a series name without its bracketed prefixes, e.g.
+    '[v3,1/2] net/foo: fix bar' -> 'net/foo: fix bar'.
+    """
+    name = _prefixes_regex.sub('', name)
+    return _space_regex.sub(' ', name).strip().rstrip('.').lower()
+
+
+def get_series(session: requests.Session, series_id: str) -> Optional[Dict]:
+    try:
+        response = session.get('%s/series/%s/' % (PW_API_URL, series_id), timeout=60)
+        response.raise_for_status()
+        return response.json()
+    except (requests.RequestException, ValueError) as e:
+        print('cannot get series %s: %s' % (series_id, e), file=sys.stderr)
+        return None
+
+
+def get_series_group(series: Dict) -> Optional[Tuple[str, str]]:
+    name = series.get('name')
+    if not name and series.get('patches'):
+        name = series['patches'][0].get('name')
+    submitter = (series.get('submitter') or {}).get('email')
+    if not name or not submitter:
+        return None
+    return submitter.lower(), get_subject_stem(name)
+
+
+def get_version_key(series: Dict, series_id: str) -> Tuple[int, int]:
+    # The newest of two versions, or of a series and its RESEND
+    return series.get('version') or 1, int(series_id)
+
+
+def find_superseded(series_list: Dict[str, Optional[Dict]]) -> Dict[str, str]:
+    """
+    Map every superseded series ID to the ID of the series replacing it.
+    Series which could not be fetched are never superseded.
+    """
+    groups: Dict[Tuple[str, str], List[Tuple[int, int, str]]] = {}
+    for series_id, series in series_list.items():
+        if series is None:
+            continue
+        group = get_series_group(series)
+        if group is None:
+            continue
+        groups.setdefault(group, []).append(get_version_key(series, series_id) + (series_id,))
+
+    superseded = {}
+    for versions in groups.values():
+        versions.sort()
+        newest = versions[-1][2]
+        for _, _, series_id in versions[:-1]:
+            superseded[series_id] = newest
+    return superseded
+
+
+def supersede_queued(series_id: str, series: Dict, defer: bool = False) -> Dict[str, str]:
+    """
+    Compare a series with the versions of it waiting in ci_queue.py and
+    map every superseded series ID to the ID replacing it. The older
+    versions pending are dropped from the queue, or moved last when
+    deferred; the series itself may be older than a pending one.
+    """
+    group = get_series_group(series)
+    if group is None:
+        return {}
+    key = get_version_key(series, series_id)
+    superseded = {}
+    with ci_queue.locked_queue() as queue:
+        for job in list(queue):
+            if job['kind'] != 'series' or job['series_id'] == series_id or job.get('group') != list(group):
+                continue
+            if job.get('superseded_by'):
+                continue
+            if (job.get('version') or 1, int(job['series_id'])) < key:
+                superseded[job['series_id']] = series_id
+                if defer:
+                    job['superseded_by'] = series_id
+                else:
+                    queue.remove(job)
+            else:
+                superseded[series_id] = job['series_id']
+    return superseded
+
+
+def record_superseded(superseded: Dict[str, str], path: str = SUPERSEDED_FILE) -> None:
+    if not superseded:
+        return
+    date_now = datetime.datetime.now(datetime.timezone.utc).strftime('%Y-%m-%dT%H:%M:%S')
+    with open(path, 'a') as f:
+        for series_id, newer in superseded.items():
+            f.write('%s %s %s\n' % (series_id, newer, date_now))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Print the series IDs to test, without the versions replaced by a newer one')
+    parser.add_argument('series_ids', metavar='series_id', nargs='+', help='The series IDs in arrival order')
+    parser.add_argument('--defer', action='store_true',
+                        help='print the superseded series last instead of dropping them')
+
+    args = parser.parse_args()
+
+    session = requests.Session()
+    series_ids = list(dict.fromkeys(args.series_ids))
+    series_list = {series_id: get_series(session, series_id) for series_id in series_ids}
+    superseded = find_superseded(series_list)
+
+    for series_id, newer in superseded.items():
+        print('series %s is superseded by series %s' % (series_id, newer), file=sys.stderr)
+    record_superseded(superseded)
+
+    order = [series_id for series_id in series_ids if series_id not in superseded]
+    if args.defer:
+        order += [series_id for series_id in series_ids if series_id in superseded]
+    if order:
+        print('\n'.join(order))
+
+
+if __name__ == '__main__':
+    ci_profile.start()
+    main()
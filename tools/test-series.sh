@@ -6,14 +6,21 @@
 BRANCH_PREFIX=s
 REUSE_PATCH=false
 KEEP_BASE=false
+FORCE_RUN=false
 last_gpr_file="last_gpr.txt"
 
-parse_email=$(dirname $(readlink -e $0))/../tools/parse-email.sh
 send_series_report=$(dirname $(readlink -e $0))/../tools/send-series-report-la.sh
 download_series=$(dirname $(readlink -e $0))/../tools/download-series.sh
 get_patch_check=$(dirname $(readlink -e $0))/../tools/get-patch-check.sh
-parse_testlog=$(dirname $(readlink -e $0))/../tools/parse_testlog.py
 pw_maintainers_cli=$(dirname $(readlink -e $0))/../tools/pw_maintainers_cli.py
+test_impact=$(dirname $(readlink -e $0))/../tools/test_impact.py
+build_scope=$(dirname $(readlink -e $0))/../tools/build_scope.py
+result_cache=$(dirname $(readlink -e $0))/../tools/result_cache.py
+run_record=$(dirname $(readlink -e $0))/../tools/run_record.py
+test_rerun=$(dirname $(readlink -e $0))/../tools/test_rerun.py
+compiler_cache=$(dirname $(readlink -e $0))/../tools/compiler_cache.py
+mirror_fetcher=$(dirname $(readlink -e $0))/../tools/mirror_fetcher.py
+ci_trace=$(dirname $(readlink -e $0))/../tools/ci_trace.py
 repo_branch_cfg=$(dirname $(readlink -e $0))/../config/repo_branch.cfg
 repo_branch_cfg_v2=$(dirname $(readlink -e $0))/../config/repo_branch_v2.cfg
 token_file=$(dirname $(readlink -e $0))/../.pw_token.dat
@@ -32,6 +39,18 @@ desc_ninja_build_failure="ninja build failure"
 desc_build_pass="Compilation OK"
 desc_unit_test_fail="Unit Testing FAIL"
 desc_unit_test_pass="Unit Testing PASS"
+desc_unit_test_subset_pass="Unit Testing PASS (affected tests only)"
+desc_unit_test_skip="Unit Testing SKIPPED (no affected test)"
+
+. $(dirname $(readlink -e $0))/load-ci-config.sh
+result_cache_enabled=${DPDK_CI_RESULT_CACHE:-true}
+result_cache_rerun=${DPDK_CI_RESULT_CACHE_RERUN:-test_fail}
+result_cache_max_age=${DPDK_CI_RESULT_CACHE_MAX_AGE:-30}
+compiler_cache_enabled=${DPDK_CI_CCACHE:-true}
+mirror_enabled=${DPDK_CI_MIRROR:-false}
+test_impact_full=${DPDK_CI_TEST_IMPACT_FULL:-true}
+dpdk_home=${DPDK_CI_DPDK_HOME:-/home/zhoumin/gh_dpdk}
+pw_api_url=${DPDK_CI_PW_API_URL:-https://patches.dpdk.org/api}
 
 export LC="en_US.UTF-8"
 export LANG="en_US.UTF-8"
@@ -40,6 +59,9 @@ print_usage() {
 	cat <<- END_OF_HELP
 	usage: $(basename $0) [OPTIONS] <series_id>
 
+	options:
+		-f     test the series even if an identical one was tested
+
 	Run dpdk ci tests for one series specified by the series_id
 	END_OF_HELP
 }
@@ -65,48 +87,79 @@ check_patch_check() {
 	fi
 }
 
-send_series_test_report() {
-	series_id=$1
-	patches_dir=$2
-	label=$3
-	status=$4
-	desc=$5
-	report=$6
-	mail_file=$7
-
-	first_pwid=`head -1 $patches_dir/pwid_order.txt`
-	last_pwid=`tail -1 $patches_dir/pwid_order.txt`
-	mail_path=$patches_dir/$mail_file
-
-	target_pwid=$last_pwid
-	if [ "$desc" = "$desc_apply_failure" ] ; then
-		target_pwid=$first_pwid
-	fi
-
-	check_patch_check $target_pwid "$label"
+# Write the report of a result from the run record and send it
+send_record_report() { # <result> [stage]
+	result=$1
+	case $result in
+	apply_fail)
+		label=$label_compilation ; status=$status_warning
+		desc=$desc_apply_failure ; mail_file=$build_mail ;;
+	meson_fail)
+		label=$label_compilation ; status=$status_failure
+		desc=$desc_meson_build_failure ; mail_file=$build_mail ;;
+	ninja_fail)
+		label=$label_compilation ; status=$status_failure
+		desc=$desc_ninja_build_failure ; mail_file=$build_mail ;;
+	build_pass)
+		label=$label_compilation ; status=$status_success
+		desc=$desc_build_pass ; mail_file=$build_mail ;;
+	test_fail)
+		label=$label_unit_testing ; status=$status_failure
+		desc=$desc_unit_test_fail ; mail_file=$unit_test_mail ;;
+	test_pass)
+		label=$label_unit_testing ; status=$status_success
+		desc=$desc_unit_test_pass ; mail_file=$unit_test_mail ;;
+	test_subset_pass)
+		label=$label_unit_testing ; status=$status_success
+		desc=$desc_unit_test_subset_pass ; mail_file=$unit_test_mail ;;
+	test_skip)
+		label=$label_unit_testing ; status=$status_success
+		desc=$desc_unit_test_skip ; mail_file=$unit_test_mail ;;
+	esac
 
-	pwids=$first_pwid
-	if [ $first_pwid != $last_pwid ] ; then
-		pwids=$first_pwid-$last_pwid
+	failed=false
+	headers=$(python3 $run_record render $record $result ${2:+--stage $2} -o $test_report) || failed=true
+	if $failed ; then
+		echo "render report $result for series $series_id failed"
+		exit 1
 	fi
-
-	eval $($parse_email $patches_dir/$target_pwid.patch)
+	eval "$headers"
 	if [ -z "$subject" -o -z "$from" -o -z "$msgid" \
 		-o -z "$pwid" -o -z "$listid" ] ; then
 		echo "parse email failed: $patches_dir/$target_pwid.patch"
 		exit 1
 	fi
 
+	check_patch_check $target_pwid "$label"
+
 	#from="zhoumin@loongson.cn"
 	echo "send test report for series $series_id to $from"
+	report_start=$(date +%s.%N)
+	failed=false
 	$send_series_report -t "$subject" -f "$from" -m "$msgid" -p "$target_pwid" \
 		-r "$pwids" -o "$listid" -l "$label" \
-		-s "$status" -d "$desc" -k "$mail_path" < $report
+		-s "$status" -d "$desc" -k "$patches_dir/$mail_file" < $test_report || failed=true
+	if $failed ; then
+		trace_span report fail $report_start
+		return 1
+	fi
+	trace_span report pass $report_start
+}
+
+# Record the outcome of a stage in the run record
+record_stage() { # <stage> <outcome> [options]
+	python3 $run_record stage $record "$@" || true
+}
+
+# Record the time taken by a stage in the trace of ci_trace.py
+trace_span() { # <stage> <outcome> <start> [retries]
+	python3 $ci_trace span $1 $2 --start $3 --series-id $series_id --retries ${4:-0} || true
 }
 
 try_apply() {
 	repo=$1
 	need_send=$2
+	apply_attempts=$((apply_attempts+1))
 
 	failed=false
 	ori_base=$(cat $repo_branch_cfg | jq "try ( .\"$repo\" )" |sed 's,",,g') || failed=true
@@ -124,7 +177,7 @@ try_apply() {
 
 	# Use the DPDK github mirrors as the remote repo
 	# DPDK_HOME=/home/zhoumin/$repo
-	DPDK_HOME=/home/zhoumin/gh_dpdk
+	DPDK_HOME=$dpdk_home
 	if [ ! -d "$DPDK_HOME" ] ; then
 		echo "$DPDK_HOME is not directory"
 		exit 1
@@ -151,9 +204,18 @@ try_apply() {
 
 	git checkout unused
 	git branch -D $base
+
+	# Take the freshest commit fetched by mirror_fetcher.py, without network
+	mirror_commit=""
+	if $mirror_enabled && ! $KEEP_BASE ; then
+		mirror_commit=$(python3.8 $mirror_fetcher update --checkout $DPDK_HOME \
+			$repo $ori_base refs/remotes/origin/$base) || mirror_commit=""
+	fi
 	git checkout origin/$base -b $base
 
-	if ! $KEEP_BASE ; then
+	if [ -n "$mirror_commit" ] ; then
+		echo "base $base updated from the mirror of $repo: $mirror_commit"
+	elif ! $KEEP_BASE ; then
 		need_update=true
 		if [ -f "$last_gpr_file" ] ; then
 			failed=false
@@ -175,6 +237,8 @@ try_apply() {
 		fi
 	fi
 	base_commit=`git log -1 --format=oneline |awk '{print $1}'`
+	python3 $run_record init $record --series-dir $patches_dir --series-id $series_id \
+		--repo $repo --branch $ori_base --base-commit $base_commit
 
 	new_branch=$BRANCH_PREFIX-$series_id
 	ret=`git branch --list $new_branch`
@@ -200,8 +264,8 @@ try_apply() {
 			echo "This patch cannot apply on $repo: $patch_email"
 			if $need_send ; then
 				failed=false
-				test_report_series_apply_fail $repo $ori_base $base_commit $patches_dir $apply_log $test_report
-				send_series_test_report $series_id $patches_dir "$label_compilation" $status_warning "$desc_apply_failure" $test_report $build_mail || failed=true
+				record_stage apply fail --log $apply_log
+				send_record_report apply_fail || failed=true
 				if $failed ; then
 				       echo "send series test report for $series_id failed!"
 				fi
@@ -213,6 +277,129 @@ try_apply() {
 		git am $patch_email
 		applied=true
 	done < $patches_dir/pwid_order.txt
+	if $applied ; then
+		record_stage apply pass
+	fi
+}
+
+# Send the compilation report unless the compile-only build of the affected
+# components already sent the same status
+send_compilation_report() { # <status> <result>
+	if [ "$1" = "$early_status" ] ; then
+		echo "compilation report $1 already sent for series $series_id"
+		return
+	fi
+	send_record_report $2
+}
+
+# Build only the components affected by the series, their dependents and
+# dependencies, and send an early compilation report
+build_affected_components() {
+	scope=$(python3 $build_scope --dpdk-dir $DPDK_HOME --base $base_commit --series-dir $patches_dir) || scope=""
+	if [ -z "$scope" ] ; then
+		echo "no compile-only build for series $series_id"
+		return
+	fi
+
+	echo "compile-only build with: $(echo $scope | tr '\n' ' ')"
+	scoped_build=$DPDK_HOME/build-scoped
+	rm -rf $scoped_build
+
+	failed=false
+	stage_start=$(date +%s.%N)
+	meson setup $scoped_build $scope || failed=true
+	if $failed ; then
+		echo "compile-only meson build failure"
+		record_stage scoped_meson fail --log $scoped_build/meson-logs/meson-log.txt --started $stage_start
+		trace_span scoped_meson fail $stage_start
+		send_record_report meson_fail scoped_meson
+		early_status=$status_failure
+		return
+	fi
+	record_stage scoped_meson pass --started $stage_start
+	trace_span scoped_meson pass $stage_start
+
+	failed=false
+	stage_start=$(date +%s.%N)
+	ninja -C $scoped_build &> $scoped_build/ninja-log.txt || failed=true
+	if $failed ; then
+		echo "compile-only ninja build failure"
+		record_stage scoped_ninja fail --log $scoped_build/ninja-log.txt --started $stage_start
+		trace_span scoped_ninja fail $stage_start
+		send_record_report ninja_fail scoped_ninja
+		early_status=$status_failure
+		return
+	fi
+	record_stage scoped_ninja pass --started $stage_start
+	trace_span scoped_ninja pass $stage_start
+
+	echo "compile-only meson & ninja build pass"
+	send_record_report build_pass scoped_ninja
+	early_status=$status_success
+	rm -rf $scoped_build
+}
+
+# Print and record the compiler cache hits of the builds of the series
+report_compiler_cache() {
+	if $compiler_cache_enabled ; then
+		python3 $compiler_cache report $ccache_stats --record $record || true
+	fi
+}
+
+# Remember the result of a label for the series identical to this one
+cache_result() { # <label> <result> [log...]
+	cache_label=$1
+	cache_res=$2
+	shift 2
+
+	if [ -z "$cache_key" ] ; then
+		return
+	fi
+	cache_logs=""
+	for log in "$@" ; do
+		cache_logs="$cache_logs --log $log"
+	done
+	python3 $result_cache store $cache_key $cache_label $cache_res --series-id $series_id $cache_logs || true
+}
+
+# Report the failure of unit tests, the run is over
+report_unit_test_fail() { # [--subset]
+	echo "unit testing fail"
+	python3 $test_impact record --testlog $testlog_json --series-dir $patches_dir || true
+	python3 $test_rerun record $testlog_json --series-id $series_id || true
+	record_stage test fail $1 --testlog $testlog_json $testlog_txt --started $stage_start
+	trace_span test fail $stage_start
+	send_record_report test_fail
+	cache_result unit_testing test_fail $testlog_json $testlog_txt
+	# A recheck of the same code only reruns the failed tests on this build
+	python3 $test_rerun keep --dpdk-dir $DPDK_HOME --series-dir $patches_dir --base $base_commit || true
+}
+
+# Send the reports of the results reused from an identical series
+send_cached_results() { # <results>
+	while read -r cache_label cache_res cache_sid log1 log2 <&3 ; do
+		echo "reuse $cache_label result $cache_res of series $cache_sid"
+		case $cache_res in
+		meson_fail)
+			record_stage meson fail --log $log1
+			;;
+		ninja_fail)
+			record_stage ninja fail --log $log1
+			;;
+		test_fail|test_pass)
+			record_stage test ${cache_res#test_} --testlog $log1 $log2
+			;;
+		test_subset_pass)
+			record_stage test pass --subset --testlog $log1 $log2
+			;;
+		test_skip)
+			record_stage test skip
+			;;
+		esac
+		send_record_report $cache_res
+	done 3<<- END_OF_RESULTS
+	$1
+	END_OF_RESULTS
 }
 
 save_base_commit() {
@@ -223,8 +410,9 @@ save_base_commit() {
 	echo "$sid $commit" >> $base_commits_file
 }
 
-while getopts hkr arg ; do
+while getopts fhkr arg ; do
 	case $arg in
+		f ) FORCE_RUN=true ;;
 		k ) KEEP_BASE=true ;;
 		r ) REUSE_PATCH=true ;;
 		h ) print_usage ; exit 0 ;;
@@ -242,9 +430,13 @@ fi
 
 series_id=$1
 patches_dir=$(dirname $(readlink -e $0))/../series/$series_id
+record=$patches_dir/run_record.json
 
 # This can also be "-g"
 g_opt=""
+if ${DPDK_CI_PW_HTTP_GET:-false} ; then
+	g_opt="-g"
+fi
 
 if $REUSE_PATCH ; then
 	if [ ! -d $patches_dir ] ; then
@@ -264,17 +456,19 @@ else
 	fi
 fi
 
-export PW_SERVER="https://patches.dpdk.org/api/1.2/"
+export PW_SERVER="$pw_api_url/1.2/"
 export PW_PROJECT=dpdk
 export PW_TOKEN=$(cat $token_file)
-export MAINTAINERS_FILE_PATH=/home/zhoumin/gh_dpdk/MAINTAINERS
+export MAINTAINERS_FILE_PATH=$dpdk_home/MAINTAINERS
 
 default_repo=dpdk
 
 failed=false
+stage_start=$(date +%s.%N)
 repo=$(timeout -s SIGKILL 120s python3.8 $pw_maintainers_cli --type series list-trees $series_id) || failed=true
 if $failed ; then
 	echo "list trees for series $series_id timeout, exit ..."
+	trace_span tree_lookup fail $stage_start
 	exit 1
 elif [ -z "$repo" ] ; then
 	echo "list trees for series $series_id failed, default to '$default_repo'"
@@ -282,10 +476,11 @@ elif [ -z "$repo" ] ; then
 else
 	echo "list trees for series $series_id: $repo"
 fi
-
-. $(dirname $(readlink -e $0))/gen-test-report.sh
+trace_span tree_lookup pass $stage_start
 
 applied=false
+apply_attempts=0
+apply_start=$(date +%s.%N)
 
 # Firstly, try to apply on prefer repo gotten from pw_maintainers_cli.py
 prefer_repo=$repo
@@ -309,50 +504,134 @@ if ! $applied ; then
 fi
 
 if ! $applied ; then
+	trace_span apply fail $apply_start $((apply_attempts-1))
 	echo "Cannot apply patch(es) for series $series_id, please check series directory and related repos"
 	echo "Test will not be executed!"
 	# exit successfully to skip this series
 	exit 0
 fi
 
+trace_span apply pass $apply_start $((apply_attempts-1))
+
 rm -rf build
 
 save_base_commit $series_id $base_commit
 
+# Reuse the results of an identical series tested on the same base commit
+cache_key=""
+if $result_cache_enabled ; then
+	cache_key=$(python3 $result_cache key --series-dir $patches_dir --base $base_commit) || cache_key=""
+fi
+if [ -n "$cache_key" ] && ! $FORCE_RUN ; then
+	cache_rerun=$result_cache_rerun
+	if $test_impact_full ; then
+		# Tested by the affected tests only, the full suite was not run
+		cache_rerun="$cache_rerun,test_subset_pass,test_skip"
+	fi
+	cached=$(python3 $result_cache lookup $cache_key --rerun "$cache_rerun" \
+		--max-age $result_cache_max_age) || cached=""
+	if [ -n "$cached" ] ; then
+		echo "series $series_id is identical to a tested series, reuse its results"
+		send_cached_results "$cached"
+		exit 0
+	fi
+fi
+
+# Compile through the compiler cache shared by all the checkouts
+ccache_stats=$patches_dir/ccache-stats.json
+if $compiler_cache_enabled ; then
+	eval "$(python3 $compiler_cache env --basedir $(dirname $DPDK_HOME))"
+	python3 $compiler_cache snapshot $ccache_stats || compiler_cache_enabled=false
+fi
+
+# Phase one: early verdict from the affected components only
+early_status=""
+build_affected_components
+
+# Phase two: the full build gives the authoritative verdict
 failed=false
+stage_start=$(date +%s.%N)
 meson build || failed=true
 if $failed ; then
 	echo "meson build failure"
-	test_report_series_meson_build_fail $repo $ori_base $base_commit $patches_dir $meson_log $test_report
-	send_series_test_report $series_id $patches_dir "$label_compilation" $status_failure "$desc_meson_build_failure" $test_report $build_mail
+	record_stage meson fail --log $meson_log --started $stage_start
+	trace_span meson fail $stage_start
+	report_compiler_cache
+	send_compilation_report $status_failure meson_fail
+	cache_result compilation meson_fail $meson_log
 	exit 0
 fi
+record_stage meson pass --started $stage_start
+trace_span meson pass $stage_start
+
+python3 $build_scope --dpdk-dir $DPDK_HOME --base $base_commit --series-dir $patches_dir --introspect build || true
 
 failed=false
+stage_start=$(date +%s.%N)
 ninja -C build &> $ninja_log || failed=true
 if $failed ; then
 	echo "ninja build failure"
-	test_report_series_ninja_build_fail $repo $ori_base $base_commit $patches_dir $ninja_log $test_report
-	send_series_test_report $series_id $patches_dir "$label_compilation" $status_failure "$desc_ninja_build_failure" $test_report $build_mail
+	record_stage ninja fail --log $ninja_log --started $stage_start
+	trace_span ninja fail $stage_start
+	report_compiler_cache
+	send_compilation_report $status_failure ninja_fail
+	cache_result compilation ninja_fail $ninja_log
 	exit 0
 fi
+record_stage ninja pass --started $stage_start
+trace_span ninja pass $stage_start
+report_compiler_cache
 
 echo "meson & ninja build pass"
-test_report_series_build_pass $repo $ori_base $base_commit $patches_dir $test_report
-send_series_test_report $series_id $patches_dir "$label_compilation" $status_success "$desc_build_pass" $test_report $build_mail
+send_compilation_report $status_success build_pass
+cache_result compilation build_pass
+
+# Run the unit tests affected by the series first and report them early,
+# then the whole suite for the final report, unless disabled. Core changes
+# such as EAL or the build system run the whole suite at once.
+tests=$(python3 $test_impact select --dpdk-dir $DPDK_HOME --build-dir build \
+	--base $base_commit --series-dir $patches_dir) || tests=ALL
+if [ -z "$tests" ] ; then
+	echo "no unit test is affected by series $series_id"
+	if ! $test_impact_full ; then
+		record_stage test skip
+		send_record_report test_skip
+		cache_result unit_testing test_skip
+		exit 0
+	fi
+elif [ "$tests" != "ALL" ] ; then
+	echo "run unit tests affected by series $series_id: $(echo $tests | tr '\n' ' ')"
+	failed=false
+	stage_start=$(date +%s.%N)
+	meson test -C build --suite DPDK:fast-tests --test-args="-l 0-7" -t 20 $tests || failed=true
+	if $failed ; then
+		# The whole suite would fail too
+		report_unit_test_fail --subset
+		exit 0
+	fi
+	record_stage test pass --subset --testlog $testlog_json $testlog_txt --started $stage_start
+	trace_span test_subset pass $stage_start
+	send_record_report test_subset_pass
+	if ! $test_impact_full ; then
+		cache_result unit_testing test_subset_pass $testlog_json $testlog_txt
+		exit 0
+	fi
+fi
 
+echo "run all unit tests"
 failed=false
+stage_start=$(date +%s.%N)
 meson test -C build --suite DPDK:fast-tests --test-args="-l 0-7" -t 20 || failed=true
 echo "test done!"
 if $failed ; then
-	echo "unit testing fail"
-	test_report_series_test_fail $repo $ori_base $base_commit $patches_dir $testlog_json $testlog_txt $test_report
-	send_series_test_report $series_id $patches_dir "$label_unit_testing" $status_failure "$desc_unit_test_fail" $test_report $unit_test_mail
+	report_unit_test_fail
 	exit 0
 fi
 
 echo "unit testing pass"
-test_report_series_test_pass $repo $ori_base $base_commit $patches_dir $testlog_json $testlog_txt $test_report
-send_series_test_report $series_id $patches_dir "$label_unit_testing" $status_success "$desc_unit_test_pass" $test_report $unit_test_mail
+record_stage test pass --testlog $testlog_json $testlog_txt --started $stage_start
+trace_span test pass $stage_start
+send_record_report test_pass
+cache_result unit_testing test_pass $testlog_json $testlog_txt
 
 cd -
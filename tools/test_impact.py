@@ -0,0 +1,307 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# SPDX-License-Identifier: BSD-3-Clause
+# Copyright 2024 Loongson
+
+"""
+Select the DPDK:fast-tests unit tests affected by the files a series
+changes.
+
+config/test_impact.cfg decides whether a changed path runs the whole
+suite, no test at all, or the tests mapped to its component. The mapping
+is generated from the tree: every test source in app/test registering a
+test is linked to the components owning the headers it includes, and a
+changed component also selects the tests of the components depending on
+it. Tests which failed in the past when a component changed are added
+from data/test_failures.json.
+
+Example usage:
+    ./test_impact.py select --dpdk-dir ~/dpdk --build-dir build --series-dir series/123
+    ./test_impact.py record --testlog build/meson-logs/testlog.json --series-dir series/123
+"""
+
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+from configparser import ConfigParser
+from typing import Dict, Iterable, List, Optional, Set
+
+import ci_profile
+import dpdk_components
+import patch_parser
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.realpath(__file__)), '../data')
+CACHE_DIR = os.path.join(DATA_DIR, 'test_impact')
+HISTORY_FILE = os.path.join(DATA_DIR, 'test_failures.json')
+CONFIG_FILE = os.path.join(os.path.dirname(os.path.realpath(__file__)), '../config/test_impact.cfg')
+
+FAST_TESTS_SUITE = 'fast-tests'
+TEST_DIR = 'app/test'
+
+_register_regex = re.compile(r'\bREGISTER_(?:\w+_)?TEST(?:_COMMAND)?\(\s*(\w+)')
+_include_regex = re.compile(r'^\s*#\s*include\s*[<"]([^>"]+)[>"]', re.MULTILINE)
+_meson_fast_test_regex = re.compile(r"\[\s*'(\w+)'\s*,\s*(?:true|false)")
+
+
+def _read(path: str) -> str:
+    with open(path, 'r', encoding='utf-8', errors='replace') as f:
+        return f.read()
+
+
+def list_fast_tests(dpdk_dir: str, build_dir: Optional[str] = None) -> Set[str]:
+    """
+    Return the names of the fast-tests, from meson introspection of the
+    build directory when possible, from the test sources otherwise.
+    """
+    if build_dir:
+        try:
+            p = subprocess.run(['meson', 'introspect', '--tests', build_dir],
+                               capture_output=True, check=True, timeout=60)
+            return set(test['name'] for test in json.loads(p.stdout)
+                       if any(suite.split(':')[-1] == FAST_TESTS_SUITE for suite in test['suite']))
+        except (OSError, subprocess.SubprocessError, ValueError, KeyError) as e:
+            print('meson introspect failed, falling back to the sources: %s' % (e), file=sys.stderr)
+
+    tests: Set[str] = set()
+    test_dir = os.path.join(dpdk_dir, TEST_DIR)
+    for name in os.listdir(test_dir):
+        if name.endswith('.c'):
+            tests.update(re.findall(r'\bREGISTER_FAST_TEST\(\s*(\w+)', _read(os.path.join(test_dir, name))))
+    if not tests:
+        # Before REGISTER_FAST_TEST the list lived in app/test/meson.build
+        tests.update(_meson_fast_test_regex.findall(_read(os.path.join(test_dir, 'meson.build'))))
+    return tests
+
+
+def scan_tests(dpdk_dir: str, headers: Dict[str, List[str]]) -> Dict:
+    """
+    Map every file of app/test to the tests it is part of, and every
+    component to the tests including one of its headers.
+    """
+    test_dir = os.path.join(dpdk_dir, TEST_DIR)
+    includes: Dict[str, List[str]] = {}
+    registered: Dict[str, List[str]] = {}
+    for name in os.listdir(test_dir):
+        if not name.endswith(('.c', '.h')):
+            continue
+        text = _read(os.path.join(test_dir, name))
+        includes[name] = _include_regex.findall(text)
+        registered[name] = _register_regex.findall(text)
+
+    file_tests: Dict[str, Set[str]] = {}
+    component_tests: Dict[str, Set[str]] = {}
+    for source, tests in registered.items():
+        if not tests:
+            continue
+        # Follow the local headers of app/test, they are often shared
+        # by several test sources.
+        seen = set()
+        pending = [source]
+        while pending:
+            name = pending.pop()
+            if name in seen:
+                continue
+            seen.add(name)
+            file_tests.setdefault(TEST_DIR + '/' + name, set()).update(tests)
+            for include in includes.get(name, []):
+                base = os.path.basename(include)
+                if base in includes:
+                    pending.append(base)
+                for component in headers.get(base, []):
+                    component_tests.setdefault(component, set()).update(tests)
+
+    return {
+        'file_tests': {key: sorted(value) for key, value in file_tests.items()},
+        'component_tests': {key: sorted(value) for key, value in component_tests.items()},
+    }
+
+
+def load_test_index(dpdk_dir: str, base_commit: Optional[str] = None) -> Dict:
+    """
+    Return the component and test index of the checkout, cached per base
+    commit when base_commit is given.
+    """
+    cache_file = None
+    if base_commit:
+        cache_file = os.path.join(CACHE_DIR, base_commit + '.json')
+        if os.path.isfile(cache_file):
+            with open(cache_file) as f:
+                return json.load(f)
+
+    components = dpdk_components.load_components(dpdk_dir, base_commit)
+    index = scan_tests(dpdk_dir, components['headers'])
+    index['components'] = components
+
+    if cache_file:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        tmp_file = cache_file + '.tmp'
+        with open(tmp_file, 'w') as f:
+            json.dump(index, f)
+        os.replace(tmp_file, cache_file)
+    return index
+
+
+def load_history(path: str = HISTORY_FILE) -> Dict[str, Dict[str, int]]:
+    if not os.path.isfile(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def load_rules(config_file_path: str = CONFIG_FILE) -> patch_parser.PathTagTrie:
+    conf_obj = ConfigParser()
+    conf_obj.optionxform = str
+    conf_obj.read(config_file_path)
+    return patch_parser.PathTagTrie(patch_parser.get_dictionary_attributes_from_config_file(conf_obj))
+
+
+def changes_index_inputs(changed_files: Iterable[str]) -> bool:
+    """
+    Tell if a series changes what the index is generated from, in which
+    case the index of its patched tree must not be cached for the base.
+    """
+    return any(f.startswith(TEST_DIR + '/') or os.path.basename(f) == 'meson.build' or f.endswith('.h')
+               for f in changed_files)
+
+
+def get_changed_components(changed_files: Iterable[str], rules: patch_parser.PathTagTrie,
+                           components: List[str]) -> Optional[Set[str]]:
+    """
+    Return the components of the mapped changed files, or None when one
+    of the files requires the whole suite.
+    """
+    changed: Set[str] = set()
+    for f in changed_files:
+        kind = rules.get_longest_match_tags(f)
+        if kind is None or 'full' in kind:
+            return None
+        if 'none' in kind or f.startswith(TEST_DIR + '/'):
+            continue
+
+        component = dpdk_components.component_of(f)
+        if component is not None:
+            changed.add(component)
+            continue
+        # A file shared by a whole driver class, e.g. drivers/net/meson.build
+        prefix = os.path.dirname(f) + '/'
+        shared = [c for c in components if c.startswith(prefix)]
+        if not shared:
+            return None
+        changed.update(shared)
+    return changed
+
+
+def select_tests(dpdk_dir: str, changed_files: Iterable[str], rules: patch_parser.PathTagTrie,
+                 index: Dict, history: Dict[str, Dict[str, int]], fast_tests: Set[str]) -> Optional[List[str]]:
+    """
+    Return the sorted fast-tests affected by the changed files, or None
+    when the whole suite must run.
+    """
+    changed_files = list(changed_files)
+    changed = get_changed_components(changed_files, rules, index['components']['components'])
+    if changed is None:
+        return None
+
+    tests: Set[str] = set()
+    for f in changed_files:
+        if not f.startswith(TEST_DIR + '/') or 'none' in (rules.get_longest_match_tags(f) or []):
+            continue
+        if f in index['file_tests']:
+            tests.update(index['file_tests'][f])
+        elif os.path.isfile(os.path.join(dpdk_dir, f)):
+            # A test source added by the series
+            tests.update(_register_regex.findall(_read(os.path.join(dpdk_dir, f))))
+
+    for component in dpdk_components.get_dependents(index['components'], changed):
+        tests.update(index['component_tests'].get(component, []))
+        tests.update(history.get(component, {}).keys())
+
+    return sorted(tests & fast_tests)
+
+
+def record_failures(testlog_json_path: str, changed_files: Iterable[str],
+                    history_path: str = HISTORY_FILE) -> None:
+    """
+    Remember the tests which failed for the components a series changed.
+    """
+    failed = []
+    with open(testlog_json_path) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            result = json.loads(line)
+            if result['returncode'] != 0 and result['returncode'] != 77:
+                failed.append(result['name'])
+    if not failed:
+        return
+
+    changed = set(filter(None, map(dpdk_components.component_of, changed_files)))
+    if not changed:
+        return
+
+    history = load_history(history_path)
+    for component in changed:
+        counts = history.setdefault(component, {})
+        for name in failed:
+            counts[name] = counts.get(name, 0) + 1
+
+    tmp_file = history_path + '.tmp'
+    with open(tmp_file, 'w') as f:
+        json.dump(history, f, indent=4, sort_keys=True)
+    os.replace(tmp_file, history_path)
+
+
+def get_changed_files(args) -> Set[str]:
+    patch_files = list(args.patch_files)
+    if args.series_dir:
+        patch_files += patch_parser.get_patch_files_in_series(args.series_dir)
+    return patch_parser.get_all_files_from_patches(patch_files)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Select the fast-tests affected by a series, or record its failures')
+    parser.add_argument('command', choices=['select', 'record'], help='Command to perform')
+    parser.add_argument('patch_files', metavar='patch file', nargs='*', help='The patch files')
+    parser.add_argument('--series-dir', help='A series directory containing pwid_order.txt')
+    parser.add_argument('--dpdk-dir', default='.', help='The path to the patched DPDK checkout')
+    parser.add_argument('--build-dir', help='The meson build directory, to list the fast-tests')
+    parser.add_argument('--base', help='The base commit of the series, to cache the index')
+    parser.add_argument('--testlog', help='The testlog.json of the run, for record')
+    parser.add_argument('--config', default=CONFIG_FILE, help='The path to test_impact.cfg')
+
+    args = parser.parse_intermixed_args()
+
+    if not args.patch_files and not args.series_dir:
+        parser.error('at least one patch file or --series-dir is required')
+
+    changed_files = get_changed_files(args)
+
+    if args.command == 'record':
+        if not args.testlog:
+            parser.error('record requires --testlog')
+        record_failures(args.testlog, changed_files)
+        return
+
+    base = args.base
+    if changes_index_inputs(changed_files):
+        base = None
+    index = load_test_index(args.dpdk_dir, base)
+    fast_tests = list_fast_tests(args.dpdk_dir, args.build_dir)
+
+    tests = select_tests(args.dpdk_dir, changed_files, load_rules(args.config), index,
+                         load_history(), fast_tests)
+    # "ALL" asks for the whole suite, an empty output for no test at all
+    if tests is None:
+        print('ALL')
+    elif tests:
+        print('\n'.join(tests))
+
+
+if __name__ == '__main__':
+    ci_profile.start()
+    main()
@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# SPDX-License-Identifier: BSD-3-Clause
+# Copyright 2024 Loongson
+
+"""
+Rerun only the failed unit tests of a series for a unit testing recheck,
+and fingerprint the test failures to recognize the flaky ones.
+
+When the unit tests of a series fail, its build directory is kept in
+build-keep/<key> of the DPDK checkout, the key being the result_cache.py
+key of the patches and the base commit, so it is only reused for the very
+same code. A recheck restores it, reruns the failed tests without
+rebuilding and merges their results into the testlog of the first run.
+Only the last few builds are kept.
+
+The fingerprint of a failure is the test name with the last lines of its
+output, once the numbers and addresses are removed. The fingerprints are
+counted in data/test_fingerprints.json; a failure is known flaky when it
+passed on a rerun of the same build, or when it was seen on several
+unrelated series.
+
+Example usage:
+    ./test_rerun.py keep --dpdk-dir ~/dpdk --series-dir series/123 --base <commit>
+    ./test_rerun.py restore --dpdk-dir ~/dpdk --series-dir series/123 --base <commit>
+    ./test_rerun.py failed build/meson-logs/testlog.json
+    ./test_rerun.py merge testlog-previous.json build/meson-logs/testlog.json --txt build/meson-logs/testlog.txt
+    ./test_rerun.py record build/meson-logs/testlog.json --series-id 123 --rerun-of testlog-previous.json
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import shutil
+import sys
+import time
+from typing import Dict, List, Optional
+
+import ci_files
+import ci_profile
+import result_cache
+
+HISTORY_FILE = os.path.join(os.path.dirname(os.path.realpath(__file__)), '../data/test_fingerprints.json')
+KEEP_DIR = 'build-keep'
+BUILD_DIR = 'build'
+
+# Number of failed builds kept for the rechecks
+KEEP_BUILDS = int(os.environ.get('DPDK_CI_KEEP_BUILDS', '3'))
+
+# Test return codes which are not failures: success and skipped
+TEST_OK_RETURNCODES = (0, 77)
+
+# Lines of output in the signature of a failure
+SIGNATURE_LINES = 5
+
+# A failure seen on this many series is flaky, whatever they change
+FLAKY_SERIES = 3
+# Number of series remembered per fingerprint
+MAX_SERIES = 20
+
+# The summary of meson test, with the results counted on each line
+SUMMARY = (
+    ('Ok:', ('OK',)),
+    ('Expected Fail:', ('EXPECTEDFAIL',)),
+    ('Fail:', ('FAIL', 'ERROR')),
+    ('Unexpected Pass:', ('UNEXPECTEDPASS',)),
+    ('Skipped:', ('SKIP',)),
+    ('Timeout:', ('TIMEOUT',)),
+)
+
+_number_regex = re.compile(r'0x[0-9a-fA-F]+|\d+')
+_space_regex = re.compile(r'\s+')
+
+
+def read_testlog(path: str) -> List[Dict]:
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def write_testlog(path: str, tests: List[Dict]) -> None:
+    ci_files.save_text(path, ''.join(json.dumps(test) + '\n' for test in tests))
+
+
+def is_failed(test: Dict) -> bool:
+    return test['returncode'] not in TEST_OK_RETURNCODES
+
+
+def get_short_name(name: str) -> str:
+    """
+    Return the name meson test is called with, e.g.
+    'DPDK:fast-tests / acl_autotest' -> 'acl_autotest'.
+    """
+    return name.rsplit(' / ', 1)[-1]
+
+
+def get_signature(test: Dict) -> str:
+    if test['result'] == 'TIMEOUT':
+        return 'TIMEOUT'
+    text = test.get('stderr') or test.get('stdout') or ''
+    lines = []
+    for line in text.splitlines():
+        line = _number_regex.sub(lambda match: '0x?' if match.group(0).startswith('0x') else 'N', line)
+        line = _space_regex.sub(' ', line).strip()
+        if line:
+            lines.append(line)
+    # Where the test stopped tells the failure apart
+    return '\n'.join(lines[-SIGNATURE_LINES:])
+
+
+def get_fingerprint(test: Dict) -> str:
+    key = get_short_name(test['name']) + '\n' + get_signature(test)
+    return hashlib.sha1(key.encode('utf-8', errors='replace')).hexdigest()[:16]
+
+
+def load_history(path: str = HISTORY_FILE) -> Dict[str, Dict]:
+    return ci_files.load_json(path, {})
+
+
+def save_history(history: Dict[str, Dict], path: str = HISTORY_FILE) -> None:
+    ci_files.save_json(path, history)
+
+
+def record_failures(tests: List[Dict], series_id: str, previous: Optional[List[Dict]] = None,
+                    history_path: str = HISTORY_FILE) -> None:
+    """
+    Count the failures of a run. With the results of the previous run of
+    the same build, the failures which passed this time are counted as
+    passed on rerun, and the failures of the rerun are not counted twice.
+    """
+    history = load_history(history_path)
+    now = int(time.time())
+    counted = set()
+    if previous is not None:
+        results = {test['name']: test for test in tests}
+        for test in filter(is_failed, previous):
+            fingerprint = get_fingerprint(test)
+            counted.add(fingerprint)
+            rerun = results.get(test['name'])
+            if rerun is not None and not is_failed(rerun) and fingerprint in history:
+                history[fingerprint]['passed_on_rerun'] += 1
+
+    for test in filter(is_failed, tests):
+        fingerprint = get_fingerprint(test)
+        entry = history.setdefault(fingerprint, {
+            'name': get_short_name(test['name']),
+            'signature': get_signature(test),
+            'count': 0,
+            'passed_on_rerun': 0,
+            'series': [],
+            'first_seen': now,
+        })
+        if fingerprint not in counted:
+            entry['count'] += 1
+        entry['last_seen'] = now
+        if series_id not in entry['series']:
+            entry['series'] = (entry['series'] + [series_id])[-MAX_SERIES:]
+    save_history(history, history_path)
+
+
+def describe_flaky(test: Dict, history: Dict[str, Dict]) -> Optional[str]:
+    """
+    Return why a failure is known to be flaky, None if it is not.
+    """
+    entry = history.get(get_fingerprint(test))
+    if entry is None:
+        return None
+    if entry['passed_on_rerun'] == 0 and len(entry['series']) < FLAKY_SERIES:
+        return None
+    return 'Known flaky failure: seen %d times on %d series, passed %d times on rerun' % (
+        entry['count'], len(entry['series']), entry['passed_on_rerun'])
+
+
+def merge_results(previous: List[Dict], rerun: List[Dict]) -> List[Dict]:
+    """
+    Return the results of the previous run with the tests rerun replaced
+    by their new result, in the previous order.
+    """
+    results = {test['name']: test for test in rerun}
+    merged = [results.pop(test['name'], test) for test in previous]
+    return merged + list(results.values())
+
+
+def format_summary(tests: List[Dict]) -> str:
+    lines = ['Results of the failed tests rerun, merged with the previous run', '']
+    for title, results in SUMMARY:
+        count = len([test for test in tests if test['result'] in results])
+        lines.append('%-20s%d' % (title, count))
+    return '\n'.join(lines) + '\n'
+
+
+def keep_build(dpdk_dir: str, key: str) -> None:
+    """
+    Move the build directory away for a recheck of the same code, and
+    remove the oldest kept builds.
+    """
+    keep_dir = os.path.join(dpdk_dir, KEEP_DIR)
+    os.makedirs(keep_dir, exist_ok=True)
+    target = os.path.join(keep_dir, key)
+    if os.path.isdir(target):
+        shutil.rmtree(target)
+    os.rename(os.path.join(dpdk_dir, BUILD_DIR), target)
+    os.utime(target)
+
+    kept = sorted(os.listdir(keep_dir), key=lambda name: os.path.getmtime(os.path.join(keep_dir, name)))
+    for name in kept[:-KEEP_BUILDS] if KEEP_BUILDS > 0 else kept:
+        shutil.rmtree(os.path.join(keep_dir, name), ignore_errors=True)
+
+
+def restore_build(dpdk_dir: str, key: str) -> bool:
+    source = os.path.join(dpdk_dir, KEEP_DIR, key)
+    if not os.path.isdir(source):
+        return False
+    build_dir = os.path.join(dpdk_dir, BUILD_DIR)
+    if os.path.isdir(build_dir):
+        shutil.rmtree(build_dir)
+    os.rename(source, build_dir)
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Rerun the failed unit tests and fingerprint the failures')
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.required = True
+
+    for command, help_text in (('keep', 'keep the build directory for a recheck'),
+                               ('restore', 'restore the kept build of the series, fail if there is none')):
+        build_parser = subparsers.add_parser(command, help=help_text)
+        build_parser.add_argument('--dpdk-dir', required=True, help='The DPDK checkout')
+        build_parser.add_argument('--series-dir', required=True, help='The series directory')
+        build_parser.add_argument('--base', required=True, help='The base commit of the series')
+
+    failed_parser = subparsers.add_parser('failed', help='print the names of the failed tests')
+    failed_parser.add_argument('testlog', help='The testlog.json of the run')
+
+    merge_parser = subparsers.add_parser('merge', help='merge the results of the rerun into the previous ones')
+    merge_parser.add_argument('previous', help='The testlog.json of the previous run')
+    merge_parser.add_argument('rerun', help='The testlog.json of the rerun, replaced by the merged results')
+    merge_parser.add_argument('--txt', help='The testlog.txt to write the merged summary to')
+
+    record_parser = subparsers.add_parser('record', help='count the failures of a run')
+    record_parser.add_argument('testlog', help='The testlog.json of the run')
+    record_parser.add_argument('--series-id', required=True, help='The series tested')
+    record_parser.add_argument('--rerun-of', help='The testlog.json of the run this one reran')
+
+    args = parser.parse_args()
+
+    try:
+        if args.command in ('keep', 'restore'):
+            key = result_cache.get_series_key(args.series_dir, args.base)
+            if args.command == 'keep':
+                keep_build(args.dpdk_dir, key)
+            elif not restore_build(args.dpdk_dir, key):
+                print('no build kept for this series and base commit', file=sys.stderr)
+                sys.exit(1)
+        elif args.command == 'failed':
+            for test in filter(is_failed, read_testlog(args.testlog)):
+                print(get_short_name(test['name']))
+        elif args.command == 'merge':
+            merged = merge_results(read_testlog(args.previous), read_testlog(args.rerun))
+            write_testlog(args.rerun, merged)
+            if args.txt:
+                with open(args.txt, 'w') as f:
+                    f.write(format_summary(merged))
+        else:
+            previous = read_testlog(args.rerun_of) if args.rerun_of else None
+            record_failures(read_testlog(args.testlog), args.series_id, previous)
+    except (OSError, ValueError, KeyError) as e:
+        print('%s: %s' % (args.command, e), file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    ci_profile.start()
+    main()
@@ -5,23 +5,29 @@
 
 print_usage () {
 	cat <<- END_OF_HELP
-	usage: $(basename $0) <report_url>
+	usage: $(basename $0) [-b] <report_url>
 
 	Add or update a check in patchwork based on a test report.
 	The argument specifies only the last URL parts of the test-report
 	mailing list archives (month/id.html).
+
+	options:
+	        -b    print a record for 'pwclient batch' instead of adding the check
 	END_OF_HELP
 }
 
 . $(dirname $(readlink -e $0))/load-ci-config.sh
 pwclient=${DPDK_CI_PWCLIENT:-$(dirname $(readlink -m $0))/pwclient}
 
-while getopts h arg ; do
+batch=false
+while getopts bh arg ; do
 	case $arg in
+		b ) batch=true ;;
 		h ) print_usage ; exit 0 ;;
 		? ) print_usage >&2 ; exit 1 ;;
 	esac
 done
+shift $(($OPTIND - 1))
 if [ -z "$1" ] ; then
 	printf 'missing argument\n\n' >&2
 	print_usage >&2
@@ -51,7 +57,11 @@ case $status in
 	'FAILURE') pwstatus='fail' ;;
 esac
 printf 'id = %s\nlabel = %s\nstatus = %s/%s %s\nurl = %s\n' \
-	"$pwid" "$label" "$status" "$pwstatus" "$desc" "$url"
+	"$pwid" "$label" "$status" "$pwstatus" "$desc" "$url" >&$($batch && echo 2 || echo 1)
 [ -n "$pwid" -a -n "$label" -a -n "$status" -a -n "$desc" ] || exit 3
 
+if $batch ; then
+	printf '%s\t%s\t%s\t%s\t%s\n' "$pwid" "$label" "$pwstatus" "$url" "$desc"
+	exit 0
+fi
 $pwclient check-create -c "$label" -s "$pwstatus" -d "$desc" -u "$url" $pwid